@@ -0,0 +1,74 @@
+"""Admission control for the job creating endpoints
+
+Jobs are admitted as long as fewer jobs of their type are queued than configured in
+ADMISSION_LIMITS. Pending and running jobs are counted by the status of their models, so the counts
+hold across all web and worker processes. Jobs created longer than stale_after seconds ago are not
+counted, so jobs lost by the broker or a worker do not block admission forever.
+"""
+import math
+from datetime import timedelta
+from django.utils import timezone
+from .models import Core, Ensemble, Growing, SearchPointData, Status
+from .settings import ADMISSION_LIMITS
+
+JOB_QUERIES = {
+    'preprocess_ensemble': Ensemble.objects.all,
+    'clip_ligand': Core.objects.all,
+    # speculative generations yield to requested ones and do not hold up users
+    'generate_interactions': lambda: SearchPointData.objects.filter(speculative=False),
+    'grow': Growing.objects.all,
+}
+
+
+def job_counts(task_name):
+    """Count queued and running jobs of a task that are not stale
+
+    :param task_name: name of the task
+    :type task_name: str
+    :return: number of queued and running jobs
+    :rtype: dict
+    """
+    jobs = JOB_QUERIES[task_name]()
+    stale_after = ADMISSION_LIMITS.get(task_name, {}).get('stale_after')
+    if stale_after:
+        jobs = jobs.filter(created__gte=timezone.now() - timedelta(seconds=stale_after))
+    return {
+        'queued': jobs.filter(status=Status.PENDING).count(),
+        'running': jobs.filter(status=Status.RUNNING).count()
+    }
+
+
+def admit(task_name, nof_jobs=1):
+    """Decide whether new jobs of a task are admitted
+
+    :param task_name: name of the task
+    :type task_name: str
+    :param nof_jobs: number of jobs to be created
+    :type nof_jobs: int
+    :return: None if admitted, otherwise seconds after which to retry
+    :rtype: int
+    """
+    limits = ADMISSION_LIMITS[task_name]
+    counts = job_counts(task_name)
+    excess = counts['queued'] + nof_jobs - limits['max_queued']
+    if excess <= 0:
+        return None
+    # the running jobs drain the queue, the excess has to wait for that many rounds of them
+    return limits['runtime'] * math.ceil(excess / max(counts['running'], 1))
+
+
+def metrics():
+    """Collect admission limits and job counts of all tasks
+
+    :return: limits, counts and whether jobs are admitted per task
+    :rtype: dict
+    """
+    task_metrics = {}
+    for task_name, limits in ADMISSION_LIMITS.items():
+        counts = job_counts(task_name)
+        task_metrics[task_name] = {
+            **counts,
+            'max_queued': limits['max_queued'],
+            'admitting': counts['queued'] < limits['max_queued']
+        }
+    return task_metrics
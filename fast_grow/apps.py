@@ -6,3 +6,8 @@ class FastGrowConfig(AppConfig):
     """fast_grow app config"""
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'fast_grow'
+
+    def ready(self):
+        """Connect the celery signal handlers of the profilers and tracing"""
+        # pylint: disable=import-outside-toplevel,unused-import
+        from . import profiler, query_profiling, tracing
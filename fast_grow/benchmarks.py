@@ -0,0 +1,379 @@
+"""Micro-benchmarks of the hot paths of the server
+
+Each benchmark case times an operation on synthetic data for a number of rounds after warming up
+and counts the database queries of a round. The synthetic data is created in a transaction that is
+rolled back afterwards, so the benchmarks leave nothing behind in the database they run against.
+Results are JSON friendly, runs of different releases are compared by the median of each case.
+"""
+import os
+import platform
+import statistics
+import time
+from contextlib import ExitStack
+from functools import partial
+from tempfile import TemporaryDirectory
+import django
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+from . import query_profiling, views
+from .models import Complex, Core, Ensemble, FragmentSet, Growing, Hit, Ligand, Status
+from .tool_wrappers.fast_grow_wrapper import FastGrowWrapper
+
+# atoms of synthetic ligands and hits, about the size of drug-like molecules with hydrogens
+NOF_ATOMS = 40
+# residues of synthetic complexes, four atoms each
+NOF_RESIDUES = 300
+ELEMENTS = ['C', 'N', 'O']
+
+
+def mol_string(name, properties=None):
+    """Create a synthetic SDF entry of a chain of atoms
+
+    :param name: name of the molecule
+    :type name: str
+    :param properties: SDF properties of the molecule
+    :type properties: dict
+    :return: SDF entry ending with $$$$
+    :rtype: str
+    """
+    lines = [name, '  fast_grow benchmark', '',
+             f'{NOF_ATOMS:>3}{NOF_ATOMS - 1:>3}  0  0  0  0            999 V2000']
+    for atom in range(NOF_ATOMS):
+        element = ELEMENTS[atom % len(ELEMENTS)]
+        lines.append(f'{atom * 1.5:>10.4f}{atom % 2 * 0.8:>10.4f}{0:>10.4f} {element:<3}'
+                     + '  0' * 12)
+    for atom in range(1, NOF_ATOMS):
+        lines.append(f'{atom:>3}{atom + 1:>3}  1  0  0  0  0')
+    lines.append('M  END')
+    for prop, value in (properties or {}).items():
+        lines.extend([f'> <{prop}>', str(value), ''])
+    return '\n'.join(lines) + '\n$$$$\n'
+
+
+def pdb_string(nof_residues=NOF_RESIDUES):
+    """Create a synthetic PDB file of an alanine chain
+
+    :param nof_residues: number of residues
+    :type nof_residues: int
+    :return: contents of the PDB file
+    :rtype: str
+    """
+    lines = []
+    for residue in range(nof_residues):
+        for offset, (atom_name, element) in enumerate([('N', 'N'), ('CA', 'C'), ('C', 'C'),
+                                                        ('O', 'O')]):
+            serial = residue * 4 + offset + 1
+            lines.append(f'ATOM  {serial:>5} {atom_name:<4} ALA A{residue + 1:>4}    '
+                         f'{serial * 0.4:>8.3f}{offset * 1.2:>8.3f}{0:>8.3f}  1.00  0.00'
+                         f'          {element:>2}')
+    return '\n'.join(lines + ['END']) + '\n'
+
+
+def hit_strings(nof_hits, complex_names):
+    """Create the SDF entries of synthetic hits like fast grow writes them
+
+    :param nof_hits: number of hits
+    :type nof_hits: int
+    :param complex_names: names of the complexes to add ensemble scores of
+    :type complex_names: list
+    :return: SDF entries of the hits
+    :rtype: list
+    """
+    strings = []
+    for index in range(nof_hits):
+        properties = {'Score': -20.0 + index % 100 * 0.1}
+        properties.update({name.upper(): -20.0 + index % 7 for name in complex_names})
+        strings.append(mol_string(f'hit_{index}', properties))
+    return strings
+
+
+def synthetic_ensemble(nof_complexes):
+    """Create a preprocessed ensemble of synthetic complexes and a ligand
+
+    :param nof_complexes: number of complexes
+    :type nof_complexes: int
+    :return: the ensemble
+    :rtype: Ensemble
+    """
+    ensemble = Ensemble(status=Status.SUCCESS)
+    ensemble.save()
+    complex_string = pdb_string()
+    for index in range(nof_complexes):
+        Complex(ensemble=ensemble, name=f'complex{index}', file_type='pdb',
+                file_string=complex_string).save()
+    Ligand(ensemble=ensemble, name='ligand', file_type='sdf',
+           file_string=mol_string('ligand')).save()
+    return ensemble
+
+
+def synthetic_growing(nof_hits, nof_complexes=1):
+    """Create a successful growing with synthetic hits
+
+    The fragment set is not backed by an actual database.
+
+    :param nof_hits: number of hits
+    :type nof_hits: int
+    :param nof_complexes: number of complexes of the ensemble
+    :type nof_complexes: int
+    :return: the growing
+    :rtype: Growing
+    """
+    ensemble = synthetic_ensemble(nof_complexes)
+    core = Core(ligand=ensemble.ligand_set.first(), name='core', anchor=2, linker=1,
+                file_type='sdf', file_string=mol_string('core'), status=Status.SUCCESS)
+    core.save()
+    fragment_set = FragmentSet(name='benchmark fragment set')
+    fragment_set.save()
+    growing = Growing(ensemble=ensemble, core=core, fragment_set=fragment_set,
+                      status=Status.SUCCESS)
+    growing.save()
+    complex_names = FastGrowWrapper.complex_names(growing)
+    FastGrowWrapper.save_hits(growing, [
+        Hit(name=f'hit_{index}', score=FastGrowWrapper.get_mol_string_prop(
+            'Score', hit_string, cast_to=float), file_type='sdf', file_string=hit_string,
+            ensemble_scores={name: -20.0 for name in complex_names})
+        for index, hit_string in enumerate(hit_strings(nof_hits, complex_names))
+    ])
+    return growing
+
+
+def get_mol_string_prop(_stack, nof_hits, nof_complexes):
+    """Read the scores of hits like the hits files are parsed
+
+    :param _stack: exit stack of the benchmark run, unused
+    :type _stack: contextlib.ExitStack
+    :param nof_hits: number of hits
+    :type nof_hits: int
+    :param nof_complexes: number of complexes with an ensemble score
+    :type nof_complexes: int
+    :return: operation and reset after each round
+    :rtype: tuple
+    """
+    complex_names = [f'complex{index}' for index in range(nof_complexes)]
+    props = ['Score'] + [name.upper() for name in complex_names]
+    strings = hit_strings(nof_hits, complex_names)
+
+    def operation():
+        for string in strings:
+            for prop in props:
+                FastGrowWrapper.get_mol_string_prop(prop, string, cast_to=float)
+    return operation, None
+
+
+def add_hits(stack, nof_hits, nof_complexes):
+    """Add the hits of a hits file to a growing
+
+    :param stack: exit stack of the benchmark run
+    :type stack: contextlib.ExitStack
+    :param nof_hits: hits in the hits file
+    :type nof_hits: int
+    :param nof_complexes: number of complexes of the ensemble
+    :type nof_complexes: int
+    :return: operation and reset after each round
+    :rtype: tuple
+    """
+    growing = synthetic_growing(0, nof_complexes)
+    hits_path = os.path.join(stack.enter_context(TemporaryDirectory()), 'hits_0.sdf')
+    with open(hits_path, 'w', encoding='utf8') as hits_file:
+        hits_file.write(''.join(
+            hit_strings(nof_hits, FastGrowWrapper.complex_names(growing))))
+    return (lambda: FastGrowWrapper.add_hits(growing, hits_path),
+            lambda: growing.hit_set.all().delete())
+
+
+def growing_dict(_stack, nof_hits):
+    """Convert a growing with all its hits to a dict
+
+    :param _stack: exit stack of the benchmark run, unused
+    :type _stack: contextlib.ExitStack
+    :param nof_hits: hits of the growing
+    :type nof_hits: int
+    :return: operation and reset after each round
+    :rtype: tuple
+    """
+    growing = synthetic_growing(nof_hits)
+    return lambda: Growing.objects.get(id=growing.id).dict(nof_hits=nof_hits), None
+
+
+def write_zip_bytes(_stack, nof_hits, nof_complexes):
+    """Serialize a growing into ZIP bytes for its download
+
+    :param _stack: exit stack of the benchmark run, unused
+    :type _stack: contextlib.ExitStack
+    :param nof_hits: hits of the growing
+    :type nof_hits: int
+    :param nof_complexes: number of complexes of the ensemble
+    :type nof_complexes: int
+    :return: operation and reset after each round
+    :rtype: tuple
+    """
+    growing = synthetic_growing(nof_hits, nof_complexes)
+    return lambda: Growing.objects.get(id=growing.id).write_zip_bytes(), None
+
+
+def ensemble_write(stack, nof_complexes):
+    """Write the complexes of an ensemble to a directory
+
+    :param stack: exit stack of the benchmark run
+    :type stack: contextlib.ExitStack
+    :param nof_complexes: number of complexes of the ensemble
+    :type nof_complexes: int
+    :return: operation and reset after each round
+    :rtype: tuple
+    """
+    ensemble = synthetic_ensemble(nof_complexes)
+    directory = stack.enter_context(TemporaryDirectory())
+    return lambda: Ensemble.objects.get(id=ensemble.id).write(directory), None
+
+
+def detail_view(_stack, view, nof_hits=0, nof_complexes=1):
+    """Request the detail view of a synthetic growing or its ensemble or core
+
+    Views are called directly, without the middleware. Growing details include all hits.
+
+    :param _stack: exit stack of the benchmark run, unused
+    :type _stack: contextlib.ExitStack
+    :param view: name of the view function
+    :type view: str
+    :param nof_hits: hits of the growing
+    :type nof_hits: int
+    :param nof_complexes: number of complexes of the ensemble
+    :type nof_complexes: int
+    :return: operation and reset after each round
+    :rtype: tuple
+    """
+    growing = synthetic_growing(nof_hits, nof_complexes)
+    ids = {
+        'complex_detail': {'ensemble_id': growing.ensemble_id},
+        'core_detail': {'core_id': growing.core_id},
+        'growing_detail': {'growing_id': growing.id},
+        'growing_download': {'growing_id': growing.id}
+    }[view]
+    request = RequestFactory().get('/', {'nof_hits': nof_hits} if nof_hits else {})
+
+    def operation():
+        response = getattr(views, view)(request, **ids)
+        if response.status_code != 200:
+            raise RuntimeError(f'{view} responded with {response.status_code}')
+    return operation, None
+
+
+# name of each benchmark, the parameters of its cases and the factory of the operation of a case
+BENCHMARKS = [
+    ('get_mol_string_prop', [{'nof_hits': 1000, 'nof_complexes': 1},
+                             {'nof_hits': 1000, 'nof_complexes': 8}], get_mol_string_prop),
+    ('add_hits', [{'nof_hits': 100, 'nof_complexes': 1},
+                  {'nof_hits': 1000, 'nof_complexes': 1},
+                  {'nof_hits': 1000, 'nof_complexes': 8}], add_hits),
+    ('growing_dict', [{'nof_hits': 10}, {'nof_hits': 100}, {'nof_hits': 1000}], growing_dict),
+    ('write_zip_bytes', [{'nof_hits': 100, 'nof_complexes': 1},
+                         {'nof_hits': 1000, 'nof_complexes': 8}], write_zip_bytes),
+    ('ensemble_write', [{'nof_complexes': 1}, {'nof_complexes': 8}], ensemble_write),
+    ('complex_detail', [{'nof_complexes': 1}, {'nof_complexes': 8}],
+     partial(detail_view, view='complex_detail')),
+    ('core_detail', [{}], partial(detail_view, view='core_detail')),
+    ('growing_detail', [{'nof_hits': 100}, {'nof_hits': 1000}],
+     partial(detail_view, view='growing_detail')),
+    ('growing_download', [{'nof_hits': 100}, {'nof_hits': 1000}],
+     partial(detail_view, view='growing_download')),
+]
+
+
+def measure(operation, reset=None, rounds=10, warmup=1):
+    """Time the rounds of an operation
+
+    :param operation: operation to time
+    :type operation: callable
+    :param reset: called after each round, not timed
+    :type reset: callable
+    :param rounds: timed rounds
+    :type rounds: int
+    :param warmup: untimed rounds before the timed ones
+    :type warmup: int
+    :return: rounds, seconds of the rounds by min, median, mean and stdev and queries per round
+    :rtype: dict
+    """
+    timings = []
+    queries = 0
+    for round_number in range(warmup + rounds):
+        with query_profiling.profile() as query_profile:
+            started = time.perf_counter()
+            operation()
+            seconds = time.perf_counter() - started
+        if reset:
+            reset()
+        if round_number >= warmup:
+            timings.append(seconds)
+            queries = max(queries, query_profile.queries)
+    return {
+        'rounds': rounds,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'queries': queries
+    }
+
+
+def run(names=None, rounds=10, warmup=1, label=None):
+    """Run benchmarks in a transaction that is rolled back
+
+    :param names: names of the benchmarks to run, all if not passed
+    :type names: list
+    :param rounds: timed rounds of each case
+    :type rounds: int
+    :param warmup: untimed rounds before the timed ones
+    :type warmup: int
+    :param label: label of the run, e.g. the release
+    :type label: str
+    :return: environment of the run and a result per case with name, params and timings
+    :rtype: dict
+    """
+    results = []
+    with transaction.atomic(), ExitStack() as stack:
+        for name, cases, factory in BENCHMARKS:
+            if names and name not in names:
+                continue
+            for params in cases:
+                operation, reset = factory(stack, **params)
+                results.append({'name': name, 'params': params,
+                                **measure(operation, reset, rounds, warmup)})
+        transaction.set_rollback(True)
+    return {
+        'label': label,
+        'created': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'results': results
+    }
+
+
+def compare(baseline, current):
+    """Compare the medians of the cases of two runs
+
+    :param baseline: earlier run
+    :type baseline: dict
+    :param current: later run
+    :type current: dict
+    :return: name, params, baseline and current median and their ratio of the cases of both runs
+    :rtype: list
+    """
+    def key(result):
+        return result['name'], sorted(result['params'].items())
+
+    baseline_medians = {repr(key(result)): result['median'] for result in baseline['results']}
+    comparison = []
+    for result in current['results']:
+        baseline_median = baseline_medians.get(repr(key(result)))
+        if baseline_median is None:
+            continue
+        comparison.append({
+            'name': result['name'],
+            'params': result['params'],
+            'baseline': baseline_median,
+            'current': result['median'],
+            'ratio': result['median'] / baseline_median if baseline_median else None
+        })
+    return comparison
@@ -0,0 +1,14 @@
+"""Connection to the redis instance celery uses as broker"""
+import functools
+import redis
+from fast_grow_server.settings import CELERY_BROKER_URL
+
+
+@functools.lru_cache(maxsize=None)
+def connection():
+    """Get a redis connection to the celery broker shared within the process
+
+    :return: redis connection
+    :rtype: redis.Redis
+    """
+    return redis.Redis.from_url(CELERY_BROKER_URL, decode_responses=True)
@@ -0,0 +1,106 @@
+"""Run-time estimates of growings
+
+Before a growing starts, its run time is estimated from the size of its fragment set and the
+throughput recorded for the fragment set and ensemble size. While it runs, the recorded throughput
+is blended with the throughput observed so far, weighted by the progress of the growing, so the
+estimate converges on the observed throughput.
+"""
+from django.utils import timezone
+from .models import ChunkStatistics, FragmentSet, Growing, Status
+
+
+def recorded_throughput(fragment_set, ensemble_size):
+    """Estimate the fragments per second fast grow processes from one fragment database
+
+    The throughput of other ensemble sizes is scaled to the ensemble size if the ensemble size was
+    not recorded yet, every fragment is scored against every complex of an ensemble.
+
+    :param fragment_set: fragment set to grow from
+    :type fragment_set: fast_grow.models.FragmentSet
+    :param ensemble_size: number of complexes in the ensemble
+    :type ensemble_size: int
+    :return: fragments per second or None without recorded throughput
+    :rtype: float
+    """
+    statistics = list(ChunkStatistics.objects.filter(fragment_set=fragment_set, samples__gt=0))
+    if not statistics:
+        return None
+    nearest_size = min({chunk_statistics.ensemble_size for chunk_statistics in statistics},
+                       key=lambda size: abs(size - ensemble_size))
+    nearest = [chunk_statistics for chunk_statistics in statistics
+               if chunk_statistics.ensemble_size == nearest_size]
+    fragments_per_second = sum(
+        chunk_statistics.fragments_per_second * chunk_statistics.samples
+        for chunk_statistics in nearest
+    ) / sum(chunk_statistics.samples for chunk_statistics in nearest)
+    return fragments_per_second * max(nearest_size, 1) / max(ensemble_size, 1)
+
+
+def expected_seconds(growing):
+    """Estimate the run time of a growing that did not start yet
+
+    Shards of a growing run in parallel.
+
+    :param growing: growing to estimate
+    :type growing: fast_grow.models.Growing
+    :return: seconds or None if the fragment set size or throughput is unknown
+    :rtype: float
+    """
+    fragment_set = growing.fragment_set
+    throughput = recorded_throughput(fragment_set, growing.ensemble.complex_set.count())
+    if not fragment_set.size or not throughput:
+        return None
+    seconds = fragment_set.size / (throughput * max(fragment_set.partitions, 1))
+    if growing.time_budget is not None:
+        seconds = min(seconds, growing.time_budget)
+    return seconds
+
+
+def estimate(growing):
+    """Estimate the progress and remaining run time of a pending or running growing
+
+    :param growing: growing to estimate
+    :type growing: fast_grow.models.Growing
+    :return: 'progress' between 0 and 1 and remaining 'seconds', both None if unknown
+    :rtype: dict
+    """
+    fragment_set = growing.fragment_set
+    if growing.status == Status.PENDING or growing.started is None:
+        return {'progress': 0 if fragment_set.size else None,
+                'seconds': expected_seconds(growing)}
+    if growing.status != Status.RUNNING:
+        return {'progress': 1, 'seconds': 0}
+    if not fragment_set.size:
+        return {'progress': None, 'seconds': None}
+
+    elapsed = max((timezone.now() - growing.started).total_seconds(), 0)
+    progress = min(growing.fragments_processed / fragment_set.size, 1)
+    throughput = recorded_throughput(fragment_set, growing.ensemble.complex_set.count())
+    if throughput:
+        throughput *= max(fragment_set.partitions, 1)
+    if growing.fragments_processed and elapsed:
+        observed = growing.fragments_processed / elapsed
+        throughput = progress * observed + (1 - progress) * throughput if throughput else observed
+    if not throughput:
+        return {'progress': progress, 'seconds': None}
+    seconds = max(fragment_set.size - growing.fragments_processed, 0) / throughput
+    if growing.time_budget is not None:
+        seconds = min(seconds, max(growing.time_budget - elapsed, 0))
+    return {'progress': progress, 'seconds': seconds}
+
+
+def record_fragment_set_size(growing_id):
+    """Learn the size of a fragment set from a growing that processed all of its fragments
+
+    Sizes specified when adding the fragment set are kept. The last chunk of a fragment database
+    is counted as full, the learned size is rounded up to the chunk size.
+
+    :param growing_id: id of a successful growing
+    :type growing_id: int
+    """
+    growing = Growing.objects.select_related('fragment_set').get(id=growing_id)
+    if growing.status != Status.SUCCESS or growing.stop_reason or growing.cached_from_id \
+            or not growing.fragments_processed or growing.fragment_set.size:
+        return
+    FragmentSet.objects.filter(id=growing.fragment_set_id, size__isnull=True).update(
+        size=growing.fragments_processed)
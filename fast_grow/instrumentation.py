@@ -0,0 +1,245 @@
+"""Lightweight timing instrumentation of jobs exposed in the prometheus text format
+
+Timers and counters aggregate in process and are flushed to redis after every job and at most every
+METRICS_FLUSH_INTERVAL seconds in between, so the web and worker processes of all hosts report into
+the same metrics. Worker processes run one job at a time, observations are labeled with the task of
+the current job.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import redis
+from celery.signals import before_task_publish, task_prerun, task_postrun
+from .admission import metrics as admission_metrics
+from .broker import connection
+from .settings import METRICS_FLUSH_INTERVAL
+from .tracing import span
+
+KEY = 'fast_grow:metrics'
+STAGE_BUCKETS = [0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800, 3600]
+METRICS = {
+    'fast_grow_stage_seconds': ('histogram', 'Seconds spent in a stage of a job'),
+    'fast_grow_jobs_total': ('counter', 'Finished jobs by state'),
+    'fast_grow_workspace_total': ('counter', 'Workspace cache lookups by result'),
+    'fast_grow_jobs_queued': ('gauge', 'Pending jobs'),
+    'fast_grow_jobs_running': ('gauge', 'Running jobs'),
+    'fast_grow_jobs_max_queued': ('gauge', 'Pending jobs admitted at most'),
+}
+SAMPLE = re.compile(r'^(\w+)\{(.*)\}$')
+LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+_LOCK = threading.Lock()
+_PENDING = defaultdict(float)
+_STATE = {'flushed': time.monotonic(), 'task': None, 'started': None}
+
+
+def sample_name(metric, labels):
+    """Format the name of a sample
+
+    :param metric: name of the metric
+    :type metric: str
+    :param labels: labels of the sample
+    :type labels: dict
+    :return: sample name in the prometheus text format
+    :rtype: str
+    """
+    return metric + '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+
+def current_task():
+    """Get the name of the task of the current job
+
+    :return: task name or 'none' outside of jobs
+    :rtype: str
+    """
+    return _STATE['task'] or 'none'
+
+
+def increment(metric, labels, value=1):
+    """Increment a counter
+
+    :param metric: name of the counter
+    :type metric: str
+    :param labels: labels of the sample
+    :type labels: dict
+    :param value: increment
+    :type value: float
+    """
+    with _LOCK:
+        _PENDING[sample_name(metric, labels)] += value
+    flush(force=False)
+
+
+def observe(stage, seconds, task=None):
+    """Observe the duration of a stage
+
+    :param stage: name of the stage
+    :type stage: str
+    :param seconds: duration of the stage
+    :type seconds: float
+    :param task: task name, by default the task of the current job
+    :type task: str
+    """
+    labels = {'task': task or current_task(), 'stage': stage}
+    index = bisect.bisect_left(STAGE_BUCKETS, seconds)
+    bucket = STAGE_BUCKETS[index] if index < len(STAGE_BUCKETS) else '+Inf'
+    with _LOCK:
+        # only the smallest bucket holding the observation is counted, render accumulates them
+        _PENDING[sample_name('fast_grow_stage_seconds_bucket', {**labels, 'le': bucket})] += 1
+        _PENDING[sample_name('fast_grow_stage_seconds_count', labels)] += 1
+        _PENDING[sample_name('fast_grow_stage_seconds_sum', labels)] += seconds
+    flush(force=False)
+
+
+@contextmanager
+def timer(stage, task=None):
+    """Observe the duration of the context as a stage, which is traced as a span
+
+    :param stage: name of the stage
+    :type stage: str
+    :param task: task name, by default the task of the current job
+    :type task: str
+    """
+    started = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    finally:
+        observe(stage, time.perf_counter() - started, task)
+
+
+def flush(force=True):
+    """Add the observations of this process to the metrics in redis
+
+    Metrics must never fail a job, observations that cannot be flushed are dropped.
+
+    :param force: flush even if the last flush was less than METRICS_FLUSH_INTERVAL seconds ago
+    :type force: bool
+    """
+    if not force and time.monotonic() - _STATE['flushed'] < METRICS_FLUSH_INTERVAL:
+        return
+    with _LOCK:
+        pending = dict(_PENDING)
+        _PENDING.clear()
+        _STATE['flushed'] = time.monotonic()
+    if not pending:
+        return
+    try:
+        pipeline = connection().pipeline(transaction=False)
+        for sample, value in pending.items():
+            pipeline.hincrbyfloat(KEY, sample, value)
+        pipeline.execute()
+    except redis.RedisError as error:
+        logging.warning('dropping %d metric samples: %s', len(pending), error)
+
+
+def render():
+    """Render the metrics of all processes and the admission gauges in the prometheus text format
+
+    :return: metrics exposition
+    :rtype: str
+    """
+    families = defaultdict(list)
+    for sample, value in connection().hgetall(KEY).items():
+        match = SAMPLE.match(sample)
+        if not match:
+            continue
+        name, labels = match.group(1), dict(LABEL.findall(match.group(2)))
+        family = re.sub(r'_(bucket|count|sum)$', '', name) if name not in METRICS else name
+        families[family].append((name, labels, float(value)))
+    families['fast_grow_stage_seconds'].extend(missing_buckets(families['fast_grow_stage_seconds']))
+    for task_name, task_metrics in admission_metrics().items():
+        for gauge in ['queued', 'running', 'max_queued']:
+            families[f'fast_grow_jobs_{gauge}'].append(
+                (f'fast_grow_jobs_{gauge}', {'task': task_name}, task_metrics[gauge]))
+
+    lines = []
+    for family in sorted(families):
+        metric_type, description = METRICS.get(family, ('untyped', family))
+        lines.append(f'# HELP {family} {description}')
+        lines.append(f'# TYPE {family} {metric_type}')
+        cumulative = defaultdict(float)
+        for name, labels, value in sorted(families[family], key=sample_order):
+            if 'le' in labels:
+                series = series_labels(labels)
+                cumulative[series] += value
+                value = cumulative[series]
+            value = int(value) if float(value).is_integer() else value
+            lines.append(f'{sample_name(name, labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def missing_buckets(samples):
+    """Create empty buckets for the bounds a histogram series has no observations in
+
+    :param samples: name, labels and value of the samples of a histogram
+    :type samples: list
+    :return: empty bucket samples
+    :rtype: list
+    """
+    bounds = defaultdict(set)
+    for _, labels, _ in samples:
+        if 'le' in labels:
+            bounds[series_labels(labels)].add(float(labels['le']))
+    return [
+        ('fast_grow_stage_seconds_bucket', {**dict(series), 'le': bucket}, 0.0)
+        for series, observed in bounds.items()
+        for bucket in STAGE_BUCKETS + ['+Inf'] if float(bucket) not in observed
+    ]
+
+
+def series_labels(labels):
+    """Identify the series of a histogram bucket
+
+    :param labels: labels of the bucket
+    :type labels: dict
+    :return: labels other than the bucket bound
+    :rtype: tuple
+    """
+    return tuple((key, value) for key, value in labels.items() if key != 'le')
+
+
+def sample_order(sample):
+    """Order samples by their labels and histogram buckets by their bound
+
+    :param sample: name, labels and value of a sample
+    :type sample: tuple
+    :return: sort key
+    :rtype: tuple
+    """
+    name, labels, _ = sample
+    other_labels = sorted((key, value) for key, value in labels.items() if key != 'le')
+    bound = float(labels.get('le', 'inf'))
+    return other_labels, name, bound
+
+
+@before_task_publish.connect
+def stamp_published(headers=None, **_):
+    """Record when a job was published to measure its queue wait"""
+    if headers is not None:
+        headers['published_at'] = time.time()
+
+
+@task_prerun.connect
+def start_job(task=None, **_):
+    """Label observations with the task of the job and observe its queue wait"""
+    _STATE['task'] = task.name.rsplit('.', 1)[-1]
+    _STATE['started'] = time.perf_counter()
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at:
+        observe('queue_wait', max(time.time() - published_at, 0))
+
+
+@task_postrun.connect
+def finish_job(state=None, **_):
+    """Observe the total duration and state of a job and flush the observations"""
+    if _STATE['started'] is not None:
+        observe('total', time.perf_counter() - _STATE['started'])
+    increment('fast_grow_jobs_total', {'task': current_task(), 'state': state or 'UNKNOWN'})
+    _STATE['task'] = None
+    _STATE['started'] = None
+    flush()
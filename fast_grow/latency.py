@@ -0,0 +1,81 @@
+"""Queue and run latency percentiles of finished jobs
+
+Jobs record when they were created, started and finished. Queue latency is the time from creation
+until a worker started the job, run latency the time from start until the job finished. Run
+latencies only count successful jobs, failed and cancelled jobs end early. Growings served from the
+result cache never start and are not counted.
+"""
+import math
+from collections import defaultdict
+from django.db.models import Count
+from .models import Core, Ensemble, Growing, SearchPointData, Status
+
+PERCENTILES = [50, 95, 99]
+# model of the jobs of a task, lookup of the complexes of their ensemble and of their fragment set
+JOBS = {
+    'preprocess_ensemble': (Ensemble, 'complex', None),
+    'clip_ligand': (Core, 'ligand__ensemble__complex', None),
+    'generate_interactions': (SearchPointData, 'complex__ensemble__complex', None),
+    'grow': (Growing, 'ensemble__complex', 'fragment_set__name'),
+}
+
+
+def percentile(values, rank):
+    """Compute a percentile of values by the nearest rank
+
+    :param values: sorted values
+    :type values: list
+    :param rank: percentile rank between 0 and 100
+    :type rank: float
+    :return: percentile or None if there are no values
+    :rtype: float
+    """
+    if not values:
+        return None
+    return values[max(math.ceil(rank / 100 * len(values)), 1) - 1]
+
+
+def summarize(seconds):
+    """Summarize latencies by their percentiles
+
+    :param seconds: latencies in seconds
+    :type seconds: list
+    :return: PERCENTILES keyed by 'p50' etc.
+    :rtype: dict
+    """
+    seconds = sorted(seconds)
+    return {f'p{rank}': percentile(seconds, rank) for rank in PERCENTILES}
+
+
+def report(since=None):
+    """Report latency percentiles per task, fragment set and ensemble size
+
+    :param since: only count jobs created at or after this time
+    :type since: datetime.datetime
+    :return: one dict per group with task, fragment_set, ensemble_size, jobs, queue and run
+    :rtype: list
+    """
+    groups = defaultdict(lambda: {'queue': [], 'run': []})
+    for task_name, (model, complexes, fragment_set) in JOBS.items():
+        jobs = model.objects.filter(started__isnull=False, created__isnull=False)
+        if since:
+            jobs = jobs.filter(created__gte=since)
+        jobs = jobs.annotate(ensemble_size=Count(complexes, distinct=True))
+        fields = ['created', 'started', 'finished', 'status', 'ensemble_size']
+        if fragment_set:
+            fields.append(fragment_set)
+        for job in jobs.values(*fields):
+            group = groups[task_name, job.get(fragment_set), job['ensemble_size']]
+            group['queue'].append((job['started'] - job['created']).total_seconds())
+            if job['status'] == Status.SUCCESS and job['finished']:
+                group['run'].append((job['finished'] - job['started']).total_seconds())
+
+    return [{
+        'task': task_name,
+        'fragment_set': fragment_set,
+        'ensemble_size': ensemble_size,
+        'jobs': len(latencies['queue']),
+        'queue': summarize(latencies['queue']),
+        'run': summarize(latencies['run'])
+    } for (task_name, fragment_set, ensemble_size), latencies in sorted(
+        groups.items(), key=lambda item: (item[0][0], item[0][1] or '', item[0][2]))]
@@ -5,12 +5,34 @@ from fast_grow.models import FragmentSet
 
 class Command(BaseCommand):
     """add_fragment_set command"""
-    help = 'Add a fragment set'
+    help = 'Add a fragment set, adding an existing fragment set marks its databases as rebuilt'
 
     def add_arguments(self, parser):
         parser.add_argument('fragment_set', type=str)
+        parser.add_argument(
+            '--partitions',
+            type=int,
+            default=1,
+            help='number of partition databases named "<fragment_set>_<index>" the fragment set '
+                 'was built into, partitions are grown in parallel'
+        )
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=None,
+            help='number of fragments in all databases of the fragment set, learned from the '
+                 'first complete growing if not specified'
+        )
 
     def handle(self, *args, **options):
         fragment_set_name = options['fragment_set']
-        fragment_set = FragmentSet(name=fragment_set_name)
+        fragment_set = FragmentSet.objects.filter(name=fragment_set_name).first()
+        if fragment_set:
+            # snapshots and cached growings of the previous databases are outdated
+            fragment_set.version += 1
+            fragment_set.partitions = options['partitions']
+            fragment_set.size = options['size']
+        else:
+            fragment_set = FragmentSet(name=fragment_set_name, partitions=options['partitions'],
+                                       size=options['size'])
         fragment_set.save()
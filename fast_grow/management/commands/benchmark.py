@@ -0,0 +1,83 @@
+"""benchmark command"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from fast_grow.benchmarks import BENCHMARKS, compare, run
+
+
+class Command(BaseCommand):
+    """benchmark command"""
+    help = 'Time the hot paths of the server on synthetic data and write the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmarks', nargs='*', help='benchmarks to run, all if omitted: '
+                            + ', '.join(name for name, _, _ in BENCHMARKS))
+        parser.add_argument('--output', default='benchmarks.json',
+                            help='JSON file to write the results to')
+        parser.add_argument('--rounds', type=int, default=10, help='timed rounds of each case')
+        parser.add_argument('--warmup', type=int, default=1,
+                            help='untimed rounds before the timed ones')
+        parser.add_argument('--label', help='label of the run, e.g. the release')
+        parser.add_argument('--compare', help='JSON file of an earlier run to compare to')
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help='median ratio to the earlier run that fails as a regression')
+
+    def handle(self, *args, **options):
+        if options['rounds'] < 1:
+            raise CommandError('--rounds must be positive')
+        unknown = set(options['benchmarks']) - {name for name, _, _ in BENCHMARKS}
+        if unknown:
+            raise CommandError(f'unknown benchmarks {", ".join(sorted(unknown))}')
+        results = run(options['benchmarks'], options['rounds'], options['warmup'],
+                      options['label'])
+        with open(options['output'], 'w', encoding='utf8') as output_file:
+            json.dump(results, output_file, indent=2)
+
+        self.stdout.write(f'{"benchmark":<20} {"params":<40} {"median":>10} {"stdev":>10} '
+                          f'{"queries":>7}')
+        for result in results['results']:
+            self.stdout.write(
+                f'{result["name"]:<20} {self.params(result):<40} '
+                f'{result["median"] * 1000:>8.2f}ms {result["stdev"] * 1000:>8.2f}ms '
+                f'{result["queries"]:>7}')
+        self.stdout.write(f'results written to {options["output"]}')
+        if options['compare']:
+            self.compare(options['compare'], results, options['threshold'])
+
+    def compare(self, path, results, threshold):
+        """Compare the results to an earlier run
+
+        :param path: JSON file of the earlier run
+        :type path: str
+        :param results: results of this run
+        :type results: dict
+        :param threshold: median ratio above which a case regressed
+        :type threshold: float
+        :raises CommandError: if a case regressed
+        """
+        with open(path, encoding='utf8') as baseline_file:
+            baseline = json.load(baseline_file)
+        self.stdout.write(f'{"benchmark":<20} {"params":<40} {"baseline":>10} {"median":>10} '
+                          f'{"ratio":>6}')
+        regressions = []
+        for case in compare(baseline, results):
+            ratio = case['ratio']
+            if ratio is not None and ratio > threshold:
+                regressions.append(case)
+            self.stdout.write(
+                f'{case["name"]:<20} {self.params(case):<40} '
+                f'{case["baseline"] * 1000:>8.2f}ms {case["current"] * 1000:>8.2f}ms '
+                + ('     -' if ratio is None else f'{ratio:>6.2f}'))
+        if regressions:
+            raise CommandError(f'{len(regressions)} cases regressed by more than {threshold}x '
+                               f'of {baseline.get("label") or path}')
+
+    @staticmethod
+    def params(case):
+        """Format the parameters of a case
+
+        :param case: result or comparison of a case
+        :type case: dict
+        :return: comma separated parameters
+        :rtype: str
+        """
+        return ', '.join(f'{name}={value}' for name, value in case['params'].items())
@@ -0,0 +1,75 @@
+"""benchmark_chunk_size command"""
+from django.core.management.base import BaseCommand, CommandError
+from fast_grow.models import Growing, Status
+from fast_grow.settings import CHUNK_SIZE
+from fast_grow.tool_wrappers.fast_grow_wrapper import FastGrowWrapper
+
+
+class Command(BaseCommand):
+    """benchmark_chunk_size command"""
+    help = 'Compare the throughput of the adaptive chunk size to a fixed chunk size by repeating ' \
+           'a growing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('growing', type=int, help='id of the growing to repeat')
+        parser.add_argument('--runs', type=int, default=3, help='growings per chunk sizing')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='fixed chunk size to compare to')
+
+    def handle(self, *args, **options):
+        try:
+            template = Growing.objects.get(id=options['growing'])
+        except Growing.DoesNotExist as error:
+            raise CommandError(f'growing {options["growing"]} does not exist') from error
+
+        results = {'fixed': [], 'adaptive': []}
+        # alternating the sizings spreads changes of the database load over both
+        for run in range(options['runs']):
+            for sizing, chunk_size in [('fixed', options['chunk_size']), ('adaptive', None)]:
+                measurements = self.repeat(template, chunk_size)
+                results[sizing].append(measurements)
+                self.stdout.write(
+                    f'run {run + 1} {sizing}: chunk size {measurements["chunk_size"]}, '
+                    f'{measurements["seconds"]:.1f}s, {measurements["nof_hits"]} hits')
+
+        self.stdout.write('sizing    seconds  fragments/s  hits/chunk  lag (s)')
+        for sizing, runs in results.items():
+            seconds = sum(run['seconds'] for run in runs) / len(runs)
+            fragments = sum(run['nof_chunks'] * run['chunk_size'] for run in runs)
+            chunks = sum(run['nof_chunks'] for run in runs) or 1
+            hits = sum(run['nof_hits'] for run in runs)
+            lags = [lag for run in runs for lag in run['lags']] or [0]
+            self.stdout.write(
+                f'{sizing:<9} {seconds:>7.1f}  {fragments / (seconds * len(runs)):>11.1f}  '
+                f'{hits / chunks:>10.2f}  {sum(lags) / len(lags):>7.2f}')
+
+    @staticmethod
+    def repeat(template, chunk_size):
+        """Grow a copy of a growing from all databases of its fragment set
+
+        :param template: growing to repeat
+        :type template: Growing
+        :param chunk_size: fixed chunk size or None for the adaptive chunk size
+        :type chunk_size: int
+        :return: throughput measurements summed over the databases
+        :rtype: dict
+        """
+        growing = Growing(
+            ensemble=template.ensemble,
+            core=template.core,
+            fragment_set=template.fragment_set,
+            search_points=template.search_points,
+            status=Status.RUNNING
+        )
+        growing.save()
+        try:
+            total = {'chunk_size': chunk_size, 'seconds': 0, 'nof_chunks': 0, 'nof_hits': 0,
+                     'lags': []}
+            for database_name in growing.fragment_set.database_names():
+                measurements = FastGrowWrapper.grow(growing, database_name, chunk_size)
+                total['chunk_size'] = measurements['chunk_size']
+                for key in ['seconds', 'nof_chunks', 'nof_hits', 'lags']:
+                    total[key] += measurements[key]
+            return total
+        finally:
+            growing.delete()
@@ -0,0 +1,16 @@
+"""evict_growing_cache command"""
+from django.core.management.base import BaseCommand
+from fast_grow.models import Growing
+from fast_grow.settings import GROWING_CACHE_MAX_HITS
+
+
+class Command(BaseCommand):
+    """evict_growing_cache command"""
+    help = 'Evict least recently used growings from the result cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-hits', type=int, default=GROWING_CACHE_MAX_HITS)
+
+    def handle(self, *args, **options):
+        evicted = Growing.evict_cache(options['max_hits'])
+        self.stdout.write(f'evicted {evicted} growings from the cache')
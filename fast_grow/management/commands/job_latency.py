@@ -0,0 +1,28 @@
+"""job_latency command"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from fast_grow.latency import PERCENTILES, report
+
+
+class Command(BaseCommand):
+    """job_latency command"""
+    help = 'Report queue and run latency percentiles per task, fragment set and ensemble size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=None,
+                            help='only count jobs created within the last days')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days']) if options['days'] else None
+        columns = [f'{kind} p{rank}' for kind in ['queue', 'run'] for rank in PERCENTILES]
+        self.stdout.write(f'{"task":<22} {"fragment set":<16} {"complexes":>9} {"jobs":>6}  '
+                          + '  '.join(f'{column:>9}' for column in columns))
+        for group in report(since):
+            latencies = [group[kind][f'p{rank}']
+                         for kind in ['queue', 'run'] for rank in PERCENTILES]
+            self.stdout.write(
+                f'{group["task"]:<22} {group["fragment_set"] or "-":<16} '
+                f'{group["ensemble_size"]:>9} {group["jobs"]:>6}  '
+                + '  '.join('        -' if seconds is None else f'{seconds:>8.1f}s'
+                            for seconds in latencies))
@@ -0,0 +1,24 @@
+"""profile_job command"""
+from django.core.management.base import BaseCommand
+from fast_grow.broker import connection
+from fast_grow.profiler import KEY
+from fast_grow.settings import PROFILE_DIR
+
+
+class Command(BaseCommand):
+    """profile_job command"""
+    help = 'Profile jobs by celery task id or by task and job id, e.g. grow:42 or grow_shard:42, ' \
+        'jobs on several models by task, e.g. clip_ligands'
+
+    def add_arguments(self, parser):
+        parser.add_argument('jobs', nargs='*', help='jobs to profile, lists the jobs if omitted')
+        parser.add_argument('--stop', action='store_true', help='stop profiling the jobs')
+
+    def handle(self, *args, **options):
+        if options['jobs'] and options['stop']:
+            connection().srem(KEY, *options['jobs'])
+        elif options['jobs']:
+            connection().sadd(KEY, *options['jobs'])
+            self.stdout.write(f'profiles of the jobs are written to {PROFILE_DIR}')
+        for job in sorted(connection().smembers(KEY)):
+            self.stdout.write(job)
@@ -0,0 +1,30 @@
+"""snapshot_fragment_set command"""
+from django.core.management.base import BaseCommand, CommandError
+from fast_grow import snapshots
+from fast_grow.models import FragmentSet
+
+
+class Command(BaseCommand):
+    """snapshot_fragment_set command"""
+    help = 'Export the databases of a fragment set into worker-local sqlite snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fragment_set', type=str)
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='export the databases even if a current snapshot exists'
+        )
+
+    def handle(self, *args, **options):
+        fragment_set = FragmentSet.objects.filter(name=options['fragment_set']).first()
+        if fragment_set is None:
+            raise CommandError(f'fragment set "{options["fragment_set"]}" does not exist')
+        for database_name in fragment_set.database_names():
+            if not options['force'] and snapshots.verified_snapshot(fragment_set, database_name):
+                self.stdout.write(f'snapshot of {database_name} is current')
+                continue
+            manifest = snapshots.export(fragment_set, database_name)
+            nof_rows = sum(manifest['tables'].values())
+            self.stdout.write(f'exported {nof_rows} rows of {database_name} to '
+                              f'{snapshots.snapshot_path(database_name)}')
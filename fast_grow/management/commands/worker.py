@@ -0,0 +1,30 @@
+"""worker command"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from fast_grow_server.celery import app
+
+
+class Command(BaseCommand):
+    """worker command"""
+    help = 'Run a celery worker consuming a queue with the concurrency configured for it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'queue', type=str, choices=sorted(settings.CELERY_WORKER_QUEUE_CONCURRENCY))
+        parser.add_argument('--concurrency', type=int, default=None)
+        parser.add_argument('--loglevel', type=str, default='INFO')
+
+    def handle(self, *args, **options):
+        queue = options['queue']
+        concurrency = options['concurrency'] or settings.CELERY_WORKER_QUEUE_CONCURRENCY[queue]
+        if concurrency < 1:
+            raise CommandError('concurrency must be at least 1')
+        app.worker_main(argv=[
+            'worker',
+            '--queues', queue,
+            '--concurrency', str(concurrency),
+            '--hostname', f'{queue}@%h',
+            '--prefetch-multiplier', '1',
+            '--loglevel', options['loglevel'],
+            '-O', 'fair'
+        ])
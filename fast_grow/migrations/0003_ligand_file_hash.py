@@ -0,0 +1,25 @@
+import hashlib
+from django.db import migrations, models
+
+
+def hash_ligands(apps, schema_editor):
+    Ligand = apps.get_model('fast_grow', 'Ligand')
+    for ligand in Ligand.objects.filter(file_hash=None).iterator():
+        ligand.file_hash = hashlib.sha256(ligand.file_string.encode('utf8')).hexdigest()
+        ligand.save(update_fields=['file_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0002_fragmentset_description'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ligand',
+            name='file_hash',
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(hash_ligands, migrations.RunPython.noop),
+    ]
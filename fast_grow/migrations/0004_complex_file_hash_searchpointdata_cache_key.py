@@ -0,0 +1,30 @@
+import hashlib
+from django.db import migrations, models
+
+
+def hash_complexes(apps, schema_editor):
+    Complex = apps.get_model('fast_grow', 'Complex')
+    for cmplx in Complex.objects.filter(file_hash=None).exclude(file_string=None).iterator():
+        cmplx.file_hash = hashlib.sha256(cmplx.file_string.encode('utf8')).hexdigest()
+        cmplx.save(update_fields=['file_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0003_ligand_file_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complex',
+            name='file_hash',
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='searchpointdata',
+            name='cache_key',
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(hash_complexes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0004_complex_file_hash_searchpointdata_cache_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ensemble',
+            name='speculative',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='searchpointdata',
+            name='speculative',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='searchpointdata',
+            name='task_id',
+            field=models.CharField(max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0005_speculative_interactions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='growing',
+            name='fingerprint',
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='cached_from',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cache_copies', to='fast_grow.growing'),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='cache_accessed',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
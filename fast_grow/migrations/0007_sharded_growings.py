@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0006_growing_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fragmentset',
+            name='partitions',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='shards',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='shards_finished',
+            field=models.IntegerField(default=0),
+        ),
+    ]
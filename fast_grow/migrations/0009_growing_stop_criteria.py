@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0008_status_cancelled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='growing',
+            name='max_hits',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='score_threshold',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='score_threshold_hits',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='time_budget',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='stop_reason',
+            field=models.CharField(max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0009_growing_stop_criteria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fragmentset',
+            name='version',
+            field=models.IntegerField(default=1),
+        ),
+    ]
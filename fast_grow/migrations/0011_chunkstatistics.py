@@ -0,0 +1,28 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0010_fragmentset_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ensemble_size', models.IntegerField()),
+                ('chunk_size', models.IntegerField()),
+                ('samples', models.IntegerField(default=0)),
+                ('fragments_per_second', models.FloatField(default=0)),
+                ('hits_per_chunk', models.FloatField(default=0)),
+                ('ingestion_lag', models.FloatField(default=0)),
+                ('fragment_set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='fast_grow.fragmentset')),
+            ],
+            options={
+                'unique_together': {('fragment_set', 'ensemble_size', 'chunk_size')},
+            },
+        ),
+    ]
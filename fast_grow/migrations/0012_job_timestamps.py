@@ -0,0 +1,71 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0011_chunkstatistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='core',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='core',
+            name='finished',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='core',
+            name='started',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ensemble',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ensemble',
+            name='finished',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ensemble',
+            name='started',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='finished',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='started',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='searchpointdata',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='searchpointdata',
+            name='finished',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='searchpointdata',
+            name='started',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0012_job_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='core',
+            name='resource_usage',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ensemble',
+            name='resource_usage',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='resource_usage',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='searchpointdata',
+            name='resource_usage',
+            field=models.JSONField(null=True),
+        ),
+    ]
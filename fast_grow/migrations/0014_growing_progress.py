@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0013_resource_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fragmentset',
+            name='size',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='growing',
+            name='fragments_processed',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0014_growing_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='growing',
+            name='traceparent',
+            field=models.CharField(max_length=55, null=True),
+        ),
+    ]
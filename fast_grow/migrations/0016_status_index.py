@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+STATUS_CHOICES = [
+    ('p', 'pending'), ('r', 'running'), ('s', 'success'), ('f', 'failure'), ('c', 'cancelled')
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0015_growing_traceparent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='core',
+            name='status',
+            field=models.CharField(choices=STATUS_CHOICES, db_index=True, default='p', max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='ensemble',
+            name='status',
+            field=models.CharField(choices=STATUS_CHOICES, db_index=True, default='p', max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='growing',
+            name='status',
+            field=models.CharField(choices=STATUS_CHOICES, db_index=True, default='p', max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='searchpointdata',
+            name='status',
+            field=models.CharField(choices=STATUS_CHOICES, db_index=True, default='p', max_length=1),
+        ),
+    ]
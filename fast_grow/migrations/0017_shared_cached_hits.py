@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def delete_copied_hits(apps, schema_editor):
+    # growings taken from the cache share the hits of their source instead of copies
+    Hit = apps.get_model('fast_grow', 'Hit')
+    Hit.objects.filter(growing__cached_from__isnull=False).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fast_grow', '0016_status_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_copied_hits, migrations.RunPython.noop),
+    ]
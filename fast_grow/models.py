@@ -1,10 +1,28 @@
 """fast_grow models"""
+import hashlib
 import json
 import os
 from io import BytesIO
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 from zipfile import ZipFile
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from .settings import HIT_BATCH_SIZE, CHUNK_SIZE, CHUNK_SIZES, CHUNK_MIN_SAMPLES, \
+    CHUNK_MAX_LAG, CHUNK_STATISTICS_MIN_WEIGHT
+
+
+def content_hash(file_string):
+    """Compute the content hash of a file string
+
+    :param file_string: file contents to hash
+    :type file_string: str
+    :return: hex digest of the contents or None if there are no contents
+    :rtype: str
+    """
+    if file_string is None:
+        return None
+    return hashlib.sha256(file_string.encode('utf8')).hexdigest()
 
 
 class Status:
@@ -13,12 +31,14 @@ class Status:
     RUNNING = 'r'
     SUCCESS = 's'
     FAILURE = 'f'
+    CANCELLED = 'c'
 
     choices = [
         (PENDING, 'pending'),
         (RUNNING, 'running'),
         (SUCCESS, 'success'),
         (FAILURE, 'failure'),
+        (CANCELLED, 'cancelled'),
     ]
 
     @staticmethod
@@ -38,6 +58,8 @@ class Status:
             return 'success'
         if status == 'f':
             return 'failure'
+        if status == 'c':
+            return 'cancelled'
         return None
 
 
@@ -45,7 +67,16 @@ class Ensemble(models.Model):
     """Model representing a complex ensemble"""
     accessed = models.DateField(auto_now=True)
     # status of the job that will preprocess the complex
-    status = models.CharField(max_length=1, choices=Status.choices, default=Status.PENDING)
+    status = models.CharField(
+        max_length=1, choices=Status.choices, default=Status.PENDING, db_index=True)
+    # lifecycle of the job, queued from created until started, running until finished
+    created = models.DateTimeField(auto_now_add=True, null=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    # resource usage of the tool processes of the job, summed up except for the peak memory
+    resource_usage = models.JSONField(null=True)
+    # generate interactions of all complex ligand pairs ahead of time after preprocessing
+    speculative = models.BooleanField(default=False)
 
     def write_temp(self):
         """Write a temp directory containing the ensemble
@@ -85,6 +116,13 @@ class Complex(models.Model):
     name = models.CharField(max_length=255)
     file_type = models.CharField(max_length=3, null=True)
     file_string = models.TextField(null=True)
+    # sha256 of the file string, used to find work already done for identical complexes
+    file_hash = models.CharField(max_length=64, null=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        """Save the complex keeping the content hash up to date"""
+        self.file_hash = content_hash(self.file_string)
+        super().save(*args, **kwargs)
 
     def dict(self, detail=False):
         """Convert complex to dictionary
@@ -130,6 +168,13 @@ class Ligand(models.Model):
     name = models.CharField(max_length=255)
     file_type = models.CharField(max_length=3)
     file_string = models.TextField()
+    # sha256 of the file string, used to find work already done for identical ligands
+    file_hash = models.CharField(max_length=64, null=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        """Save the ligand keeping the content hash up to date"""
+        self.file_hash = content_hash(self.file_string)
+        super().save(*args, **kwargs)
 
     def dict(self, detail=False):
         """Convert ligand to a dictionary
@@ -141,7 +186,7 @@ class Ligand(models.Model):
         """
         ligand_dict = {
             'id': self.id,
-            'ensemble_id': self.ensemble.id,
+            'ensemble_id': self.ensemble_id,
             'name': self.name
         }
         if detail:
@@ -167,7 +212,20 @@ class SearchPointData(models.Model):
     complex = models.ForeignKey(Complex, on_delete=models.CASCADE)
     ligand = models.ForeignKey(Ligand, on_delete=models.CASCADE)
     data = models.TextField(null=True)
-    status = models.CharField(max_length=1, choices=Status.choices, default=Status.PENDING)
+    status = models.CharField(
+        max_length=1, choices=Status.choices, default=Status.PENDING, db_index=True)
+    # lifecycle of the job, queued from created until started, running until finished
+    created = models.DateTimeField(auto_now_add=True, null=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    # resource usage of the tool processes of the job, summed up except for the peak memory
+    resource_usage = models.JSONField(null=True)
+    # hash of the complex and ligand contents and the generator version
+    cache_key = models.CharField(max_length=64, null=True, db_index=True)
+    # generated ahead of time and not yet requested by a user
+    speculative = models.BooleanField(default=False)
+    # celery id of the generation job, only tracked for speculative generations
+    task_id = models.CharField(max_length=255, null=True)
 
     def dict(self, detail=False):
         """Convert interaction to a dictionary
@@ -179,14 +237,53 @@ class SearchPointData(models.Model):
         """
         search_point_dict = {
             'id': self.id,
-            'complex_id': self.complex.id,
-            'ligand_id': self.ligand.id,
+            'complex_id': self.complex_id,
+            'ligand_id': self.ligand_id,
             'status': Status.to_string(self.status)
         }
         if detail:
             search_point_dict['data'] = json.loads(self.data) if self.data else None
         return search_point_dict
 
+    @staticmethod
+    def find_reusable(cache_key, cmplx, ligand, statuses=None):
+        """Find search point data of the complex and ligand or a copy of identical search point data
+
+        Only search point data of the complex and ligand themselves is returned, successful
+        generations over in-flight ones. Search point data successfully generated from another
+        complex and ligand with identical contents is copied into new, unsaved search point data
+        of the complex and ligand instead, so it never depends on the ensemble of another request.
+
+        :param cache_key: cache key of the inputs
+        :type cache_key: str
+        :param cmplx: complex of the interactions
+        :type cmplx: Complex
+        :param ligand: ligand of the interactions
+        :type ligand: Ligand
+        :param statuses: statuses to consider, by default successful and in-flight ones
+        :type statuses: list
+        :return: reusable search point data, an unsaved copy of identical search point data or None
+        :rtype: SearchPointData
+        """
+        if statuses is None:
+            statuses = [Status.PENDING, Status.RUNNING, Status.SUCCESS]
+        candidates = list(SearchPointData.objects.filter(
+            complex=cmplx, ligand=ligand, status__in=statuses).defer('data'))
+        if candidates:
+            return min(candidates, key=lambda search_point_data: (
+                search_point_data.status != Status.SUCCESS, -search_point_data.id))
+        identical = SearchPointData.objects.filter(cache_key=cache_key, status=Status.SUCCESS) \
+            .order_by('-id').first()
+        if not identical:
+            return None
+        return SearchPointData(
+            complex=cmplx,
+            ligand=ligand,
+            data=identical.data,
+            status=Status.SUCCESS,
+            cache_key=cache_key
+        )
+
 
 class Core(models.Model):
     """Model representing a ligand core"""
@@ -197,7 +294,14 @@ class Core(models.Model):
     file_type = models.CharField(max_length=3, null=True)
     file_string = models.TextField(null=True)
     # status of the job that will execute the core generation
-    status = models.CharField(max_length=1, choices=Status.choices, default=Status.PENDING)
+    status = models.CharField(
+        max_length=1, choices=Status.choices, default=Status.PENDING, db_index=True)
+    # lifecycle of the job, queued from created until started, running until finished
+    created = models.DateTimeField(auto_now_add=True, null=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    # resource usage of the tool processes of the job, summed up except for the peak memory
+    resource_usage = models.JSONField(null=True)
 
     def dict(self, detail=False):
         """Convert core to a dictionary
@@ -209,7 +313,7 @@ class Core(models.Model):
         """
         core_dict = {
             'id': self.id,
-            'ligand_id': self.ligand.id,
+            'ligand_id': self.ligand_id,
             'name': self.name,
             'anchor': self.anchor,
             'linker': self.linker,
@@ -220,6 +324,46 @@ class Core(models.Model):
             core_dict['file_string'] = self.file_string
         return core_dict
 
+    @staticmethod
+    def find_reusable(ligand, anchor, linker):
+        """Find a successful or in-flight core of the ligand or a copy of an identical core
+
+        Only cores of the ligand itself are returned, successful ones over in-flight ones. Cores
+        successfully clipped from another ligand with identical contents are copied into a new,
+        unsaved core of the ligand instead, so cores never depend on the ensemble of another ligand.
+
+        :param ligand: ligand to clip
+        :type ligand: Ligand
+        :param anchor: anchor position
+        :type anchor: int
+        :param linker: linker position
+        :type linker: int
+        :return: reusable core, an unsaved copy of an identical core or None
+        :rtype: Core
+        """
+        cores = Core.objects.filter(anchor=anchor, linker=linker)
+        candidates = list(cores.filter(
+            ligand=ligand,
+            status__in=[Status.PENDING, Status.RUNNING, Status.SUCCESS]
+        ).defer('file_string'))
+        if candidates:
+            return min(candidates, key=lambda core: (core.status != Status.SUCCESS, -core.id))
+        if not ligand.file_hash:
+            return None
+        identical = cores.filter(ligand__file_hash=ligand.file_hash, status=Status.SUCCESS) \
+            .order_by('-id').first()
+        if not identical:
+            return None
+        return Core(
+            ligand=ligand,
+            name=ligand.name + '_' + str(anchor) + '_' + str(linker),
+            anchor=anchor,
+            linker=linker,
+            file_type=identical.file_type,
+            file_string=identical.file_string,
+            status=Status.SUCCESS
+        )
+
     def write_temp(self, path=None):
         """Write a tempfile containing the core
 
@@ -242,6 +386,22 @@ class FragmentSet(models.Model):
     """Model representing a fragment set"""
     name = models.CharField(max_length=255)
     description = models.TextField(null=True)
+    # number of partition databases named "<name>_<index>" the fragment set is split into
+    partitions = models.IntegerField(default=1)
+    # incremented whenever the fragment databases are rebuilt, invalidates snapshots of them
+    version = models.IntegerField(default=1)
+    # number of fragments in all databases, learned from complete growings unless specified
+    size = models.IntegerField(null=True)
+
+    def database_names(self):
+        """Get the names of the databases holding the fragment set
+
+        :return: database names, one per partition
+        :rtype: list
+        """
+        if self.partitions <= 1:
+            return [self.name]
+        return [f'{self.name}_{index}' for index in range(self.partitions)]
 
     def dict(self):
         """Convert fragment set to dict
@@ -263,7 +423,35 @@ class Growing(models.Model):
     fragment_set = models.ForeignKey(FragmentSet, on_delete=models.CASCADE)
     search_points = models.TextField(null=True)
     # status of the job that will execute the growing
-    status = models.CharField(max_length=1, choices=Status.choices, default=Status.PENDING)
+    status = models.CharField(
+        max_length=1, choices=Status.choices, default=Status.PENDING, db_index=True)
+    # lifecycle of the job, queued from created until started, running until finished
+    created = models.DateTimeField(auto_now_add=True, null=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    # resource usage of the tool processes of the job, summed up except for the peak memory
+    resource_usage = models.JSONField(null=True)
+    # optional criteria to stop early with the hits found so far, lower scores are better
+    max_hits = models.IntegerField(null=True)
+    score_threshold = models.FloatField(null=True)
+    score_threshold_hits = models.IntegerField(null=True)
+    time_budget = models.IntegerField(null=True)
+    # criterion that stopped the growing early
+    stop_reason = models.CharField(max_length=255, null=True)
+    # number of fragment set partitions grown by separate jobs and how many of them finished
+    shards = models.IntegerField(default=1)
+    shards_finished = models.IntegerField(default=0)
+    # fragments processed by fast grow so far, summed over all shards
+    fragments_processed = models.IntegerField(default=0)
+    # W3C trace context of the request that created the growing, continued by its jobs
+    traceparent = models.CharField(max_length=55, null=True)
+    # hash of all inputs and the fast grow version, successful growings serve as a result cache
+    fingerprint = models.CharField(max_length=64, null=True, db_index=True)
+    # growing whose hits this growing shares if the result was taken from the cache
+    cached_from = models.ForeignKey(
+        'self', null=True, on_delete=models.SET_NULL, related_name='cache_copies')
+    # last time the growing was stored in or served from the cache
+    cache_accessed = models.DateTimeField(null=True)
 
     def dict(self, detail=False, nof_hits=100):
         """Convert growing to dict
@@ -281,14 +469,107 @@ class Growing(models.Model):
             'core': self.core.dict(detail=detail),
             'fragment_set': self.fragment_set.name,
             'search_points': json.loads(self.search_points) if self.search_points else None,
+            'stop_criteria': self.stop_criteria(),
+            'stop_reason': self.stop_reason,
             'status': Status.to_string(self.status)
         }
-        if self.hit_set.count() and nof_hits:
-            growing_dict['hits'] = [h.dict() for h in self.hit_set.order_by('score')[:nof_hits]]
-        elif self.hit_set.count():
-            growing_dict['hits'] = [h.dict() for h in self.hit_set.order_by('score').all()]
+        hits = self.hits.order_by('score')
+        hits = [h.dict() for h in (hits[:nof_hits] if nof_hits else hits)]
+        if hits:
+            growing_dict['hits'] = hits
         return growing_dict
 
+    def stop_criteria(self):
+        """Get the criteria to stop the growing early
+
+        :return: criteria that are set
+        :rtype: dict
+        """
+        criteria = {
+            'max_hits': self.max_hits,
+            'score_threshold': self.score_threshold,
+            'score_threshold_hits': self.score_threshold_hits,
+            'time_budget': self.time_budget
+        }
+        return {name: value for name, value in criteria.items() if value is not None}
+
+    @property
+    def hits(self):
+        """Hits of the growing, growings taken from the cache share the hits of their source
+
+        :return: hits of the growing
+        :rtype: django.db.models.QuerySet
+        """
+        return Hit.objects.filter(growing_id=self.cached_from_id or self.id)
+
+    @staticmethod
+    def find_cached(fingerprint):
+        """Find the most recent successful growing with identical inputs that owns its hits
+
+        :param fingerprint: fingerprint of the growing inputs
+        :type fingerprint: str
+        :return: cached growing or None
+        :rtype: Growing
+        """
+        return Growing.objects.filter(
+            fingerprint=fingerprint, status=Status.SUCCESS, cached_from__isnull=True
+        ).order_by('-id').first()
+
+    def copy_hits(self, source):
+        """Copy all hits of another growing to this growing
+
+        :param source: growing to copy hits from
+        :type source: Growing
+        """
+        hit_values = source.hit_set.values_list(
+            'name', 'score', 'ensemble_scores', 'file_type', 'file_string')
+        batch = []
+        for name, score, ensemble_scores, file_type, file_string in \
+                hit_values.iterator(chunk_size=HIT_BATCH_SIZE):
+            batch.append(Hit(
+                growing=self,
+                name=name,
+                score=score,
+                ensemble_scores=ensemble_scores,
+                file_type=file_type,
+                file_string=file_string
+            ))
+            if len(batch) == HIT_BATCH_SIZE:
+                Hit.objects.bulk_create(batch)
+                batch = []
+        Hit.objects.bulk_create(batch)
+
+    @staticmethod
+    def evict_cache(max_hits):
+        """Limit the hit storage of the growing result cache
+
+        Cache entries are the growings owning their hits, growings taken from the cache share the
+        hits of their entry and store none. Entries are ranked by their last use, each entry costs
+        its number of hits. Entries beyond the hit budget and entries superseded by a more recently
+        used entry with the same fingerprint are evicted by dropping their fingerprint. The growings
+        keep their hits.
+
+        :param max_hits: maximum number of hits held by cache entries
+        :type max_hits: int
+        :return: number of evicted entries
+        :rtype: int
+        """
+        entries = Growing.objects \
+            .filter(fingerprint__isnull=False, status=Status.SUCCESS, cached_from__isnull=True) \
+            .annotate(nof_hits=models.Count('hit')) \
+            .order_by(models.F('cache_accessed').desc(nulls_last=True), '-id') \
+            .values_list('id', 'fingerprint', 'nof_hits')
+        kept_fingerprints = set()
+        cached_hits = 0
+        evicted = []
+        for growing_id, fingerprint, nof_hits in entries:
+            if fingerprint in kept_fingerprints or cached_hits + nof_hits > max_hits:
+                evicted.append(growing_id)
+                continue
+            kept_fingerprints.add(fingerprint)
+            cached_hits += nof_hits
+        return Growing.objects.filter(id__in=evicted).update(fingerprint=None)
+
     def write_zip_bytes(self):
         """Serialize the contents of the growing into ZIP bytes
 
@@ -322,15 +603,26 @@ class Growing(models.Model):
                     search_point_file.name,
                     os.path.join('growing', os.path.basename(search_point_path)))
 
-            if self.hit_set.count() > 0:
+            if self.hits.exists():
                 hits_path = os.path.join(temp_dir, 'hits.sdf')
                 with open(hits_path, 'w', encoding='utf8') as hits_file:
-                    for hit in self.hit_set.all():
+                    for hit in self.hits.all():
                         hits_file.write(hit.file_string)
                 zip_file.write(hits_path, os.path.join('growing', 'hits.sdf'))
         return zip_bytes
 
 
+@receiver(pre_delete, sender=Growing)
+def keep_cached_hits(instance, **_):
+    """Copy the hits of a deleted growing to the growings taken from it, they share its hits
+
+    :param instance: deleted growing
+    :type instance: Growing
+    """
+    for growing in instance.cache_copies.all():
+        growing.copy_hits(instance)
+
+
 class Hit(models.Model):
     """Model representing a hit of a growing"""
     growing = models.ForeignKey(Growing, on_delete=models.CASCADE)
@@ -354,3 +646,92 @@ class Hit(models.Model):
             'file_string': self.file_string,
             'ensemble_scores': self.ensemble_scores
         }
+
+
+class ChunkStatistics(models.Model):
+    """Model representing the recorded throughput of growings with a chunk size
+
+    Statistics are kept per fragment set and ensemble size as moving averages over the growings.
+    """
+    fragment_set = models.ForeignKey(FragmentSet, on_delete=models.CASCADE)
+    ensemble_size = models.IntegerField()
+    chunk_size = models.IntegerField()
+    samples = models.IntegerField(default=0)
+    fragments_per_second = models.FloatField(default=0)
+    hits_per_chunk = models.FloatField(default=0)
+    # mean seconds between fast grow writing a hits file and its hits being saved
+    ingestion_lag = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ['fragment_set', 'ensemble_size', 'chunk_size']
+
+    @staticmethod
+    def choose_chunk_size(fragment_set, ensemble_size):
+        """Choose the chunk size of a growing from the recorded throughput
+
+        Starting at CHUNK_SIZE the neighbouring sizes in CHUNK_SIZES are tried until each has
+        CHUNK_MIN_SAMPLES samples, then the fastest size is kept. Sizes whose hits are ingested
+        more than CHUNK_MAX_LAG seconds late are only chosen if all sizes are.
+
+        :param fragment_set: fragment set to grow from
+        :type fragment_set: FragmentSet
+        :param ensemble_size: number of complexes in the ensemble
+        :type ensemble_size: int
+        :return: chunk size
+        :rtype: int
+        """
+        statistics = {
+            chunk_statistics.chunk_size: chunk_statistics
+            for chunk_statistics in ChunkStatistics.objects.filter(
+                fragment_set=fragment_set, ensemble_size=ensemble_size, chunk_size__in=CHUNK_SIZES)
+        }
+        sampled = [chunk_statistics for chunk_statistics in statistics.values()
+                   if chunk_statistics.samples >= CHUNK_MIN_SAMPLES]
+        if not sampled:
+            return CHUNK_SIZE
+        best = max(sampled, key=lambda chunk_statistics: (
+            chunk_statistics.ingestion_lag <= CHUNK_MAX_LAG,
+            chunk_statistics.fragments_per_second
+        )).chunk_size
+        index = CHUNK_SIZES.index(best)
+        for neighbour in CHUNK_SIZES[max(index - 1, 0):index + 2]:
+            if neighbour not in statistics or statistics[neighbour].samples < CHUNK_MIN_SAMPLES:
+                return neighbour
+        return best
+
+    @staticmethod
+    def record(fragment_set, ensemble_size, chunk_size, seconds, nof_chunks, nof_hits, lags):
+        """Record the throughput of a growing
+
+        :param fragment_set: fragment set grown from
+        :type fragment_set: FragmentSet
+        :param ensemble_size: number of complexes in the ensemble
+        :type ensemble_size: int
+        :param chunk_size: chunk size of the growing
+        :type chunk_size: int
+        :param seconds: runtime of fast grow
+        :type seconds: float
+        :param nof_chunks: number of processed chunks
+        :type nof_chunks: int
+        :param nof_hits: number of hits found
+        :type nof_hits: int
+        :param lags: seconds between writing and ingesting each hits file
+        :type lags: list
+        """
+        if not nof_chunks or seconds <= 0:
+            return
+        with transaction.atomic():
+            ChunkStatistics.objects.get_or_create(
+                fragment_set=fragment_set, ensemble_size=ensemble_size, chunk_size=chunk_size)
+            chunk_statistics = ChunkStatistics.objects.select_for_update().get(
+                fragment_set=fragment_set, ensemble_size=ensemble_size, chunk_size=chunk_size)
+            chunk_statistics.samples += 1
+            # a running mean that turns into an exponential one, so the statistics follow changes
+            weight = max(1 / chunk_statistics.samples, CHUNK_STATISTICS_MIN_WEIGHT)
+            for field, value in [
+                    ('fragments_per_second', nof_chunks * chunk_size / seconds),
+                    ('hits_per_chunk', nof_hits / nof_chunks),
+                    ('ingestion_lag', sum(lags) / len(lags) if lags else 0)]:
+                mean = getattr(chunk_statistics, field)
+                setattr(chunk_statistics, field, mean + weight * (value - mean))
+            chunk_statistics.save()
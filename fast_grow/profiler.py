@@ -0,0 +1,250 @@
+"""On-demand sampling profiler of requests and jobs
+
+A sampler thread records the stacks of the profiled threads every PROFILE_INTERVAL seconds. Stacks
+are written in the folded format of flamegraph.pl and speedscope, one file per profiled request or
+job in PROFILE_DIR, of which the newest PROFILE_MAX_FILES are kept.
+
+Requests are profiled if they carry the PROFILE_TOKEN in the X-Profile header, only the thread of
+the request is sampled. Jobs are profiled if their celery task id or their task and job id, e.g.
+grow:42, is one of the profiled jobs in redis, see the profile_job command. All threads of the
+worker are sampled, which includes the hits reader of growings.
+"""
+import hmac
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+import redis
+from celery.signals import task_prerun, task_postrun
+from django.core.exceptions import MiddlewareNotUsed
+from .broker import connection
+from .settings import PROFILE_DIR, PROFILE_INTERVAL, PROFILE_MAX_FILES, PROFILE_TOKEN
+
+KEY = 'fast_grow:profile'
+HEADER = 'HTTP_X_PROFILE'
+SUFFIX = '.folded'
+# samplers of the running jobs by task id
+_JOBS = {}
+
+
+class Sampler(threading.Thread):
+    """Thread sampling the stacks of other threads"""
+
+    def __init__(self, thread_ids=None, interval=PROFILE_INTERVAL):
+        """Create a sampler
+
+        :param thread_ids: identifiers of the threads to sample, None samples all other threads
+        :type thread_ids: list
+        :param interval: seconds between samples
+        :type interval: float
+        """
+        super().__init__(daemon=True, name='sampler')
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        # path of the saved profile
+        self.path = None
+
+    def run(self):
+        """Sample until the sampler is stopped"""
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """Record the current stack of every sampled thread"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if thread_id == self.ident or \
+                    self.thread_ids is not None and thread_id not in self.thread_ids:
+                continue
+            self.stacks[fold(frame, names.get(thread_id, str(thread_id)))] += 1
+        self.samples += 1
+
+    def stop(self):
+        """Stop sampling and wait for the sampler to exit"""
+        self.stopped.set()
+        self.join()
+
+
+def fold(frame, thread_name):
+    """Fold a stack into a line of semicolon separated frames, outermost first
+
+    :param frame: innermost frame of the stack
+    :type frame: frame
+    :param thread_name: name of the thread, the root of the stack
+    :type thread_name: str
+    :return: folded stack
+    :rtype: str
+    """
+    frames = []
+    while frame is not None:
+        frames.append(f'{frame.f_globals.get("__name__", "?")}:{frame.f_code.co_name}')
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ';'.join(reversed(frames)).replace(' ', '_')
+
+
+def save(sampler, name):
+    """Write the stacks of a sampler to a new profile and remove the oldest profiles
+
+    :param sampler: stopped sampler
+    :type sampler: Sampler
+    :param name: request or job the profile belongs to
+    :type name: str
+    :return: path of the profile
+    :rtype: str
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r'[^\w.:-]+', '_', name).strip('_')
+    file_name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{slug}{SUFFIX}'
+    path = os.path.join(PROFILE_DIR, file_name)
+    with open(path, 'w', encoding='utf8') as profile_file:
+        for stack, count in sampler.stacks.most_common():
+            profile_file.write(f'{stack} {count}\n')
+    rotate()
+    return path
+
+
+def rotate():
+    """Remove all but the newest PROFILE_MAX_FILES profiles"""
+    paths = [os.path.join(PROFILE_DIR, file_name) for file_name in os.listdir(PROFILE_DIR)
+             if file_name.endswith(SUFFIX)]
+    paths.sort(key=modified, reverse=True)
+    for path in paths[PROFILE_MAX_FILES:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # removed by another process
+            pass
+
+
+def modified(path):
+    """Get the modification time of a file that may have been removed by another process
+
+    :param path: path of the file
+    :type path: str
+    :return: modification time, 0 if the file does not exist anymore
+    :rtype: float
+    """
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0
+
+
+@contextmanager
+def profile(name, thread_ids=None):
+    """Sample the stacks of threads while the context is active and save them as a profile
+
+    Profiles that cannot be saved are logged and dropped.
+
+    :param name: request or job the profile belongs to
+    :type name: str
+    :param thread_ids: identifiers of the threads to sample, None samples all threads
+    :type thread_ids: list
+    :return: the running sampler
+    :rtype: Sampler
+    """
+    sampler = Sampler(thread_ids)
+    sampler.start()
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+        try:
+            sampler.path = save(sampler, name)
+        except OSError as error:
+            logging.warning('dropping the profile of %s: %s', name, error)
+
+
+class SamplingProfilerMiddleware:
+    """Middleware profiling requests that carry the profile token"""
+
+    def __init__(self, get_response):
+        """Create the middleware, it is not used unless PROFILE_TOKEN is set
+
+        :param get_response: next handler of the middleware chain
+        :type get_response: callable
+        :raises MiddlewareNotUsed: if PROFILE_TOKEN is not set
+        """
+        if not PROFILE_TOKEN:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Profile a request with the profile token and name its profile in the response
+
+        :param request: the request
+        :type request: django.http.HttpRequest
+        :return: the response
+        :rtype: django.http.HttpResponse
+        """
+        token = request.META.get(HEADER)
+        if not token or not hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+            return self.get_response(request)
+        with profile(f'{request.method} {request.path}', [threading.get_ident()]) as sampler:
+            response = self.get_response(request)
+        if sampler.path:
+            response['X-Profile'] = os.path.basename(sampler.path)
+        return response
+
+
+def job_name(task, args):
+    """Name a job by its task and the id of the model it works on
+
+    Jobs on several models, e.g. clip_ligands, are named by their task alone.
+
+    :param task: celery task of the job
+    :type task: celery.Task
+    :param args: arguments of the job, the first one is the id of a model or a list of ids
+    :type args: list
+    :return: job name, e.g. grow:42
+    :rtype: str
+    """
+    name = task.name.rsplit('.', 1)[-1]
+    return f'{name}:{args[0]}' if args and not isinstance(args[0], list) else name
+
+
+def is_profiled(jobs):
+    """Check if any of the names of a job is one of the profiled jobs
+
+    :param jobs: celery task id and job name of the job
+    :type jobs: list
+    :return: True if the job is profiled, False otherwise or if redis is unavailable
+    :rtype: bool
+    """
+    try:
+        # pipelined SISMEMBER rather than SMISMEMBER, which needs redis 6.2
+        pipeline = connection().pipeline(transaction=False)
+        for job in jobs:
+            pipeline.sismember(KEY, job)
+        return any(pipeline.execute())
+    except redis.RedisError as error:
+        logging.warning('cannot read the profiled jobs: %s', error)
+        return False
+
+
+@task_prerun.connect
+def start_job(task_id=None, task=None, args=None, **_):
+    """Start profiling a job if it is one of the profiled jobs"""
+    name = job_name(task, args)
+    if not is_profiled([task_id, name]):
+        return
+    stack = ExitStack()
+    _JOBS[task_id] = (stack, stack.enter_context(profile(f'{name}-{task_id}')))
+
+
+@task_postrun.connect
+def finish_job(task_id=None, **_):
+    """Stop profiling a job and save its profile"""
+    if task_id not in _JOBS:
+        return
+    stack, sampler = _JOBS.pop(task_id)
+    stack.close()
+    logging.info('saved profile %s', sampler.path)
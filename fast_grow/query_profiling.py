@@ -0,0 +1,148 @@
+"""Opt-in profiling of the database queries of requests and jobs
+
+With QUERY_PROFILING, the queries of every request and celery job are counted and timed through a
+database execute wrapper. Queries are told apart by their SQL with placeholders, so an N+1 pattern
+shows up as one statement repeated with different parameters. Requests and jobs above one of the
+QUERY_PROFILING_LIMITS are logged with their most repeated statements.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from celery.signals import task_prerun, task_postrun
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from .settings import QUERY_PROFILING, QUERY_PROFILING_HEADERS, QUERY_PROFILING_LIMITS
+
+# length statements are cut to in the log
+STATEMENT_LENGTH = 200
+# profiles of the running jobs by task id
+_JOBS = {}
+
+
+class QueryProfile:
+    """Database execute wrapper recording the queries run through it"""
+
+    def __init__(self):
+        """Create an empty profile"""
+        self.queries = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """Run and record a query
+
+        :param execute: next execute function of the wrapper chain
+        :type execute: callable
+        :param sql: SQL of the query with placeholders
+        :type sql: str
+        :param params: parameters of the query
+        :param many: whether this is an executemany call
+        :type many: bool
+        :param context: execution context of the query
+        :type context: dict
+        :return: result of the query
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated(self):
+        """Get the statements run more than once, most repeated first
+
+        :return: statements and how often they ran
+        :rtype: list
+        """
+        return [(sql, count) for sql, count in self.statements.most_common() if count > 1]
+
+    def exceeded(self):
+        """Get the limits of QUERY_PROFILING_LIMITS this profile is above
+
+        :return: names of the exceeded limits
+        :rtype: list
+        """
+        limits = QUERY_PROFILING_LIMITS
+        repeats = self.statements.most_common(1)[0][1] if self.statements else 0
+        values = {'queries': self.queries, 'seconds': self.seconds, 'repeats': repeats}
+        return [name for name, value in values.items()
+                if limits.get(name) is not None and value > limits[name]]
+
+    def log(self, name):
+        """Log the profile if it is above one of the limits
+
+        :param name: request or job the profile belongs to
+        :type name: str
+        """
+        exceeded = self.exceeded()
+        if not exceeded:
+            return
+        statements = ''.join(f'\n  {count}x {sql[:STATEMENT_LENGTH]}'
+                             for sql, count in self.repeated()[:3])
+        logging.warning('%s ran %d queries in %.3fs, above the %s limit%s', name, self.queries,
+                        self.seconds, ', '.join(exceeded), statements)
+
+
+@contextmanager
+def profile():
+    """Record the queries run on the default database connection of this thread
+
+    :return: profile of the queries
+    :rtype: QueryProfile
+    """
+    query_profile = QueryProfile()
+    with connection.execute_wrapper(query_profile):
+        yield query_profile
+
+
+class QueryProfilingMiddleware:
+    """Middleware profiling the queries of every request"""
+
+    def __init__(self, get_response):
+        """Create the middleware, it is not used unless QUERY_PROFILING is set
+
+        :param get_response: next handler of the middleware chain
+        :type get_response: callable
+        :raises MiddlewareNotUsed: if QUERY_PROFILING is not set
+        """
+        if not QUERY_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Profile a request and report its queries in the response headers
+
+        :param request: the request
+        :type request: django.http.HttpRequest
+        :return: the response
+        :rtype: django.http.HttpResponse
+        """
+        with profile() as query_profile:
+            response = self.get_response(request)
+        query_profile.log(f'{request.method} {request.path}')
+        if QUERY_PROFILING_HEADERS:
+            response['X-DB-Queries'] = str(query_profile.queries)
+            response['X-DB-Time'] = f'{query_profile.seconds:.6f}'
+        return response
+
+
+@task_prerun.connect
+def start_job(task_id=None, **_):
+    """Start profiling the queries of a job"""
+    if not QUERY_PROFILING:
+        return
+    stack = ExitStack()
+    _JOBS[task_id] = (stack, stack.enter_context(profile()))
+
+
+@task_postrun.connect
+def finish_job(task_id=None, task=None, args=None, **_):
+    """Stop profiling the queries of a job and log it if it is above the limits"""
+    if task_id not in _JOBS:
+        return
+    stack, query_profile = _JOBS.pop(task_id)
+    stack.close()
+    query_profile.log(f'{task.name.rsplit(".", 1)[-1]}{tuple(args or ())}')
@@ -0,0 +1,177 @@
+"""Fair-share scheduling of growings between clients
+
+Celery consumes the bulk queue first in, first out, so a client submitting a batch of growings would
+occupy the growing workers for everyone else. Growings are therefore held in one redis queue per
+client and only handed to celery while fewer than GROWING_SLOTS growings are dispatched, taking
+turns between the clients with queued growings. Within the queue of a client, growings expected to
+finish sooner go first.
+"""
+import hashlib
+import time
+from .broker import connection
+from .settings import FAIR_SHARE_CLIENT_HEADER
+
+PREFIX = 'fast_grow:fair_share:'
+LOCK_TIMEOUT = 10
+
+
+def key(name):
+    """Get a redis key of the scheduler
+
+    :param name: name of the key
+    :type name: str
+    :return: prefixed redis key
+    :rtype: str
+    """
+    return PREFIX + name
+
+
+def client_key(request):
+    """Identify the client of a request by its API token, session or address
+
+    Behind the reverse proxy the address of the client is taken from the FAIR_SHARE_CLIENT_HEADER,
+    only the address added by the proxy is trusted.
+
+    :param request: request of the client
+    :return: anonymized client identifier
+    :rtype: str
+    """
+    identity = request.META.get('HTTP_AUTHORIZATION')
+    if not identity and hasattr(request, 'session'):
+        identity = request.session.session_key
+    if not identity and FAIR_SHARE_CLIENT_HEADER:
+        identity = request.META.get(FAIR_SHARE_CLIENT_HEADER, '').split(',')[-1].strip()
+    if not identity:
+        identity = request.META.get('REMOTE_ADDR', '')
+    return hashlib.sha256(identity.encode('utf8')).hexdigest()[:16]
+
+
+def submit(growing_id, client, expected_seconds):
+    """Queue a growing of a client
+
+    Growings of a client are ordered by their submission time plus their expected run time, so
+    short growings overtake long ones, while long growings still move up as time passes.
+
+    :param growing_id: id of a growing
+    :type growing_id: int
+    :param client: client identifier
+    :type client: str
+    :param expected_seconds: expected run time of the growing
+    :type expected_seconds: float
+    """
+    conn = connection()
+    with conn.lock(key('lock'), timeout=LOCK_TIMEOUT):
+        conn.zadd(key(f'queue:{client}'), {growing_id: time.time() + expected_seconds})
+        conn.hset(key('owners'), growing_id, client)
+        if client not in conn.lrange(key('clients'), 0, -1):
+            conn.rpush(key('clients'), client)
+
+
+def take(slots):
+    """Take queued growings for free slots, one per client in turn
+
+    :param slots: maximum number of concurrently dispatched growings
+    :type slots: int
+    :return: ids of the growings to dispatch
+    :rtype: list
+    """
+    conn = connection()
+    growing_ids = []
+    with conn.lock(key('lock'), timeout=LOCK_TIMEOUT):
+        while conn.scard(key('dispatched')) < slots:
+            client = conn.lpop(key('clients'))
+            if client is None:
+                break
+            popped = conn.zpopmin(key(f'queue:{client}'))
+            if conn.zcard(key(f'queue:{client}')):
+                conn.rpush(key('clients'), client)
+            if not popped:
+                continue
+            growing_id = int(popped[0][0])
+            conn.hdel(key('owners'), growing_id)
+            conn.sadd(key('dispatched'), growing_id)
+            conn.hset(key('dispatched_at'), growing_id, time.time())
+            growing_ids.append(growing_id)
+    return growing_ids
+
+
+def dispatched():
+    """Get the growings handed to celery that were not released yet
+
+    :return: ids of dispatched growings
+    :rtype: list
+    """
+    return [int(growing_id) for growing_id in connection().smembers(key('dispatched'))]
+
+
+def dispatched_before(timestamp):
+    """Get the growings handed to celery before a time that were not released yet
+
+    :param timestamp: unix time
+    :type timestamp: float
+    :return: ids of the growings dispatched before the time
+    :rtype: list
+    """
+    return [int(growing_id) for growing_id, dispatched_at in
+            connection().hgetall(key('dispatched_at')).items() if float(dispatched_at) < timestamp]
+
+
+def release(growing_id):
+    """Remove a finished or cancelled growing from the scheduler
+
+    :param growing_id: id of a growing
+    :type growing_id: int
+    """
+    conn = connection()
+    with conn.lock(key('lock'), timeout=LOCK_TIMEOUT):
+        conn.srem(key('dispatched'), growing_id)
+        conn.hdel(key('dispatched_at'), growing_id)
+        client = conn.hget(key('owners'), growing_id)
+        if client is None:
+            return
+        conn.hdel(key('owners'), growing_id)
+        conn.zrem(key(f'queue:{client}'), growing_id)
+        if not conn.zcard(key(f'queue:{client}')):
+            conn.lrem(key('clients'), 0, client)
+
+
+def queue_position(growing_id):
+    """Get the number of queued growings dispatched before a growing
+
+    :param growing_id: id of a growing
+    :type growing_id: int
+    :return: queue position starting at 0 or None if the growing is not queued
+    :rtype: int
+    """
+    conn = connection()
+    client = conn.hget(key('owners'), growing_id)
+    if client is None:
+        return None
+    rank = conn.zrank(key(f'queue:{client}'), growing_id)
+    clients = conn.lrange(key('clients'), 0, -1)
+    if rank is None or client not in clients:
+        return None
+    queue_lengths = [conn.zcard(key(f'queue:{other}')) for other in clients]
+    return round_robin_position(rank, clients.index(client), queue_lengths)
+
+
+def round_robin_position(rank, client_index, queue_lengths):
+    """Compute the position of a growing in a round robin over client queues
+
+    :param rank: position of the growing in the queue of its client
+    :type rank: int
+    :param client_index: position of its client in the round robin
+    :type client_index: int
+    :param queue_lengths: queue lengths of all clients in round robin order
+    :type queue_lengths: list
+    :return: number of growings dispatched before the growing
+    :rtype: int
+    """
+    position = rank
+    for index, length in enumerate(queue_lengths):
+        if index == client_index:
+            continue
+        # clients before the own client in the round get one more turn
+        turns = rank + 1 if index < client_index else rank
+        position += min(length, turns)
+    return position
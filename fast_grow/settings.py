@@ -1,10 +1,100 @@
 """fast_grow settings"""
 import os
-from fast_grow_server.settings import BASE_DIR
+import tempfile
+from fast_grow_server.settings import BASE_DIR, CELERY_WORKER_QUEUE_CONCURRENCY, DEBUG
 
-PREPROCESSOR = os.path.join(BASE_DIR, 'bin', 'Preprocessor')
-CLIPPER = os.path.join(BASE_DIR, 'bin', 'Clipper')
-INTERACTIONS = os.path.join(BASE_DIR, 'bin', 'InteractionGenerator')
-FAST_GROW = os.path.join(BASE_DIR, 'bin', 'FastGrow')
+# run the simulators in fast_grow/tool_simulators instead of the tool binaries, e.g. to test
+# and benchmark the pipeline without the tools, the simulators document their own settings
+SIMULATE_TOOLS = os.environ.get('FAST_GROW_SIMULATE_TOOLS') == '1'
+SIMULATORS = os.path.join(BASE_DIR, 'fast_grow', 'tool_simulators')
+if SIMULATE_TOOLS:
+    PREPROCESSOR = os.path.join(SIMULATORS, 'preprocessor.py')
+    CLIPPER = os.path.join(SIMULATORS, 'clipper.py')
+    INTERACTIONS = os.path.join(SIMULATORS, 'interaction_generator.py')
+    FAST_GROW = os.path.join(SIMULATORS, 'fastgrow.py')
+else:
+    PREPROCESSOR = os.path.join(BASE_DIR, 'bin', 'Preprocessor')
+    CLIPPER = os.path.join(BASE_DIR, 'bin', 'Clipper')
+    INTERACTIONS = os.path.join(BASE_DIR, 'bin', 'InteractionGenerator')
+    FAST_GROW = os.path.join(BASE_DIR, 'bin', 'FastGrow')
 
+# fragments per chunk of growings without recorded throughput
 CHUNK_SIZE = 100
+# chunk sizes tried by the adaptive chunk size controller, has to contain CHUNK_SIZE
+CHUNK_SIZES = [25, 50, 100, 200, 400, 800]
+# growings recorded per chunk size before the controller trusts its throughput
+CHUNK_MIN_SAMPLES = 3
+# mean seconds hits may wait for ingestion before a chunk size counts as too large
+CHUNK_MAX_LAG = 5
+# minimum weight of a new growing in the moving averages of the chunk statistics
+CHUNK_STATISTICS_MIN_WEIGHT = 0.1
+# number of preprocessed complexes or ligands held in memory and inserted per query
+PREPROCESSOR_BATCH_SIZE = 16
+# maximum number of concurrent clipper processes of a batch clipping
+CLIPPER_POOL_SIZE = 4
+# default for ensembles that do not specify whether to generate interactions ahead of time
+SPECULATIVE_INTERACTIONS = False
+# broker priority of speculative jobs, 0 is the highest and 9 the lowest priority
+SPECULATIVE_PRIORITY = 9
+# number of hits held in memory and inserted per query
+HIT_BATCH_SIZE = 500
+# parsed hits files waiting to be saved before the hits file reader of a growing blocks
+HIT_QUEUE_SIZE = 8
+# maximum number of hits held by growings that serve as result cache entries
+GROWING_CACHE_MAX_HITS = 1000000
+# seconds a terminated tool process gets to exit before it is killed
+TERMINATION_TIMEOUT = 10
+# resource limits of the tool processes, None is unlimited: address space in bytes, CPU seconds and
+# wall-clock seconds after which the tool is terminated, growings are bounded by their time budget
+TOOL_LIMITS = {
+    'preprocessor': {'memory': 8 << 30, 'cpu': 3600, 'timeout': 3600},
+    'clipper': {'memory': 2 << 30, 'cpu': 300, 'timeout': 300},
+    'interactions': {'memory': 4 << 30, 'cpu': 1800, 'timeout': 1800},
+    'fast_grow': {'memory': 16 << 30, 'cpu': None, 'timeout': None},
+}
+# job creating endpoints answer 429 once max_queued jobs of a task are pending, retries are
+# suggested after runtime seconds (the typical job runtime) per round of running jobs ahead, jobs
+# created more than stale_after seconds ago are considered lost and not counted
+ADMISSION_LIMITS = {
+    'preprocess_ensemble': {'max_queued': 100, 'runtime': 10, 'stale_after': 3600},
+    'clip_ligand': {'max_queued': 500, 'runtime': 2, 'stale_after': 3600},
+    'generate_interactions': {'max_queued': 200, 'runtime': 5, 'stale_after': 3600},
+    'grow': {'max_queued': 100, 'runtime': 600, 'stale_after': 7 * 24 * 3600},
+}
+# request header in which the reverse proxy passes the client address, the last address of the
+# header, which the proxy added, identifies clients without API token or session to the fair-share
+# scheduler, None identifies them by the address of the request, e.g. without a proxy
+FAIR_SHARE_CLIENT_HEADER = 'HTTP_X_FORWARDED_FOR'
+# growings handed to celery at a time by the fair-share scheduler, one per bulk worker process
+GROWING_SLOTS = CELERY_WORKER_QUEUE_CONCURRENCY['bulk']
+# worker-local cache of tool input files, on tmpfs where available
+WORKSPACE_DIR = os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'fast_grow_workspace')
+WORKSPACE_MAX_BYTES = 1 << 30
+# directory of the worker-local sqlite snapshots of fragment databases
+FRAGMENT_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'fragment_snapshots')
+# number of fragment database rows copied per query when exporting a snapshot
+FRAGMENT_SNAPSHOT_BATCH_SIZE = 10000
+# seconds between flushes of the metrics observed by a process to redis, processes flush after jobs
+METRICS_FLUSH_INTERVAL = 10
+# record the database queries of every request and job, requests and jobs above one of the limits
+# are logged with their most repeated queries
+QUERY_PROFILING = False
+QUERY_PROFILING_LIMITS = {'queries': 50, 'seconds': 0.5, 'repeats': 10}
+# report the query count and database seconds of profiled requests in X-DB-Queries and X-DB-Time
+QUERY_PROFILING_HEADERS = DEBUG
+# requests carrying this token in the X-Profile header are profiled, None disables the header
+PROFILE_TOKEN = None
+# seconds between the stack samples of profiled requests and jobs
+PROFILE_INTERVAL = 0.005
+# directory of the flamegraph compatible profiles and the number of profiles kept in it
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_MAX_FILES = 100
+# export spans of requests, jobs and their stages in the OTLP JSON encoding, 'file' appends them to
+# TRACING_FILE, 'otlp' posts them to an OTLP/HTTP collector and None disables tracing
+TRACING_EXPORTER = None
+TRACING_FILE = os.path.join(BASE_DIR, 'traces.jsonl')
+TRACING_OTLP_ENDPOINT = 'http://localhost:4318/v1/traces'
+# finished spans buffered before they are exported in the background and seconds between exports
+TRACING_BATCH_SIZE = 512
+TRACING_EXPORT_INTERVAL = 5
@@ -0,0 +1,206 @@
+"""Worker-local file snapshots of fragment databases
+
+Growings stream their fragments from the fragment databases in postgres. A snapshot exports a
+fragment database once into a sqlite file on the worker host, next to a manifest recording the
+fragment set version and the content hash of the file. A snapshot is current as long as it matches
+the current fragment set version and hash. Growings do not read snapshots yet, the sqlite schema is
+not verified against the fast grow binary.
+"""
+import json
+import logging
+import os
+import sqlite3
+from pathlib import Path
+import psycopg2
+from fast_grow_server.settings import DATABASES
+from .settings import FRAGMENT_SNAPSHOT_DIR, FRAGMENT_SNAPSHOT_BATCH_SIZE
+from .tool_wrappers.versions import file_hash
+
+SQLITE_TYPES = {
+    'smallint': 'INTEGER',
+    'integer': 'INTEGER',
+    'bigint': 'INTEGER',
+    'boolean': 'INTEGER',
+    'real': 'REAL',
+    'double precision': 'REAL',
+    'numeric': 'REAL',
+    'bytea': 'BLOB',
+}
+
+
+def snapshot_path(database_name):
+    """Get the path of the snapshot of a fragment database
+
+    :param database_name: name of the fragment database
+    :type database_name: str
+    :return: path to the sqlite file
+    :rtype: pathlib.Path
+    """
+    return Path(FRAGMENT_SNAPSHOT_DIR) / f'{database_name}.sqlite'
+
+
+def manifest_path(database_name):
+    """Get the path of the manifest of a fragment database snapshot
+
+    :param database_name: name of the fragment database
+    :type database_name: str
+    :return: path to the manifest
+    :rtype: pathlib.Path
+    """
+    return Path(FRAGMENT_SNAPSHOT_DIR) / f'{database_name}.json'
+
+
+def verified_snapshot(fragment_set, database_name):
+    """Get the snapshot of a fragment database if it is current and intact
+
+    Hashes are cached per process until the snapshot file changes.
+
+    :param fragment_set: fragment set the database belongs to
+    :type fragment_set: fast_grow.models.FragmentSet
+    :param database_name: name of the fragment database
+    :type database_name: str
+    :return: path to the snapshot or None
+    :rtype: str
+    """
+    try:
+        with open(manifest_path(database_name), encoding='utf8') as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    path = snapshot_path(database_name)
+    if manifest.get('database') != database_name \
+            or manifest.get('version') != fragment_set.version:
+        return None
+    try:
+        snapshot_hash = file_hash(path)
+    except OSError:
+        return None
+    if manifest.get('hash') != snapshot_hash:
+        logging.warning('snapshot %s does not match its manifest, ignoring it', path)
+        return None
+    return str(path)
+
+
+def export(fragment_set, database_name):
+    """Export a fragment database into a snapshot
+
+    The snapshot and its manifest replace a previous snapshot only once they are complete.
+
+    :param fragment_set: fragment set the database belongs to
+    :type fragment_set: fast_grow.models.FragmentSet
+    :param database_name: name of the fragment database
+    :type database_name: str
+    :return: manifest of the snapshot
+    :rtype: dict
+    """
+    path = snapshot_path(database_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix('.sqlite.tmp')
+    if temp_path.exists():
+        temp_path.unlink()
+    source = psycopg2.connect(
+        dbname=database_name,
+        user=DATABASES['default']['USER'],
+        password=DATABASES['default'].get('PASSWORD'),
+        host=DATABASES['default']['HOST'],
+        port=DATABASES['default']['PORT']
+    )
+    target = sqlite3.connect(temp_path)
+    try:
+        tables = {table: copy_table(source, target, table) for table in source_tables(source)}
+        target.commit()
+    finally:
+        target.close()
+        source.close()
+    os.replace(temp_path, path)
+    manifest = {
+        'fragment_set': fragment_set.name,
+        'database': database_name,
+        'version': fragment_set.version,
+        'tables': tables,
+        'hash': file_hash(path)
+    }
+    temp_manifest_path = manifest_path(database_name).with_suffix('.json.tmp')
+    with open(temp_manifest_path, 'w', encoding='utf8') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(temp_manifest_path, manifest_path(database_name))
+    return manifest
+
+
+def source_tables(source):
+    """List the tables of a fragment database
+
+    :param source: connection to the fragment database
+    :return: table names
+    :rtype: list
+    """
+    with source.cursor() as cursor:
+        cursor.execute(
+            "SELECT table_name FROM information_schema.tables "
+            "WHERE table_schema = 'public' AND table_type = 'BASE TABLE' ORDER BY table_name"
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def copy_table(source, target, table):
+    """Copy a table of a fragment database into the snapshot
+
+    :param source: connection to the fragment database
+    :param target: connection to the snapshot
+    :type target: sqlite3.Connection
+    :param table: name of the table
+    :type table: str
+    :return: number of copied rows
+    :rtype: int
+    """
+    with source.cursor() as cursor:
+        cursor.execute(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_schema = 'public' AND table_name = %s ORDER BY ordinal_position",
+            (table,)
+        )
+        columns = cursor.fetchall()
+        cursor.execute(
+            "SELECT kcu.column_name FROM information_schema.table_constraints tc "
+            "JOIN information_schema.key_column_usage kcu "
+            "ON tc.constraint_name = kcu.constraint_name AND tc.table_schema = kcu.table_schema "
+            "WHERE tc.table_schema = 'public' AND tc.table_name = %s "
+            "AND tc.constraint_type = 'PRIMARY KEY' ORDER BY kcu.ordinal_position",
+            (table,)
+        )
+        primary_key = [row[0] for row in cursor.fetchall()]
+
+    definitions = [f'"{name}" {SQLITE_TYPES.get(data_type, "TEXT")}' for name, data_type in columns]
+    if primary_key:
+        definitions.append('PRIMARY KEY (' + ', '.join(f'"{name}"' for name in primary_key) + ')')
+    target.execute(f'CREATE TABLE "{table}" ({", ".join(definitions)})')
+
+    column_names = ', '.join(f'"{name}"' for name, _ in columns)
+    insert = f'INSERT INTO "{table}" ({column_names}) VALUES ({", ".join("?" * len(columns))})'
+    nof_rows = 0
+    # a named cursor streams the rows instead of loading the whole table
+    with source.cursor(name=f'snapshot_{table}') as cursor:
+        cursor.itersize = FRAGMENT_SNAPSHOT_BATCH_SIZE
+        cursor.execute(f'SELECT {column_names} FROM "{table}"')
+        while True:
+            rows = cursor.fetchmany(FRAGMENT_SNAPSHOT_BATCH_SIZE)
+            if not rows:
+                break
+            target.executemany(insert, [[sqlite_value(value) for value in row] for row in rows])
+            nof_rows += len(rows)
+    return nof_rows
+
+
+def sqlite_value(value):
+    """Convert a postgres value into a value sqlite can store
+
+    :param value: value read from postgres
+    :return: sqlite compatible value
+    """
+    if isinstance(value, memoryview):
+        return bytes(value)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    if isinstance(value, (int, float, str, bytes)) or value is None:
+        return value
+    return str(value)
@@ -1,11 +1,18 @@
 """fast_grow celery tasks"""
 import logging
-from celery import shared_task
+import time
+from celery import current_app, group, shared_task
+from django.db import transaction
+from django.utils import timezone
+from kombu.exceptions import OperationalError
 from .tool_wrappers.preprocessor_wrapper import PreprocessorWrapper
 from .tool_wrappers.clipper_wrapper import ClipperWrapper
 from .tool_wrappers.fast_grow_wrapper import FastGrowWrapper
 from .tool_wrappers.interactions_wrapper import InteractionWrapper
 from .models import Ensemble, Core, SearchPointData, Status, Growing
+from .settings import SPECULATIVE_PRIORITY, GROWING_SLOTS, ADMISSION_LIMITS, \
+    GROWING_CACHE_MAX_HITS
+from . import eta, scheduler, tracing
 
 
 @shared_task
@@ -17,15 +24,71 @@ def preprocess_ensemble(ensemble_id):
     :raises Exception: re-raises exceptions encountered in job
     """
     ensemble = Ensemble.objects.get(id=ensemble_id)
+    ensemble.status = Status.RUNNING
+    ensemble.started = timezone.now()
+    ensemble.save()
     try:
         PreprocessorWrapper.preprocess(ensemble)
         ensemble.status = Status.SUCCESS
+        ensemble.finished = timezone.now()
         ensemble.save()
     except Exception as error:
         logging.error(error)
         ensemble.status = Status.FAILURE
+        ensemble.finished = timezone.now()
         ensemble.save()
         raise error
+    if ensemble.speculative:
+        speculate_interactions(ensemble)
+
+
+def speculate_interactions(ensemble):
+    """schedule interaction generation of every complex ligand pair of an ensemble at low priority
+
+    Pairs with successful or in-flight search point data are skipped, successful search point data
+    of identical contents is copied.
+
+    :param ensemble: preprocessed ensemble
+    :type ensemble: Ensemble
+    """
+    speculative_data = []
+    copies = []
+    for cmplx in ensemble.complex_set.all():
+        for ligand in ensemble.ligand_set.all():
+            cache_key = InteractionWrapper.cache_key(cmplx, ligand)
+            reusable = SearchPointData.find_reusable(cache_key, cmplx, ligand)
+            if reusable and reusable.id:
+                continue
+            if reusable:
+                reusable.speculative = True
+                copies.append(reusable)
+                continue
+            speculative_data.append(SearchPointData(
+                complex=cmplx, ligand=ligand, cache_key=cache_key, speculative=True))
+    SearchPointData.objects.bulk_create(speculative_data + copies)
+    for search_point_data in speculative_data:
+        result = generate_interactions.apply_async(
+            (search_point_data.id,), priority=SPECULATIVE_PRIORITY)
+        search_point_data.task_id = result.id
+    SearchPointData.objects.bulk_update(speculative_data, ['task_id'])
+
+
+def cancel_speculation(ensemble):
+    """cancel speculative interaction generations of an ensemble that did not start yet
+
+    :param ensemble: abandoned ensemble
+    :type ensemble: Ensemble
+    :return: number of cancelled generations
+    :rtype: int
+    """
+    pending = SearchPointData.objects.filter(
+        complex__ensemble=ensemble, speculative=True, status=Status.PENDING)
+    task_ids = [task_id for task_id in pending.values_list('task_id', flat=True) if task_id]
+    if task_ids:
+        current_app.control.revoke(task_ids)
+    # jobs that are picked up regardless find their data gone and skip the generation
+    cancelled, _ = pending.delete()
+    return cancelled
 
 
 @shared_task
@@ -37,17 +100,46 @@ def clip_ligand(core_id):
     :raises Exception: re-raises exceptions encountered in job
     """
     core = Core.objects.get(id=core_id)
+    core.status = Status.RUNNING
+    core.started = timezone.now()
+    core.save()
     try:
         ClipperWrapper.clip(core)
         core.status = Status.SUCCESS
+        core.finished = timezone.now()
         core.save()
     except Exception as error:
         logging.error(error)
         core.status = Status.FAILURE
+        core.finished = timezone.now()
         core.save()
         raise error
 
 
+@shared_task
+def clip_ligands(core_ids):
+    """clip ligands into several cores with a bounded pool of clipper processes
+
+    :param core_ids: ids of cores
+    :type core_ids: list
+    :raises Exception: re-raises the first exception encountered in the job
+    """
+    Core.objects.filter(id__in=core_ids).update(status=Status.RUNNING, started=timezone.now())
+    cores = list(Core.objects.select_related('ligand').filter(id__in=core_ids))
+    first_error = None
+    for core, error in ClipperWrapper.clip_many(cores):
+        if error:
+            logging.error(error)
+            core.status = Status.FAILURE
+            first_error = first_error or error
+        else:
+            core.status = Status.SUCCESS
+        core.finished = timezone.now()
+        core.save()
+    if first_error:
+        raise first_error
+
+
 @shared_task
 def generate_interactions(search_point_id):
     """generate interactions search points for a ligand and complex
@@ -56,33 +148,174 @@ def generate_interactions(search_point_id):
     :type search_point_id: int
     :raises Exception: re-raises exceptions encountered in job
     """
-    search_point_data = SearchPointData.objects.get(id=search_point_id)
+    # claiming the data fails if it was already processed or its speculative generation cancelled
+    if not SearchPointData.objects.filter(
+            id=search_point_id, status=Status.PENDING
+    ).update(status=Status.RUNNING, started=timezone.now()):
+        logging.info('search point data %d is not pending, skipping generation', search_point_id)
+        return
+    # file strings are only loaded if the inputs are not in the workspace yet
+    search_point_data = SearchPointData.objects.select_related('complex', 'ligand') \
+        .defer('complex__file_string', 'ligand__file_string').get(id=search_point_id)
     try:
         InteractionWrapper.generate(search_point_data)
         search_point_data.status = Status.SUCCESS
+        search_point_data.finished = timezone.now()
         search_point_data.save()
     except Exception as error:
         logging.error(error)
         search_point_data.status = Status.FAILURE
+        search_point_data.finished = timezone.now()
         search_point_data.save()
         raise error
 
 
+def schedule_growing(growing_id, client):
+    """queue a growing of a client with the fair-share scheduler and dispatch growings to free slots
+
+    Growings without an estimated run time are expected to take the typical growing runtime.
+
+    :param growing_id: id of a growing
+    :type growing_id: int
+    :param client: client identifier
+    :type client: str
+    """
+    growing = Growing.objects.select_related('fragment_set').get(id=growing_id)
+    expected_seconds = eta.expected_seconds(growing)
+    if expected_seconds is None:
+        expected_seconds = ADMISSION_LIMITS['grow']['runtime']
+    scheduler.submit(growing_id, client, expected_seconds)
+    dispatch_growings()
+
+
+def dispatch_growings():
+    """hand queued growings to celery while growing slots are free
+
+    Slots of growings that finished without being released are freed first. Growings dispatched
+    more than the stale_after seconds of the grow ADMISSION_LIMITS ago, e.g. to a lost worker, are
+    considered lost and fail. Growings are dispatched within the trace of the request that created
+    them, growings that cannot be published fail and free their slot.
+    """
+    stale = scheduler.dispatched_before(time.time() - ADMISSION_LIMITS['grow']['stale_after'])
+    if stale:
+        logging.warning('growings %s were dispatched too long ago, failing them', stale)
+        Growing.objects.filter(id__in=stale, status__in=[Status.PENDING, Status.RUNNING]) \
+            .update(status=Status.FAILURE, finished=timezone.now())
+    finished = Growing.objects.filter(id__in=scheduler.dispatched()) \
+        .exclude(status__in=[Status.PENDING, Status.RUNNING]).values_list('id', flat=True)
+    for growing_id in finished:
+        scheduler.release(growing_id)
+    taken = scheduler.take(GROWING_SLOTS)
+    traceparents = dict(Growing.objects.filter(id__in=taken).values_list('id', 'traceparent')) \
+        if taken and tracing.enabled() else {}
+    for growing_id in taken:
+        with tracing.span('dispatch', traceparents.get(growing_id), 'producer'):
+            try:
+                grow.delay(growing_id)
+            except (OperationalError, OSError):
+                logging.exception('cannot dispatch growing %d', growing_id)
+                Growing.objects.filter(id=growing_id, status=Status.PENDING).update(
+                    status=Status.FAILURE, finished=timezone.now())
+                scheduler.release(growing_id)
+
+
+def release_growing(growing_id):
+    """free the slot or queue entry of a finished or cancelled growing
+
+    :param growing_id: id of a growing
+    :type growing_id: int
+    """
+    scheduler.release(growing_id)
+    dispatch_growings()
+
+
 @shared_task
 def grow(growing_id):
     """perform a growing
 
+    Growings of partitioned fragment sets are split into one shard job per partition.
+
     :param growing_id: id of a growing
     :type growing_id: int
     :raises Exception: re-raises exceptions encountered in job
     """
-    growing = Growing.objects.get(id=growing_id)
+    # claiming the growing fails if it was cancelled before it started
+    if not Growing.objects.filter(
+            id=growing_id, status=Status.PENDING
+    ).update(status=Status.RUNNING, started=timezone.now()):
+        logging.info('growing %d is not pending, skipping growing', growing_id)
+        release_growing(growing_id)
+        return
+    growing = Growing.objects.select_related('fragment_set').get(id=growing_id)
+    if growing.fingerprint is None:
+        # the core was not clipped yet when the growing was created
+        growing.fingerprint = FastGrowWrapper.fingerprint(growing)
+        growing.save(update_fields=['fingerprint'])
+    if growing.fragment_set.partitions > 1:
+        growing.shards = growing.fragment_set.partitions
+        growing.save(update_fields=['shards'])
+        group(grow_shard.s(growing_id, shard) for shard in range(growing.shards)).apply_async()
+        return
+
     try:
         FastGrowWrapper.grow(growing)
-        growing.status = Status.SUCCESS
-        growing.save()
+        # a growing cancelled in the meantime stays cancelled
+        Growing.objects.filter(id=growing_id, status=Status.RUNNING).update(
+            status=Status.SUCCESS, finished=timezone.now())
+        eta.record_fragment_set_size(growing_id)
+    except Exception as error:
+        logging.error(error)
+        Growing.objects.filter(id=growing_id, status=Status.RUNNING).update(
+            status=Status.FAILURE, finished=timezone.now())
+        raise error
+    finally:
+        release_growing(growing_id)
+    # the hits of the growing joined the cache
+    Growing.evict_cache(GROWING_CACHE_MAX_HITS)
+
+
+@shared_task
+def grow_shard(growing_id, shard):
+    """grow a single fragment set partition adding its hits to the growing
+
+    :param growing_id: id of a growing
+    :type growing_id: int
+    :param shard: index of the fragment set partition
+    :type shard: int
+    :raises Exception: re-raises exceptions encountered in job
+    """
+    growing = Growing.objects.select_related('fragment_set').get(id=growing_id)
+    if growing.status != Status.RUNNING:
+        # another shard failed or the growing was cancelled
+        logging.info('growing %d is not running, skipping shard %d', growing_id, shard)
+        return
+    try:
+        FastGrowWrapper.grow(growing, growing.fragment_set.database_names()[shard])
     except Exception as error:
         logging.error(error)
-        growing.status = Status.FAILURE
-        growing.save()
+        Growing.objects.filter(id=growing_id, status=Status.RUNNING).update(
+            status=Status.FAILURE, finished=timezone.now())
+        release_growing(growing_id)
         raise error
+    if finish_shard(growing_id):
+        eta.record_fragment_set_size(growing_id)
+        release_growing(growing_id)
+        Growing.evict_cache(GROWING_CACHE_MAX_HITS)
+
+
+def finish_shard(growing_id):
+    """count a finished shard, a running growing succeeds once all of its shards finished
+
+    :param growing_id: id of a growing
+    :type growing_id: int
+    :return: whether all shards of the growing finished
+    :rtype: bool
+    """
+    with transaction.atomic():
+        growing = Growing.objects.select_for_update().get(id=growing_id)
+        growing.shards_finished += 1
+        if growing.shards_finished == growing.shards and growing.status == Status.RUNNING:
+            growing.status = Status.SUCCESS
+            growing.finished = timezone.now()
+        growing.save(update_fields=['shards_finished', 'status', 'finished'])
+    return growing.shards_finished == growing.shards
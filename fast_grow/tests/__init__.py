@@ -1,8 +1,24 @@
 """Import test cases here for convenient test discovery"""
+from .admission_tests import AdmissionTests
+from .benchmark_tests import BenchmarkTests
+from .chunk_statistics_tests import ChunkStatisticsTests
 from .complex_model_tests import ComplexModelTests
 from .core_model_tests import CoreModelTests
+from .eta_tests import EtaTests
+from .fast_grow_wrapper_tests import FastGrowWrapperTests
 from .ligand_model_tests import LigandModelTests
+from .preprocessor_wrapper_tests import PreprocessorWrapperTests
+from .profiler_tests import ProfilerTests
+from .runner_tests import RunnerTests
+from .scheduler_tests import SchedulerTests
+from .snapshot_tests import SnapshotTests
 from .growing_model_tests import GrowingModelTests
+from .instrumentation_tests import InstrumentationTests
+from .latency_tests import LatencyTests
+from .query_profiling_tests import QueryProfilingTests
 from .status_tests import StatusTests
 from .task_tests import TaskTests
+from .tool_simulator_tests import ToolSimulatorTests
+from .tracing_tests import TracingTests
 from .view_tests import ViewTests
+from .workspace_tests import WorkspaceTests
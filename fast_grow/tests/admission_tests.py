@@ -0,0 +1,68 @@
+"""Admission control tests"""
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase
+from django.utils import timezone
+from fast_grow.admission import admit, job_counts, metrics
+from fast_grow.models import Core, Status
+from .fixtures import test_ligand, test_core
+
+LIMITS = {'clip_ligand': {'max_queued': 2, 'runtime': 3}}
+STALE_LIMITS = {'clip_ligand': {'max_queued': 2, 'runtime': 3, 'stale_after': 60}}
+
+
+class AdmissionTests(TestCase):
+    """Admission control tests"""
+
+    def setUp(self):
+        """setUp creates a ligand to clip cores from"""
+        self.ligand = test_ligand()
+
+    def create_cores(self, status, nof_cores):
+        """Create cores with a status
+
+        :param status: status of the cores
+        :type status: str
+        :param nof_cores: number of cores to create
+        :type nof_cores: int
+        """
+        for _ in range(nof_cores):
+            core = test_core(self.ligand)
+            Core.objects.filter(id=core.id).update(status=status)
+
+    def test_job_counts(self):
+        """Test queued and running jobs are counted by status"""
+        self.create_cores(Status.PENDING, 2)
+        self.create_cores(Status.RUNNING, 1)
+        self.create_cores(Status.SUCCESS, 1)
+        self.assertEqual(job_counts('clip_ligand'), {'queued': 2, 'running': 1})
+
+    @mock.patch.dict('fast_grow.admission.ADMISSION_LIMITS', STALE_LIMITS, clear=True)
+    def test_job_counts_stale(self):
+        """Test jobs created before the stale limit are not counted"""
+        self.create_cores(Status.PENDING, 2)
+        Core.objects.filter(id=Core.objects.first().id).update(
+            created=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(job_counts('clip_ligand'), {'queued': 1, 'running': 0})
+
+    @mock.patch.dict('fast_grow.admission.ADMISSION_LIMITS', LIMITS, clear=True)
+    def test_admit(self):
+        """Test jobs are admitted until the queue limit is reached"""
+        self.create_cores(Status.PENDING, 1)
+        self.assertIsNone(admit('clip_ligand'))
+        self.assertEqual(admit('clip_ligand', 2), 3)
+
+    @mock.patch.dict('fast_grow.admission.ADMISSION_LIMITS', LIMITS, clear=True)
+    def test_admit_retry_after(self):
+        """Test the retry time grows with the excess and shrinks with the running jobs"""
+        self.create_cores(Status.PENDING, 2)
+        self.assertEqual(admit('clip_ligand', 4), 12)
+        self.create_cores(Status.RUNNING, 2)
+        self.assertEqual(admit('clip_ligand', 4), 6)
+
+    @mock.patch.dict('fast_grow.admission.ADMISSION_LIMITS', LIMITS, clear=True)
+    def test_metrics(self):
+        """Test metrics report counts, limits and admission per task"""
+        self.create_cores(Status.PENDING, 2)
+        self.assertEqual(metrics(), {'clip_ligand': {
+            'queued': 2, 'running': 0, 'max_queued': 2, 'admitting': False}})
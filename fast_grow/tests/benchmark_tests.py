@@ -0,0 +1,73 @@
+"""Benchmark tests"""
+import json
+import os
+from io import StringIO
+from tempfile import TemporaryDirectory
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from fast_grow.benchmarks import compare, measure, run
+from fast_grow.models import Ensemble, Growing
+
+
+class BenchmarkTests(TestCase):
+    """Benchmark tests"""
+
+    def test_measure(self):
+        """Test only the rounds after the warmup are timed and every round is reset"""
+        calls = []
+        result = measure(lambda: calls.append('operation'), lambda: calls.append('reset'),
+                         rounds=3, warmup=2)
+        self.assertEqual(calls, ['operation', 'reset'] * 5)
+        self.assertEqual(result['rounds'], 3)
+        self.assertLessEqual(result['min'], result['median'])
+        self.assertEqual(result['queries'], 0)
+
+    def test_run(self):
+        """Test every case of the selected benchmarks runs and its data is rolled back"""
+        results = run(['growing_dict', 'growing_detail'], rounds=1, warmup=0, label='test')
+        self.assertEqual(results['label'], 'test')
+        self.assertEqual(
+            [(result['name'], result['params']) for result in results['results']],
+            [('growing_dict', {'nof_hits': 10}), ('growing_dict', {'nof_hits': 100}),
+             ('growing_dict', {'nof_hits': 1000}), ('growing_detail', {'nof_hits': 100}),
+             ('growing_detail', {'nof_hits': 1000})])
+        self.assertTrue(all(result['queries'] > 0 for result in results['results']))
+        self.assertFalse(Growing.objects.exists())
+        self.assertFalse(Ensemble.objects.exists())
+
+    def test_compare(self):
+        """Test cases are compared by name and parameters"""
+        baseline = {'results': [
+            {'name': 'add_hits', 'params': {'nof_hits': 100, 'nof_complexes': 1}, 'median': 2.0},
+            {'name': 'add_hits', 'params': {'nof_hits': 1000, 'nof_complexes': 1}, 'median': 4.0}
+        ]}
+        current = {'results': [
+            {'name': 'add_hits', 'params': {'nof_complexes': 1, 'nof_hits': 100}, 'median': 3.0},
+            {'name': 'ensemble_write', 'params': {'nof_complexes': 1}, 'median': 1.0}
+        ]}
+        comparison = compare(baseline, current)
+        self.assertEqual(len(comparison), 1)
+        self.assertEqual(comparison[0]['baseline'], 2.0)
+        self.assertEqual(comparison[0]['ratio'], 1.5)
+
+    def test_command(self):
+        """Test results are written as JSON and regressions to an earlier run fail"""
+        with TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'benchmarks.json')
+            call_command('benchmark', 'core_detail', '--rounds', '1', '--output', output,
+                         stdout=StringIO())
+            with open(output, encoding='utf8') as output_file:
+                results = json.load(output_file)
+            self.assertEqual([result['name'] for result in results['results']], ['core_detail'])
+
+            # an earlier run a hundred times as fast
+            results['results'][0]['median'] /= 100
+            baseline = os.path.join(directory, 'baseline.json')
+            with open(baseline, 'w', encoding='utf8') as baseline_file:
+                json.dump(results, baseline_file)
+            with self.assertRaises(CommandError):
+                call_command('benchmark', 'core_detail', '--rounds', '1', '--output', output,
+                             '--compare', baseline, stdout=StringIO())
+            with self.assertRaises(CommandError):
+                call_command('benchmark', 'unknown', '--output', output, stdout=StringIO())
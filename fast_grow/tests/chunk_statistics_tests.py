@@ -0,0 +1,66 @@
+"""Chunk statistics model tests"""
+from django.test import TestCase
+from fast_grow.models import ChunkStatistics, FragmentSet
+from fast_grow.settings import CHUNK_SIZE, CHUNK_SIZES, CHUNK_MIN_SAMPLES, CHUNK_MAX_LAG
+
+
+class ChunkStatisticsTests(TestCase):
+    """Chunk statistics model tests"""
+
+    def setUp(self):
+        """setUp creates a fragment set to record statistics for"""
+        self.fragment_set = FragmentSet(name='chunk statistics fragment set')
+        self.fragment_set.save()
+
+    def sample(self, chunk_size, fragments_per_second, lag=0):
+        """Record CHUNK_MIN_SAMPLES identical growings of 10 chunks
+
+        :param chunk_size: chunk size of the growings
+        :type chunk_size: int
+        :param fragments_per_second: throughput of the growings
+        :type fragments_per_second: float
+        :param lag: ingestion lag of the growings
+        :type lag: float
+        """
+        for _ in range(CHUNK_MIN_SAMPLES):
+            ChunkStatistics.record(
+                self.fragment_set, 1, chunk_size, 10 * chunk_size / fragments_per_second,
+                nof_chunks=10, nof_hits=5, lags=[lag])
+
+    def test_record(self):
+        """Test growings are averaged into the statistics"""
+        ChunkStatistics.record(self.fragment_set, 1, 100, 10, nof_chunks=10, nof_hits=20, lags=[1])
+        ChunkStatistics.record(self.fragment_set, 1, 100, 20, nof_chunks=10, nof_hits=0, lags=[3])
+        ChunkStatistics.record(self.fragment_set, 1, 100, 10, nof_chunks=0, nof_hits=0, lags=[])
+        statistics = ChunkStatistics.objects.get(fragment_set=self.fragment_set, chunk_size=100)
+        self.assertEqual(statistics.samples, 2)
+        self.assertAlmostEqual(statistics.fragments_per_second, 75)
+        self.assertAlmostEqual(statistics.hits_per_chunk, 1)
+        self.assertAlmostEqual(statistics.ingestion_lag, 2)
+
+    def test_choose_chunk_size(self):
+        """Test the controller explores neighbouring chunk sizes and keeps the fastest"""
+        self.assertEqual(ChunkStatistics.choose_chunk_size(self.fragment_set, 1), CHUNK_SIZE)
+        index = CHUNK_SIZES.index(CHUNK_SIZE)
+        smaller, larger = CHUNK_SIZES[index - 1], CHUNK_SIZES[index + 1]
+        self.sample(CHUNK_SIZE, 100)
+        self.assertEqual(ChunkStatistics.choose_chunk_size(self.fragment_set, 1), smaller)
+        self.sample(smaller, 50)
+        self.assertEqual(ChunkStatistics.choose_chunk_size(self.fragment_set, 1), larger)
+        self.sample(larger, 80)
+        self.assertEqual(ChunkStatistics.choose_chunk_size(self.fragment_set, 1), CHUNK_SIZE)
+        # other ensemble sizes are tracked separately
+        self.assertEqual(ChunkStatistics.choose_chunk_size(self.fragment_set, 2), CHUNK_SIZE)
+
+    def test_choose_chunk_size_lag(self):
+        """Test chunk sizes ingested too late are avoided"""
+        index = CHUNK_SIZES.index(CHUNK_SIZE)
+        smaller, larger = CHUNK_SIZES[index - 1], CHUNK_SIZES[index + 1]
+        self.sample(CHUNK_SIZE, 100, lag=CHUNK_MAX_LAG + 1)
+        self.sample(smaller, 50)
+        self.sample(larger, 200, lag=CHUNK_MAX_LAG + 1)
+        # the fastest timely size is the smaller one, its own smaller neighbour is tried next
+        smallest = CHUNK_SIZES[index - 2]
+        self.assertEqual(ChunkStatistics.choose_chunk_size(self.fragment_set, 1), smallest)
+        self.sample(smallest, 40)
+        self.assertEqual(ChunkStatistics.choose_chunk_size(self.fragment_set, 1), smaller)
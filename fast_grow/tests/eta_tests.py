@@ -0,0 +1,84 @@
+"""Growing run-time estimate tests"""
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from fast_grow import eta
+from fast_grow.models import ChunkStatistics, FragmentSet, Growing, Status
+from .fixtures import cached_growing
+
+
+class EtaTests(TestCase):
+    """Growing run-time estimate tests"""
+
+    def setUp(self):
+        """setUp creates a pending growing of 1000 fragments"""
+        self.growing = cached_growing()
+        self.growing.status = Status.PENDING
+        self.growing.save()
+        self.fragment_set = self.growing.fragment_set
+        self.fragment_set.size = 1000
+        self.fragment_set.save()
+        self.ensemble_size = self.growing.ensemble.complex_set.count()
+
+    def record(self, ensemble_size, fragments_per_second, samples=1):
+        """Record the throughput of growings
+
+        :param ensemble_size: number of complexes in the ensembles
+        :type ensemble_size: int
+        :param fragments_per_second: throughput of the growings
+        :type fragments_per_second: float
+        :param samples: number of growings
+        :type samples: int
+        """
+        ChunkStatistics(fragment_set=self.fragment_set, ensemble_size=ensemble_size,
+                        chunk_size=100, samples=samples,
+                        fragments_per_second=fragments_per_second).save()
+
+    def test_recorded_throughput(self):
+        """Test the throughput of the nearest recorded ensemble size is scaled to the ensemble"""
+        self.assertIsNone(eta.recorded_throughput(self.fragment_set, 2))
+        self.record(1, 40)
+        self.record(4, 10)
+        self.assertAlmostEqual(eta.recorded_throughput(self.fragment_set, 1), 40)
+        self.assertAlmostEqual(eta.recorded_throughput(self.fragment_set, 8), 5)
+
+    def test_expected_seconds(self):
+        """Test the run time of a pending growing follows from size and throughput"""
+        self.assertIsNone(eta.expected_seconds(self.growing))
+        self.record(self.ensemble_size, 10)
+        self.assertAlmostEqual(eta.expected_seconds(self.growing), 100)
+        self.fragment_set.partitions = 4
+        self.assertAlmostEqual(eta.expected_seconds(self.growing), 25)
+        self.growing.time_budget = 10
+        self.assertAlmostEqual(eta.expected_seconds(self.growing), 10)
+        self.assertEqual(eta.estimate(self.growing), {'progress': 0, 'seconds': 10})
+
+    def test_estimate_running(self):
+        """Test the estimate of a running growing converges on its observed throughput"""
+        self.record(self.ensemble_size, 10)
+        self.growing.status = Status.RUNNING
+        self.growing.started = timezone.now() - timedelta(seconds=10)
+        self.growing.fragments_processed = 500
+        estimate = eta.estimate(self.growing)
+        self.assertAlmostEqual(estimate['progress'], 0.5)
+        # half way the throughput is the mean of 10 recorded and 50 observed fragments per second
+        self.assertAlmostEqual(estimate['seconds'], 500 / 30, places=1)
+
+        self.fragment_set.size = None
+        self.assertEqual(eta.estimate(self.growing), {'progress': None, 'seconds': None})
+
+    def test_record_fragment_set_size(self):
+        """Test the fragment set size is learned from complete growings only"""
+        fragment_set = FragmentSet(name='unknown size')
+        fragment_set.save()
+        Growing.objects.filter(id=self.growing.id).update(
+            fragment_set=fragment_set, status=Status.SUCCESS, fragments_processed=300,
+            stop_reason='10 hits found')
+        eta.record_fragment_set_size(self.growing.id)
+        fragment_set.refresh_from_db()
+        self.assertIsNone(fragment_set.size)
+
+        Growing.objects.filter(id=self.growing.id).update(stop_reason=None)
+        eta.record_fragment_set_size(self.growing.id)
+        fragment_set.refresh_from_db()
+        self.assertEqual(fragment_set.size, 300)
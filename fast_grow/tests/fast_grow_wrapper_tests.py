@@ -0,0 +1,114 @@
+"""Fast grow wrapper tests"""
+import os
+import shutil
+import subprocess
+from tempfile import TemporaryDirectory
+from unittest import mock
+from django.test import TestCase
+from fast_grow.models import Growing, Status
+from fast_grow.tool_wrappers.fast_grow_wrapper import FastGrowWrapper, HitReader
+from .fixtures import TEST_FILES, cached_growing
+
+
+class FastGrowWrapperTests(TestCase):
+    """Fast grow wrapper tests"""
+
+    def test_current_status(self):
+        """Test cancellation of a growing and failures of other shards are noticed"""
+        growing = cached_growing()
+        for status in [Status.RUNNING, Status.CANCELLED, Status.FAILURE]:
+            Growing.objects.filter(id=growing.id).update(status=status)
+            self.assertEqual(FastGrowWrapper.current_status(growing), status)
+
+    def test_stop_reason(self):
+        """Test each stop criterion is met once the growing reaches it"""
+        growing = cached_growing()
+        self.assertIsNone(FastGrowWrapper.stop_reason(growing, 3600))
+
+        growing.max_hits = 6
+        self.assertIsNone(FastGrowWrapper.stop_reason(growing, 0))
+        growing.max_hits = 5
+        self.assertEqual(FastGrowWrapper.stop_reason(growing, 0), '5 hits found')
+        growing.max_hits = None
+
+        # lower scores are better, the cached growing has hits scored 0 to 4
+        growing.score_threshold = 1.0
+        growing.score_threshold_hits = 3
+        self.assertIsNone(FastGrowWrapper.stop_reason(growing, 0))
+        growing.score_threshold = 2.0
+        self.assertEqual(
+            FastGrowWrapper.stop_reason(growing, 0), '3 hits scored 2.0 or better')
+        growing.score_threshold = None
+
+        growing.time_budget = 60
+        self.assertIsNone(FastGrowWrapper.stop_reason(growing, 59.5))
+        self.assertEqual(
+            FastGrowWrapper.stop_reason(growing, 60), 'time budget of 60s exhausted')
+
+    def test_fingerprint_stop_criteria(self):
+        """Test stop criteria distinguish otherwise identical growings"""
+        growing = cached_growing()
+        fingerprint = FastGrowWrapper.fingerprint(growing)
+        self.assertEqual(fingerprint, growing.fingerprint)
+        growing.max_hits = 10
+        self.assertNotEqual(FastGrowWrapper.fingerprint(growing), fingerprint)
+
+    def test_fingerprint_pending_core(self):
+        """Test growings of cores that are not clipped yet have no fingerprint"""
+        growing = cached_growing()
+        growing.core.status = Status.PENDING
+        growing.core.file_type = growing.core.file_string = None
+        self.assertIsNone(FastGrowWrapper.fingerprint(growing))
+
+    def test_fingerprint_fragment_set_version(self):
+        """Test rebuilt fragment sets do not serve growings of their previous databases"""
+        growing = cached_growing()
+        growing.fragment_set.version += 1
+        self.assertNotEqual(FastGrowWrapper.fingerprint(growing), growing.fingerprint)
+
+    def test_add_hits(self):
+        """Test the hits of a hits file are added to a growing"""
+        growing = cached_growing()
+        nof_hits = growing.hit_set.count()
+        nof_file_hits = FastGrowWrapper.add_hits(
+            growing, os.path.join(TEST_FILES, 'P86_A_400_18_2_hits.sdf'))
+        self.assertGreater(nof_file_hits, 0)
+        self.assertEqual(growing.hit_set.count(), nof_hits + nof_file_hits)
+
+    def test_hit_reader(self):
+        """Test the reader parses every hits file once and is done after the process exited"""
+        with TemporaryDirectory() as directory:
+            shutil.copy(os.path.join(TEST_FILES, 'P86_A_400_18_2_hits.sdf'), directory)
+            process = subprocess.Popen(['true'])
+            reader = HitReader(process, directory, [])
+            reader.start()
+            files = []
+            while not reader.done:
+                files.extend(reader.get(timeout=1))
+            reader.join()
+        self.assertEqual(len(files), 1)
+        self.assertGreater(len(files[0].hits), 0)
+        self.assertIsNone(files[0].hits[0].growing_id)
+
+    def test_hit_reader_stop(self):
+        """Test a reader blocked on a full queue stops"""
+        with TemporaryDirectory() as directory:
+            for index in range(3):
+                shutil.copy(os.path.join(TEST_FILES, 'P86_A_400_18_2_hits.sdf'),
+                            os.path.join(directory, f'hits_{index}.sdf'))
+            process = subprocess.Popen(['sleep', '60'])
+            try:
+                with mock.patch.object(HitReader, 'POLL_INTERVAL', 0.01), \
+                        mock.patch('fast_grow.tool_wrappers.fast_grow_wrapper.HIT_QUEUE_SIZE', 1):
+                    reader = HitReader(process, directory, [])
+                reader.start()
+                # the reader blocks on the second file, nothing is taken out of the queue
+                reader.join(timeout=0.5)
+                self.assertTrue(reader.queue.full())
+                reader.stop()
+                reader.join(timeout=5)
+                self.assertFalse(reader.is_alive())
+                self.assertFalse(reader.done)
+            finally:
+                process.kill()
+                process.wait()
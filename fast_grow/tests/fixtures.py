@@ -5,6 +5,7 @@ import subprocess
 from fast_grow_server import settings
 from fast_grow.models import Core, Complex, Ensemble, FragmentSet, Growing, Hit, Ligand, \
     SearchPointData, Status
+from fast_grow.tool_wrappers.fast_grow_wrapper import FastGrowWrapper
 
 TEST_FILES = os.path.join(settings.BASE_DIR, 'fast_grow', 'tests', 'test_files')
 
@@ -201,23 +202,32 @@ def test_fragment_set():
     :rtype: FragmentSet
     """
     fragment_set_name = 'test fragment set'
+    restore_test_fragment_database(fragment_set_name)
+    fragment_set = FragmentSet(name=fragment_set_name, description='A test fragment set')
+    fragment_set.save()
+    return fragment_set
+
+
+def restore_test_fragment_database(database_name):
+    """Restore the test fragment set into a database
+
+    :param database_name: name of the database to create
+    :type database_name: str
+    """
     fragment_set_path = os.path.join(TEST_FILES, 'test_fragment_set.tar')
     subprocess.check_call([
         'createdb',
         '-h', settings.DATABASES['default']['HOST'],
         '-U', settings.DATABASES['default']['USER'],
-        fragment_set_name
+        database_name
     ])
     subprocess.check_call([
         'pg_restore',
         '-h', settings.DATABASES['default']['HOST'],
         '-U', settings.DATABASES['default']['USER'],
         '-n', 'public',  # Only restore data from the public schema.
-        '-d', fragment_set_name, fragment_set_path
+        '-d', database_name, fragment_set_path
     ])
-    fragment_set = FragmentSet(name=fragment_set_name, description='A test fragment set')
-    fragment_set.save()
-    return fragment_set
 
 
 def delete_test_fragment_set(fragment_set_name):
@@ -276,6 +286,27 @@ def search_point_growing():
     return growing
 
 
+def sharded_growing():
+    """Create a running test growing of a fragment set with two partitions
+
+    Both partitions contain the whole test fragment set.
+
+    :return: test growing of a partitioned fragment set
+    :rtype: Growing
+    """
+    ensemble = processed_single_ensemble()
+    core = test_core(ensemble.ligand_set.first())
+    fragment_set = FragmentSet(
+        name='test fragment set', description='A partitioned test fragment set', partitions=2)
+    fragment_set.save()
+    for database_name in fragment_set.database_names():
+        restore_test_fragment_database(database_name)
+    growing = Growing(
+        ensemble=ensemble, core=core, fragment_set=fragment_set, shards=2, status=Status.RUNNING)
+    growing.save()
+    return growing
+
+
 def ensemble_growing():
     """Create a test ensemble growing
 
@@ -355,3 +386,32 @@ def processed_ensemble_search_point_growing():
         )
         hit.save()
     return growing
+
+
+def cached_growing():
+    """Create a successful growing serving as a cache entry
+
+    The fragment set is not backed by an actual database.
+
+    :return: successful growing with a fingerprint and hits
+    :rtype: Growing
+    """
+    ensemble = processed_single_ensemble()
+    core = test_core(ensemble.ligand_set.first())
+    fragment_set = FragmentSet(name='cached fragment set')
+    fragment_set.save()
+    growing = Growing(
+        ensemble=ensemble, core=core, fragment_set=fragment_set, status=Status.SUCCESS)
+    growing.fingerprint = FastGrowWrapper.fingerprint(growing)
+    growing.save()
+    for i in range(5):
+        hit = Hit(
+            growing=growing,
+            name='hit' + str(i),
+            score=float(i),
+            file_type='sdf',
+            file_string='',
+            ensemble_scores={}
+        )
+        hit.save()
+    return growing
@@ -1,7 +1,10 @@
 """Tests for the growing model"""
 import subprocess
 from django.test import TestCase
-from .fixtures import processed_ensemble_search_point_growing, delete_test_fragment_set
+from django.utils import timezone
+from fast_grow.models import Growing, Status
+from .fixtures import processed_ensemble_search_point_growing, delete_test_fragment_set, \
+    cached_growing, processed_single_ensemble, test_core
 
 
 class GrowingModelTests(TestCase):
@@ -20,3 +23,50 @@ class GrowingModelTests(TestCase):
             self.assertIn(bytes('growing/hits.sdf', encoding='utf8'), zip_contents)
         finally:
             delete_test_fragment_set(growing.fragment_set.name)
+
+    def test_copy_hits(self):
+        """Test hits of a cached growing are copied to another growing"""
+        source = cached_growing()
+        growing = Growing(ensemble=source.ensemble, core=source.core,
+                          fragment_set=source.fragment_set)
+        growing.save()
+        growing.copy_hits(source)
+        self.assertEqual(growing.hit_set.count(), source.hit_set.count())
+        self.assertEqual(
+            list(growing.hit_set.order_by('score').values_list('name', 'score')),
+            list(source.hit_set.order_by('score').values_list('name', 'score'))
+        )
+
+    def test_cached_hits(self):
+        """Test growings taken from the cache share its hits until the cached growing is deleted"""
+        source = cached_growing()
+        ensemble = processed_single_ensemble()
+        growing = Growing(ensemble=ensemble, core=test_core(ensemble.ligand_set.first()),
+                          fragment_set=source.fragment_set, status=Status.SUCCESS,
+                          cached_from=source)
+        growing.save()
+        self.assertEqual(growing.hits.count(), 5)
+        self.assertEqual(growing.hit_set.count(), 0)
+        self.assertEqual(len(growing.dict()['hits']), 5)
+
+        source.ensemble.delete()
+        growing.refresh_from_db()
+        self.assertIsNone(growing.cached_from)
+        self.assertEqual(growing.hit_set.count(), 5)
+
+    def test_evict_cache(self):
+        """Test least recently used and superseded cache entries are evicted"""
+        old_growing = cached_growing()
+        recent_growing = cached_growing()
+        recent_growing.cache_accessed = timezone.now()
+        recent_growing.save()
+        self.assertEqual(old_growing.fingerprint, recent_growing.fingerprint)
+
+        self.assertEqual(Growing.evict_cache(max_hits=100), 1)
+        self.assertIsNone(Growing.objects.get(id=old_growing.id).fingerprint)
+        self.assertIsNotNone(Growing.objects.get(id=recent_growing.id).fingerprint)
+
+        # the remaining entry does not fit into the budget anymore
+        self.assertEqual(Growing.evict_cache(max_hits=4), 1)
+        self.assertIsNone(Growing.find_cached(recent_growing.fingerprint))
+        self.assertEqual(recent_growing.hit_set.count(), 5)
@@ -0,0 +1,74 @@
+"""Instrumentation tests"""
+import time
+from unittest import mock
+from django.test import TestCase
+from fast_grow import instrumentation
+
+
+class InstrumentationTests(TestCase):
+    """Instrumentation tests"""
+
+    def setUp(self):
+        """setUp starts from no pending observations"""
+        instrumentation._PENDING.clear()  # pylint: disable=protected-access
+
+    @mock.patch('fast_grow.instrumentation.flush')
+    def test_observe(self, _):
+        """Test a stage duration is counted into the smallest bucket holding it"""
+        instrumentation.observe('binary', 0.3, task='grow')
+        pending = instrumentation._PENDING  # pylint: disable=protected-access
+        labels = {'task': 'grow', 'stage': 'binary'}
+        for bound, count in [(0.1, 0), (0.5, 1), (1, 0), ('+Inf', 0)]:
+            name = instrumentation.sample_name('fast_grow_stage_seconds_bucket',
+                                               {**labels, 'le': bound})
+            self.assertEqual(pending[name], count)
+        self.assertEqual(
+            pending[instrumentation.sample_name('fast_grow_stage_seconds_count', labels)], 1)
+        self.assertAlmostEqual(
+            pending[instrumentation.sample_name('fast_grow_stage_seconds_sum', labels)], 0.3)
+
+    @mock.patch('fast_grow.instrumentation.connection')
+    def test_flush(self, connection):
+        """Test pending observations are added to redis once"""
+        instrumentation.increment('fast_grow_workspace_total', {'result': 'hit'}, 2)
+        instrumentation.flush()
+        instrumentation.flush()
+        pipeline = connection.return_value.pipeline.return_value
+        pipeline.hincrbyfloat.assert_called_once_with(
+            instrumentation.KEY, 'fast_grow_workspace_total{result="hit"}', 2)
+        pipeline.execute.assert_called_once()
+
+    @mock.patch('fast_grow.instrumentation.admission_metrics', return_value={
+        'grow': {'queued': 3, 'running': 1, 'max_queued': 100, 'admitting': True}})
+    @mock.patch('fast_grow.instrumentation.connection')
+    def test_render(self, connection, _):
+        """Test metrics are rendered in the prometheus text format with cumulative buckets"""
+        connection.return_value.hgetall.return_value = {
+            'fast_grow_stage_seconds_bucket{task="grow",stage="binary",le="10"}': '1',
+            'fast_grow_stage_seconds_bucket{task="grow",stage="binary",le="5"}': '1',
+            'fast_grow_stage_seconds_count{task="grow",stage="binary"}': '2',
+            'fast_grow_stage_seconds_sum{task="grow",stage="binary"}': '12.5',
+        }
+        lines = instrumentation.render().splitlines()
+        self.assertIn('# TYPE fast_grow_stage_seconds histogram', lines)
+        buckets = [line for line in lines if line.startswith('fast_grow_stage_seconds_bucket')]
+        counts = [(bound, 0) for bound in instrumentation.STAGE_BUCKETS if bound < 5] + [(5, 1)] \
+            + [(bound, 2) for bound in instrumentation.STAGE_BUCKETS if bound > 5] + [('+Inf', 2)]
+        self.assertEqual(buckets, [
+            f'fast_grow_stage_seconds_bucket{{task="grow",stage="binary",le="{bound}"}} {count}'
+            for bound, count in counts
+        ])
+        self.assertIn('fast_grow_stage_seconds_sum{task="grow",stage="binary"} 12.5', lines)
+        self.assertIn('# TYPE fast_grow_jobs_queued gauge', lines)
+        self.assertIn('fast_grow_jobs_queued{task="grow"} 3', lines)
+
+    @mock.patch('fast_grow.instrumentation.METRICS_FLUSH_INTERVAL', 3600)
+    def test_overhead(self):
+        """Test timing a stage costs far less than the stages it times"""
+        nof_observations = 10000
+        started = time.perf_counter()
+        for _ in range(nof_observations):
+            with instrumentation.timer('parse', task='grow'):
+                pass
+        overhead = (time.perf_counter() - started) / nof_observations
+        self.assertLess(overhead, 50e-6)
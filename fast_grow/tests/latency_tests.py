@@ -0,0 +1,85 @@
+"""Job latency tests"""
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from fast_grow.latency import percentile, report
+from fast_grow.models import Core, Growing, Status
+from .fixtures import test_ligand, test_core, cached_growing
+
+
+class LatencyTests(TestCase):
+    """Job latency tests"""
+
+    def setUp(self):
+        """setUp creates a ligand to clip cores from"""
+        self.ligand = test_ligand()
+
+    def create_core(self, queue_seconds, run_seconds, status=Status.SUCCESS):
+        """Create a finished core job
+
+        :param queue_seconds: seconds the job was queued
+        :type queue_seconds: float
+        :param run_seconds: seconds the job ran
+        :type run_seconds: float
+        :param status: final status of the job
+        :type status: str
+        """
+        core = test_core(self.ligand)
+        started = core.created + timedelta(seconds=queue_seconds)
+        Core.objects.filter(id=core.id).update(
+            status=status, started=started, finished=started + timedelta(seconds=run_seconds))
+
+    def test_percentile(self):
+        """Test percentiles are computed by the nearest rank"""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 95), 3)
+        self.assertIsNone(percentile([], 50))
+
+    def test_report(self):
+        """Test queue latencies count all started jobs and run latencies successful ones"""
+        for seconds in range(1, 11):
+            self.create_core(seconds, 10 * seconds)
+        self.create_core(100, 1000, Status.FAILURE)
+        # jobs that did not start yet are not counted
+        test_core(self.ligand)
+
+        groups = report()
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(groups[0]['task'], 'clip_ligand')
+        self.assertIsNone(groups[0]['fragment_set'])
+        self.assertEqual(groups[0]['ensemble_size'], 0)
+        self.assertEqual(groups[0]['jobs'], 11)
+        self.assertEqual(groups[0]['queue'], {'p50': 6, 'p95': 100, 'p99': 100})
+        self.assertEqual(groups[0]['run'], {'p50': 50, 'p95': 100, 'p99': 100})
+
+        self.assertEqual(report(timezone.now() + timedelta(minutes=1)), [])
+
+    def test_report_growings(self):
+        """Test growings are grouped by fragment set and ensemble size"""
+        growing = cached_growing()
+        Growing.objects.filter(id=growing.id).update(
+            started=growing.created + timedelta(seconds=2),
+            finished=growing.created + timedelta(seconds=5))
+        groups = [group for group in report() if group['task'] == 'grow']
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(groups[0]['fragment_set'], 'cached fragment set')
+        self.assertEqual(groups[0]['ensemble_size'], growing.ensemble.complex_set.count())
+        self.assertEqual(groups[0]['queue']['p50'], 2)
+        self.assertEqual(groups[0]['run']['p50'], 3)
+
+    def test_job_latency_view(self):
+        """Test the latency route is only available to staff users"""
+        self.create_core(1, 2)
+        response = self.client.get('/metrics/latency')
+        self.assertEqual(response.status_code, 403)
+
+        user = get_user_model().objects.create_user('admin', is_staff=True)
+        self.client.force_login(user)
+        response = self.client.get('/metrics/latency', {'days': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['run']['p50'], 2)
+        response = self.client.get('/metrics/latency', {'days': 'x'})
+        self.assertEqual(response.status_code, 400)
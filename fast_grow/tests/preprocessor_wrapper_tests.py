@@ -0,0 +1,40 @@
+"""Preprocessor wrapper tests"""
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from django.test import TestCase
+from fast_grow.tool_wrappers.preprocessor_wrapper import PreprocessorWrapper
+from .fixtures import TEST_FILES, single_ensemble
+
+
+class PreprocessorWrapperTests(TestCase):
+    """Preprocessor wrapper tests"""
+
+    def test_load_results(self):
+        """Test results replace the original complexes and extracted ligands are loaded"""
+        ensemble = single_ensemble()
+        original_ids = set(ensemble.complex_set.values_list('id', flat=True))
+        with TemporaryDirectory() as directory:
+            for name in ['4agm', '4agn']:
+                with open(os.path.join(TEST_FILES, name + '_clean.pdb'), encoding='utf8') as source:
+                    Path(directory, name + '.pdb').write_text(source.read(), encoding='utf8')
+            with open(os.path.join(TEST_FILES, 'P86_A_400.sdf'), encoding='utf8') as source:
+                Path(directory, 'P86_A_400.sdf').write_text(source.read(), encoding='utf8')
+            PreprocessorWrapper.load_results(Path(directory), ensemble)
+
+        self.assertEqual(ensemble.complex_set.count(), 2)
+        self.assertFalse(original_ids & set(ensemble.complex_set.values_list('id', flat=True)))
+        self.assertEqual(
+            sorted(ensemble.complex_set.values_list('name', flat=True)), ['4agm', '4agn'])
+        self.assertEqual(ensemble.ligand_set.count(), 1)
+
+    def test_load_results_fail(self):
+        """Test a failure while loading results leaves the ensemble untouched"""
+        ensemble = single_ensemble()
+        original_ids = set(ensemble.complex_set.values_list('id', flat=True))
+        with TemporaryDirectory() as directory:
+            Path(directory, 'broken.pdb').write_bytes(b'\xff\xfe')
+            with self.assertRaises(UnicodeDecodeError):
+                PreprocessorWrapper.load_results(Path(directory), ensemble)
+        self.assertEqual(set(ensemble.complex_set.values_list('id', flat=True)), original_ids)
+        self.assertEqual(ensemble.ligand_set.count(), 0)
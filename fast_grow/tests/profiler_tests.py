@@ -0,0 +1,116 @@
+"""Sampling profiler tests"""
+import os
+import threading
+import time
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest import mock
+from django.test import TestCase
+from fast_grow import profiler
+from .fixtures import multi_ensemble
+
+
+def busy(seconds):
+    """Keep the CPU busy
+
+    :param seconds: seconds to keep busy for
+    :type seconds: float
+    """
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+class ProfilerTests(TestCase):
+    """Sampling profiler tests"""
+
+    def setUp(self):
+        """setUp writes profiles to a temporary directory"""
+        directory = TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        patcher = mock.patch('fast_grow.profiler.PROFILE_DIR', self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self, path):
+        """Read a folded profile
+
+        :param path: path of the profile
+        :type path: str
+        :return: sample counts by stack
+        :rtype: dict
+        """
+        self.assertEqual(os.path.dirname(path), self.directory)
+        with open(path, encoding='utf8') as profile_file:
+            lines = [line.rsplit(' ', 1) for line in profile_file.read().splitlines()]
+        return {stack: int(count) for stack, count in lines}
+
+    def test_profile(self):
+        """Test the stacks of the profiled thread are folded with the thread as root"""
+        with profiler.profile('test', [threading.get_ident()]) as sampler:
+            busy(0.1)
+        stacks = self.read(sampler.path)
+        self.assertEqual(sum(stacks.values()), sampler.samples)
+        self.assertGreater(sampler.samples, 5)
+        busy_samples = sum(count for stack, count in stacks.items()
+                           if stack.endswith('fast_grow.tests.profiler_tests:busy'))
+        self.assertGreater(busy_samples, sampler.samples / 2)
+        self.assertTrue(all(stack.startswith('MainThread;') for stack in stacks))
+
+    @mock.patch('fast_grow.profiler.PROFILE_MAX_FILES', 2)
+    def test_rotate(self):
+        """Test only the newest profiles are kept"""
+        paths = []
+        for name in ['first', 'second', 'third']:
+            with profiler.profile(name) as sampler:
+                pass
+            os.utime(sampler.path, (len(paths), len(paths)))
+            paths.append(sampler.path)
+            profiler.rotate()
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         sorted(os.path.basename(path) for path in paths[1:]))
+
+    @mock.patch('fast_grow.profiler.PROFILE_TOKEN', 'secret')
+    def test_middleware(self):
+        """Test only requests with the profile token are profiled"""
+        ensemble = multi_ensemble()
+        response = self.client.get(f'/complex/{ensemble.id}', HTTP_X_PROFILE='wrong')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+        response = self.client.get(f'/complex/{ensemble.id}', HTTP_X_PROFILE='secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['X-Profile'].endswith(f'-GET_complex_{ensemble.id}.folded'))
+        self.assertEqual(os.listdir(self.directory), [response['X-Profile']])
+
+    def test_job(self):
+        """Test profiled jobs sample all threads of the worker"""
+        task = SimpleNamespace(name='fast_grow.tasks.grow')
+        with mock.patch('fast_grow.profiler.connection') as connection:
+            members = []
+            pipeline = connection.return_value.pipeline.return_value
+            pipeline.sismember.side_effect = lambda _key, job: members.append(job in {'grow:1'})
+            pipeline.execute.side_effect = lambda: members.copy()
+            profiler.start_job(task_id='other', task=task, args=[2])
+            self.assertEqual(profiler._JOBS, {})  # pylint: disable=protected-access
+            members.clear()
+            profiler.start_job(task_id='job', task=task, args=[1])
+        reader = threading.Thread(target=busy, args=(0.1,), name='hit reader')
+        reader.start()
+        reader.join()
+        _, sampler = profiler._JOBS['job']  # pylint: disable=protected-access
+        profiler.finish_job(task_id='job')
+        self.assertIn('grow:1-job', os.path.basename(sampler.path))
+        stacks = self.read(sampler.path)
+        self.assertTrue(any(stack.startswith('hit_reader;') for stack in stacks))
+        self.assertTrue(any(stack.startswith('MainThread;') for stack in stacks))
+
+    def test_job_name(self):
+        """Test jobs are named by the model they work on and jobs on several models by their task"""
+        self.assertEqual(profiler.job_name(SimpleNamespace(name='fast_grow.tasks.grow'), [42]),
+                         'grow:42')
+        self.assertEqual(
+            profiler.job_name(SimpleNamespace(name='fast_grow.tasks.clip_ligands'), [[1, 2]]),
+            'clip_ligands')
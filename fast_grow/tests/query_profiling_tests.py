@@ -0,0 +1,71 @@
+"""Query profiling tests"""
+from types import SimpleNamespace
+from unittest import mock
+from django.db import connection
+from django.test import TestCase
+from fast_grow import query_profiling
+from fast_grow.models import Ligand
+from fast_grow.query_profiling import profile
+from .fixtures import multi_ensemble
+
+LIMITS = {'queries': 5, 'seconds': None, 'repeats': 2}
+
+
+@mock.patch.dict('fast_grow.query_profiling.QUERY_PROFILING_LIMITS', LIMITS)
+class QueryProfilingTests(TestCase):
+    """Query profiling tests"""
+
+    def setUp(self):
+        """setUp creates an ensemble with three ligands"""
+        self.ensemble = multi_ensemble()
+        for name in ['second', 'third']:
+            Ligand(name=name, file_type='sdf', file_string='', ensemble=self.ensemble).save()
+
+    def test_profile(self):
+        """Test queries are counted by their statement"""
+        with profile() as query_profile:
+            for ligand in Ligand.objects.all():
+                Ligand.objects.get(id=ligand.id)
+        self.assertEqual(query_profile.queries, 4)
+        self.assertGreater(query_profile.seconds, 0)
+        self.assertEqual(len(query_profile.repeated()), 1)
+        self.assertEqual(query_profile.repeated()[0][1], 3)
+        self.assertEqual(query_profile.exceeded(), ['repeats'])
+        with self.assertLogs(level='WARNING') as logs:
+            query_profile.log('test')
+        self.assertIn('test ran 4 queries', logs.output[0])
+
+    def test_ensemble_dict(self):
+        """Test converting an ensemble does not query per complex or ligand"""
+        with profile() as query_profile:
+            self.ensemble.dict(detail=True)
+        self.assertEqual(query_profile.queries, 2)
+        self.assertEqual(query_profile.exceeded(), [])
+
+    def test_middleware_disabled(self):
+        """Test responses carry no query headers without profiling"""
+        response = self.client.get(f'/complex/{self.ensemble.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-DB-Queries', response)
+
+    @mock.patch('fast_grow.query_profiling.QUERY_PROFILING_HEADERS', True)
+    @mock.patch('fast_grow.query_profiling.QUERY_PROFILING', True)
+    def test_middleware(self):
+        """Test profiled responses report their queries"""
+        response = self.client.get(f'/complex/{self.ensemble.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-DB-Queries'], '3')
+        self.assertGreater(float(response['X-DB-Time']), 0)
+
+    @mock.patch('fast_grow.query_profiling.QUERY_PROFILING', True)
+    def test_job(self):
+        """Test the queries of a job are profiled from its start to its end"""
+        task = SimpleNamespace(name='fast_grow.tasks.clip_ligand')
+        query_profiling.start_job(task_id='job')
+        for ligand in Ligand.objects.all():
+            Ligand.objects.get(id=ligand.id)
+        with self.assertLogs(level='WARNING') as logs:
+            query_profiling.finish_job(task_id='job', task=task, args=[1])
+        self.assertIn('clip_ligand(1,) ran 4 queries', logs.output[0])
+        self.assertEqual(query_profiling._JOBS, {})  # pylint: disable=protected-access
+        self.assertEqual(connection.execute_wrappers, [])
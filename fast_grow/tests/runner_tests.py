@@ -0,0 +1,91 @@
+"""Tool runner tests"""
+import subprocess
+import sys
+from types import SimpleNamespace
+from unittest import mock
+from django.test import SimpleTestCase
+from fast_grow.tool_wrappers import runner
+from fast_grow.tool_wrappers.runner import ToolProcess, add_usage
+
+LIMITS = {
+    'timeout': {'timeout': 0.2},
+    'memory': {'memory': 256 << 20},
+    'cpu': {'cpu': 1},
+}
+
+
+def python(code):
+    """Create a command line running python code
+
+    :param code: python code
+    :type code: str
+    :return: command line
+    :rtype: list
+    """
+    return [sys.executable, '-c', code]
+
+
+@mock.patch.dict('fast_grow.tool_wrappers.runner.TOOL_LIMITS', LIMITS)
+class RunnerTests(SimpleTestCase):
+    """Tool runner tests"""
+
+    def test_run_usage(self):
+        """Test the resource usage of every run is added to the job"""
+        job = SimpleNamespace(resource_usage=None)
+        runner.run(python('sum(range(10 ** 6))'), 'test', job)
+        self.assertEqual(job.resource_usage['processes'], 1)
+        self.assertGreater(job.resource_usage['user_seconds'], 0)
+        self.assertGreater(job.resource_usage['max_rss_bytes'], 1 << 20)
+        first_usage = dict(job.resource_usage)
+        runner.run(python('pass'), 'test', job)
+        self.assertEqual(job.resource_usage['processes'], 2)
+        self.assertGreater(job.resource_usage['wall_seconds'], first_usage['wall_seconds'])
+
+    def test_run_failure(self):
+        """Test a failing tool raises with its exit code and its usage is still recorded"""
+        job = SimpleNamespace(resource_usage=None)
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            runner.run(python('import sys; sys.exit(3)'), 'test', job)
+        self.assertEqual(context.exception.returncode, 3)
+        self.assertEqual(job.resource_usage['processes'], 1)
+
+    def test_run_timeout(self):
+        """Test a tool exceeding its wall-clock limit is terminated"""
+        job = SimpleNamespace(resource_usage=None)
+        with self.assertRaises(subprocess.TimeoutExpired):
+            runner.run(['sleep', '60'], 'timeout', job)
+        self.assertLess(job.resource_usage['wall_seconds'], 10)
+
+    def test_memory_limit(self):
+        """Test a tool cannot allocate more than its memory limit"""
+        job = SimpleNamespace(resource_usage=None)
+        with self.assertRaises(subprocess.CalledProcessError):
+            runner.run(python(
+                'import sys\ntry:\n    bytearray(512 << 20)\nexcept MemoryError:\n    sys.exit(1)'),
+                'memory', job)
+        self.assertLess(job.resource_usage['max_rss_bytes'], 256 << 20)
+
+    def test_cpu_limit(self):
+        """Test a tool is killed once it used up its CPU time"""
+        job = SimpleNamespace(resource_usage=None)
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            runner.run(python('while True: pass'), 'cpu', job)
+        self.assertLess(context.exception.returncode, 0)
+
+    def test_terminate(self):
+        """Test terminating a process takes its whole session down"""
+        process = ToolProcess(['sh', '-c', 'sleep 60 & sleep 60'], 'test')
+        process.terminate()
+        self.assertIsNotNone(process.returncode)
+        self.assertLess(process.returncode, 0)
+        self.assertIsNotNone(process.usage)
+        # terminating an exited process is a no-op
+        process.terminate()
+
+    def test_add_usage(self):
+        """Test usage is summed up except for the peak memory"""
+        usage = {'processes': 1, 'user_seconds': 2.0, 'max_rss_bytes': 100}
+        total = add_usage(None, usage)
+        self.assertEqual(total, usage)
+        total = add_usage(total, {'processes': 1, 'user_seconds': 1.0, 'max_rss_bytes': 50})
+        self.assertEqual(total, {'processes': 2, 'user_seconds': 3.0, 'max_rss_bytes': 100})
@@ -0,0 +1,95 @@
+"""Fair-share scheduler tests"""
+from unittest import mock
+from django.test import RequestFactory, TestCase
+from fast_grow import scheduler
+
+TEST_PREFIX = 'fast_grow_test:fair_share:'
+
+
+class SchedulerTests(TestCase):
+    """Fair-share scheduler tests"""
+
+    @staticmethod
+    def delete_keys():
+        """Remove the redis keys of the tests"""
+        conn = scheduler.connection()
+        keys = conn.keys(TEST_PREFIX + '*')
+        if keys:
+            conn.delete(*keys)
+
+    def test_client_key(self):
+        """Test clients are identified by API token before their address"""
+        factory = RequestFactory()
+        token_request = factory.get('/', HTTP_AUTHORIZATION='Token a', REMOTE_ADDR='10.0.0.1')
+        other_token_request = factory.get('/', HTTP_AUTHORIZATION='Token b', REMOTE_ADDR='10.0.0.1')
+        address_request = factory.get('/', REMOTE_ADDR='10.0.0.1')
+        self.assertNotEqual(scheduler.client_key(token_request),
+                            scheduler.client_key(other_token_request))
+        self.assertNotEqual(scheduler.client_key(token_request),
+                            scheduler.client_key(address_request))
+        self.assertEqual(scheduler.client_key(address_request),
+                         scheduler.client_key(factory.get('/', REMOTE_ADDR='10.0.0.1')))
+
+    def test_client_key_proxy(self):
+        """Test clients behind the reverse proxy are identified by the address the proxy added"""
+        factory = RequestFactory()
+        proxied_request = factory.get('/', HTTP_X_FORWARDED_FOR='192.0.2.1', REMOTE_ADDR='10.0.0.1')
+        other_request = factory.get('/', HTTP_X_FORWARDED_FOR='192.0.2.2', REMOTE_ADDR='10.0.0.1')
+        spoofed_request = factory.get(
+            '/', HTTP_X_FORWARDED_FOR='198.51.100.1, 192.0.2.1', REMOTE_ADDR='10.0.0.1')
+        self.assertNotEqual(scheduler.client_key(proxied_request),
+                            scheduler.client_key(other_request))
+        self.assertEqual(scheduler.client_key(proxied_request),
+                         scheduler.client_key(spoofed_request))
+        with mock.patch('fast_grow.scheduler.FAIR_SHARE_CLIENT_HEADER', None):
+            self.assertEqual(scheduler.client_key(proxied_request),
+                             scheduler.client_key(other_request))
+
+    def test_round_robin_position(self):
+        """Test queue positions interleave the queues of clients"""
+        # queues a: [0, 1, 2] b: [0] c: [0, 1] dispatch as a0 b0 c0 a1 c1 a2
+        self.assertEqual(scheduler.round_robin_position(0, 0, [3, 1, 2]), 0)
+        self.assertEqual(scheduler.round_robin_position(0, 2, [3, 1, 2]), 2)
+        self.assertEqual(scheduler.round_robin_position(1, 0, [3, 1, 2]), 3)
+        self.assertEqual(scheduler.round_robin_position(1, 2, [3, 1, 2]), 4)
+        self.assertEqual(scheduler.round_robin_position(2, 0, [3, 1, 2]), 5)
+
+    @mock.patch('fast_grow.scheduler.PREFIX', TEST_PREFIX)
+    def test_take_round_robin(self):
+        """Test growings are taken in turns between clients"""
+        self.addCleanup(self.delete_keys)
+        for growing_id in [1, 2, 3]:
+            scheduler.submit(growing_id, 'heavy', 0)
+        scheduler.submit(4, 'light', 0)
+        self.assertEqual(scheduler.queue_position(4), 1)
+        self.assertEqual(scheduler.queue_position(3), 3)
+        self.assertEqual(scheduler.take(3), [1, 4, 2])
+        self.assertEqual(scheduler.take(3), [])
+        self.assertIsNone(scheduler.queue_position(1))
+        self.assertEqual(scheduler.queue_position(3), 0)
+        scheduler.release(1)
+        with mock.patch('fast_grow.scheduler.time.time', return_value=5000):
+            self.assertEqual(scheduler.take(3), [3])
+        self.assertCountEqual(scheduler.dispatched(), [2, 3, 4])
+        self.assertCountEqual(scheduler.dispatched_before(5000), [2, 4])
+
+    @mock.patch('fast_grow.scheduler.PREFIX', TEST_PREFIX)
+    def test_release_queued(self):
+        """Test releasing a queued growing removes it from the queue of its client"""
+        self.addCleanup(self.delete_keys)
+        scheduler.submit(1, 'client', 0)
+        scheduler.release(1)
+        self.assertIsNone(scheduler.queue_position(1))
+        self.assertEqual(scheduler.take(1), [])
+
+    @mock.patch('fast_grow.scheduler.PREFIX', TEST_PREFIX)
+    def test_take_short_first(self):
+        """Test short growings of a client overtake long ones, which move up over time"""
+        self.addCleanup(self.delete_keys)
+        with mock.patch('fast_grow.scheduler.time.time', return_value=1000):
+            scheduler.submit(1, 'client', 3600)
+            scheduler.submit(2, 'client', 60)
+        with mock.patch('fast_grow.scheduler.time.time', return_value=5000):
+            scheduler.submit(3, 'client', 60)
+        self.assertEqual(scheduler.queue_position(2), 0)
+        self.assertEqual(scheduler.take(3), [2, 1, 3])
@@ -0,0 +1,72 @@
+"""Fragment database snapshot tests"""
+import json
+import sqlite3
+from tempfile import TemporaryDirectory
+from unittest import mock
+from django.test import TestCase
+from fast_grow import snapshots
+from fast_grow.models import FragmentSet
+from .fixtures import test_fragment_set, delete_test_fragment_set
+
+
+class SnapshotTests(TestCase):
+    """Fragment database snapshot tests"""
+
+    def setUp(self):
+        """setUp points the snapshots to a temporary directory"""
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(snapshots, 'FRAGMENT_SNAPSHOT_DIR', directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_export(self):
+        """Test an exported snapshot contains the fragment database and is verified"""
+        fragment_set = test_fragment_set()
+        try:
+            manifest = snapshots.export(fragment_set, fragment_set.name)
+        finally:
+            delete_test_fragment_set(fragment_set.name)
+        self.assertEqual(manifest['version'], fragment_set.version)
+        self.assertGreater(sum(manifest['tables'].values()), 0)
+        path = snapshots.verified_snapshot(fragment_set, fragment_set.name)
+        self.assertIsNotNone(path)
+        with sqlite3.connect(path) as connection:
+            for table, nof_rows in manifest['tables'].items():
+                count = connection.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                self.assertEqual(count, nof_rows)
+
+    def test_verified_snapshot(self):
+        """Test snapshots are only used while they match the fragment set version and hash"""
+        fragment_set = FragmentSet(name='snapshot fragment set')
+        fragment_set.save()
+        self.assertIsNone(snapshots.verified_snapshot(fragment_set, fragment_set.name))
+
+        path = snapshots.snapshot_path(fragment_set.name)
+        with sqlite3.connect(path) as connection:
+            connection.execute('CREATE TABLE fragments (id INTEGER PRIMARY KEY)')
+        manifest = {
+            'fragment_set': fragment_set.name,
+            'database': fragment_set.name,
+            'version': fragment_set.version,
+            'tables': {'fragments': 0},
+            'hash': snapshots.file_hash(path)
+        }
+        manifest_path = snapshots.manifest_path(fragment_set.name)
+        with open(manifest_path, 'w', encoding='utf8') as manifest_file:
+            json.dump(manifest, manifest_file)
+        self.assertEqual(snapshots.verified_snapshot(fragment_set, fragment_set.name), str(path))
+
+        fragment_set.version += 1
+        self.assertIsNone(snapshots.verified_snapshot(fragment_set, fragment_set.name))
+        fragment_set.version -= 1
+        with sqlite3.connect(path) as connection:
+            connection.execute('INSERT INTO fragments VALUES (1)')
+        self.assertIsNone(snapshots.verified_snapshot(fragment_set, fragment_set.name))
+
+    def test_sqlite_value(self):
+        """Test postgres values are converted into values sqlite can store"""
+        self.assertEqual(snapshots.sqlite_value(memoryview(b'ab')), b'ab')
+        self.assertEqual(snapshots.sqlite_value([1, 2]), '[1, 2]')
+        self.assertEqual(snapshots.sqlite_value(1.5), 1.5)
+        self.assertIsNone(snapshots.sqlite_value(None))
@@ -12,3 +12,4 @@ class StatusTests(TestCase):
         self.assertEqual(Status.to_string(Status.RUNNING), 'running')
         self.assertEqual(Status.to_string(Status.SUCCESS), 'success')
         self.assertEqual(Status.to_string(Status.FAILURE), 'failure')
+        self.assertEqual(Status.to_string(Status.CANCELLED), 'cancelled')
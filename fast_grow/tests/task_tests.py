@@ -1,12 +1,18 @@
 """Celery task tests"""
 import os
 import subprocess
+from unittest import mock
+from django.conf import settings
 from django.test import TestCase
 from fast_grow.models import Complex, Core, Growing, Ligand, SearchPointData, Status, Ensemble
-from fast_grow.tasks import preprocess_ensemble, clip_ligand, grow, generate_interactions
-from fast_grow.settings import PREPROCESSOR, CLIPPER, INTERACTIONS, FAST_GROW
+from fast_grow.tasks import preprocess_ensemble, clip_ligand, clip_ligands, grow, grow_shard, \
+    finish_shard, generate_interactions, cancel_speculation, speculate_interactions, \
+    dispatch_growings
+from fast_grow.tool_wrappers.interactions_wrapper import InteractionWrapper
+from fast_grow.settings import PREPROCESSOR, CLIPPER, INTERACTIONS, FAST_GROW, SPECULATIVE_PRIORITY
 from .fixtures import TEST_FILES, multi_ensemble, single_ensemble, single_ensemble_with_ligand, \
-    test_ligand, test_growing, search_point_growing, ensemble_growing, delete_test_fragment_set
+    test_ligand, test_growing, search_point_growing, ensemble_growing, delete_test_fragment_set, \
+    processed_search_points, sharded_growing, cached_growing, processed_single_ensemble
 
 
 class TaskTests(TestCase):
@@ -111,6 +117,22 @@ class TaskTests(TestCase):
         except subprocess.CalledProcessError as error:
             self.assertEqual(70, error.returncode)
 
+    def test_clip_ligands(self):
+        """Test the clipper clips a ligand into several cores and records single failures"""
+        ligand = test_ligand()
+        core = Core(name='P86_A_400_18_2', ligand=ligand, anchor=18, linker=2)
+        core.save()
+        invalid_core = Core(name='P86_A_400_18_3', ligand=ligand, anchor=18, linker=3)
+        invalid_core.save()
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            clip_ligands.run([core.id, invalid_core.id])
+        core = Core.objects.get(id=core.id)
+        self.assertEqual(core.status, Status.SUCCESS)
+        self.assertIsNotNone(core.file_string)
+        invalid_core = Core.objects.get(id=invalid_core.id)
+        self.assertEqual(invalid_core.status, Status.FAILURE)
+
     def test_interactions_available(self):
         """Test the clipper binary exists at the correct location and is licensed"""
         self.assertTrue(os.path.exists(INTERACTIONS),
@@ -142,6 +164,66 @@ class TaskTests(TestCase):
         self.assertEqual(search_point_data.status, Status.SUCCESS)
         self.assertIsNotNone(search_point_data.data)
 
+    def test_interactions_cached(self):
+        """Test generating interactions reuses data generated from identical inputs"""
+        cached_data = processed_search_points()
+        cached_data.cache_key = InteractionWrapper.cache_key(
+            cached_data.complex, cached_data.ligand)
+        cached_data.save()
+        search_point_data = SearchPointData(
+            ligand=cached_data.ligand, complex=cached_data.complex)
+        search_point_data.save()
+        generate_interactions.run(search_point_data.id)
+        search_point_data = SearchPointData.objects.get(id=search_point_data.id)
+        self.assertEqual(search_point_data.status, Status.SUCCESS)
+        self.assertEqual(search_point_data.data, cached_data.data)
+        self.assertIsNotNone(search_point_data.cache_key)
+
+    @mock.patch('fast_grow.tasks.generate_interactions')
+    def test_speculate_interactions_copy(self, generate):
+        """Test speculation copies search point data of identical contents of another ensemble"""
+        cached_data = processed_search_points()
+        cached_data.cache_key = InteractionWrapper.cache_key(
+            cached_data.complex, cached_data.ligand)
+        cached_data.save()
+        ensemble = processed_single_ensemble()
+        speculate_interactions(ensemble)
+        generate.apply_async.assert_not_called()
+        copy = SearchPointData.objects.get(complex__ensemble=ensemble)
+        self.assertEqual(copy.status, Status.SUCCESS)
+        self.assertEqual(copy.data, cached_data.data)
+        self.assertEqual(copy.ligand.ensemble_id, ensemble.id)
+
+    def test_cancel_speculation(self):
+        """Test only pending speculative interaction generations are cancelled"""
+        ensemble = single_ensemble_with_ligand()
+        cmplx = ensemble.complex_set.first()
+        ligand = ensemble.ligand_set.first()
+        speculative = SearchPointData(complex=cmplx, ligand=ligand, speculative=True)
+        speculative.save()
+        running = SearchPointData(
+            complex=cmplx, ligand=ligand, speculative=True, status=Status.RUNNING)
+        running.save()
+        requested = SearchPointData(complex=cmplx, ligand=ligand)
+        requested.save()
+
+        self.assertEqual(cancel_speculation(ensemble), 1)
+        self.assertFalse(SearchPointData.objects.filter(id=speculative.id).exists())
+        self.assertTrue(SearchPointData.objects.filter(id=running.id).exists())
+        self.assertTrue(SearchPointData.objects.filter(id=requested.id).exists())
+
+        # a cancelled generation that is picked up anyway is skipped
+        generate_interactions.run(speculative.id)
+        self.assertFalse(SearchPointData.objects.filter(id=speculative.id).exists())
+
+    def test_speculative_priority(self):
+        """Test speculative jobs are queued at a broker priority consumed after the default"""
+        priority_steps = settings.CELERY_BROKER_TRANSPORT_OPTIONS['priority_steps']
+        self.assertIn(SPECULATIVE_PRIORITY, priority_steps)
+        self.assertIn(settings.CELERY_TASK_DEFAULT_PRIORITY, priority_steps)
+        # lower priorities are consumed first by the redis transport
+        self.assertGreater(SPECULATIVE_PRIORITY, settings.CELERY_TASK_DEFAULT_PRIORITY)
+
     def test_growing(self):
         """Test fast grow processes a growing"""
         growing = test_growing()
@@ -186,6 +268,69 @@ class TaskTests(TestCase):
             growing.ensemble.complex_set.count()
         )
 
+    def test_sharded_growing(self):
+        """Test fast grow processes the partitions of a growing into the same growing"""
+        growing = sharded_growing()
+        try:
+            for shard in range(growing.shards):
+                grow_shard.run(growing.id, shard)
+        finally:
+            for database_name in growing.fragment_set.database_names():
+                delete_test_fragment_set(database_name)
+        growing = Growing.objects.get(id=growing.id)
+        self.assertEqual(growing.status, Status.SUCCESS)
+        self.assertEqual(growing.shards_finished, 2)
+        self.assertEqual(growing.hit_set.count(), 20)
+
+    def test_finish_shard(self):
+        """Test a sharded growing only succeeds once all shards finished"""
+        growing = cached_growing()
+        growing.status = Status.RUNNING
+        growing.shards = 2
+        growing.save()
+        finish_shard(growing.id)
+        self.assertEqual(Growing.objects.get(id=growing.id).status, Status.RUNNING)
+        finish_shard(growing.id)
+        self.assertEqual(Growing.objects.get(id=growing.id).status, Status.SUCCESS)
+
+    @mock.patch('fast_grow.tasks.grow')
+    @mock.patch('fast_grow.tasks.scheduler')
+    def test_dispatch_stale(self, scheduler, grow_task):
+        """Test growings dispatched too long ago fail and free their slot"""
+        growing = cached_growing()
+        growing.status = Status.RUNNING
+        growing.save()
+        scheduler.dispatched_before.return_value = [growing.id]
+        scheduler.dispatched.return_value = [growing.id]
+        scheduler.take.return_value = []
+        dispatch_growings()
+        self.assertEqual(Growing.objects.get(id=growing.id).status, Status.FAILURE)
+        scheduler.release.assert_called_once_with(growing.id)
+        grow_task.delay.assert_not_called()
+
+    @mock.patch('fast_grow.tasks.grow')
+    @mock.patch('fast_grow.tasks.scheduler')
+    def test_dispatch_publish_error(self, scheduler, grow_task):
+        """Test growings that cannot be published fail and free their slot"""
+        growing = cached_growing()
+        growing.status = Status.PENDING
+        growing.save()
+        scheduler.dispatched_before.return_value = []
+        scheduler.dispatched.return_value = []
+        scheduler.take.return_value = [growing.id]
+        grow_task.delay.side_effect = ConnectionError('broker unavailable')
+        dispatch_growings()
+        self.assertEqual(Growing.objects.get(id=growing.id).status, Status.FAILURE)
+        scheduler.release.assert_called_once_with(growing.id)
+
+    def test_growing_cancelled(self):
+        """Test a growing cancelled before it started is not grown"""
+        growing = cached_growing()
+        growing.status = Status.CANCELLED
+        growing.save()
+        grow.run(growing.id)
+        self.assertEqual(Growing.objects.get(id=growing.id).status, Status.CANCELLED)
+
     def test_growing_fail(self):
         """Test fast grow processes a growing"""
         growing = test_growing()
@@ -0,0 +1,124 @@
+"""Tool simulator tests
+
+The tool wrappers run against the simulators, which stand in for the tool binaries.
+"""
+import json
+import os
+import subprocess
+from unittest import mock
+from django.test import TestCase
+from fast_grow.models import Core, SearchPointData, Status
+from fast_grow.settings import SIMULATORS
+from fast_grow.tool_wrappers.clipper_wrapper import ClipperWrapper
+from fast_grow.tool_wrappers.fast_grow_wrapper import FastGrowWrapper
+from fast_grow.tool_wrappers.interactions_wrapper import InteractionWrapper
+from fast_grow.tool_wrappers.preprocessor_wrapper import PreprocessorWrapper
+from .fixtures import cached_growing, processed_single_ensemble, single_ensemble
+
+PREPROCESSOR = os.path.join(SIMULATORS, 'preprocessor.py')
+CLIPPER = os.path.join(SIMULATORS, 'clipper.py')
+INTERACTIONS = os.path.join(SIMULATORS, 'interaction_generator.py')
+FAST_GROW = os.path.join(SIMULATORS, 'fastgrow.py')
+
+
+class ToolSimulatorTests(TestCase):
+    """Tool simulator tests"""
+
+    def test_usage(self):
+        """Test simulators exit with EX_USAGE without their required arguments"""
+        for simulator in [PREPROCESSOR, CLIPPER, INTERACTIONS, FAST_GROW]:
+            process = subprocess.run([simulator], capture_output=True, check=False)
+            self.assertEqual(process.returncode, 64, simulator)
+
+    @mock.patch('fast_grow.tool_wrappers.preprocessor_wrapper.PREPROCESSOR', PREPROCESSOR)
+    def test_preprocess(self):
+        """Test the pocket is cleaned and its ligands are extracted"""
+        ensemble = single_ensemble()
+        PreprocessorWrapper.preprocess(ensemble)
+        self.assertEqual(list(ensemble.complex_set.values_list('name', flat=True)), ['4agm'])
+        self.assertNotIn('HETATM', ensemble.complex_set.first().file_string)
+        self.assertEqual(sorted(ensemble.ligand_set.values_list('name', flat=True)),
+                         ['P86_A_400', 'P86_B_400'])
+
+    @mock.patch('fast_grow.tool_wrappers.clipper_wrapper.CLIPPER', CLIPPER)
+    def test_clip(self):
+        """Test the link atom of a clipped core becomes a hydrogen"""
+        ligand = processed_single_ensemble().ligand_set.first()
+        core = Core(ligand=ligand, name='P86_A_400_18_2', anchor=18, linker=2)
+        ClipperWrapper.clip(core)
+        self.assertEqual(core.file_type, 'sdf')
+        self.assertEqual(core.file_string.split('\n')[5][31:34].strip(), 'H')
+        self.assertIsNotNone(core.resource_usage)
+
+    @mock.patch('fast_grow.tool_wrappers.clipper_wrapper.CLIPPER', CLIPPER)
+    def test_clip_ring(self):
+        """Test clipping a ring bond fails like the clipper binary"""
+        ligand = processed_single_ensemble().ligand_set.first()
+        core = Core(ligand=ligand, name='P86_A_400_4_10', anchor=4, linker=10)
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            ClipperWrapper.clip(core)
+        self.assertEqual(context.exception.returncode, 70)
+
+    @mock.patch('fast_grow.tool_wrappers.interactions_wrapper.INTERACTIONS', INTERACTIONS)
+    def test_interactions(self):
+        """Test search points are generated in the format of the interaction generator"""
+        ensemble = processed_single_ensemble()
+        search_point_data = SearchPointData(
+            complex=ensemble.complex_set.first(), ligand=ensemble.ligand_set.first())
+        InteractionWrapper.generate(search_point_data)
+        data = json.loads(search_point_data.data)
+        self.assertEqual(
+            set(data), {'activeSiteSearchPoints', 'ligandSearchPoints', 'waterSearchPoints'})
+        self.assertGreater(len(data['activeSiteSearchPoints']['searchPoints']), 0)
+
+    @mock.patch('fast_grow.tool_wrappers.fast_grow_wrapper.FAST_GROW', FAST_GROW)
+    @mock.patch.dict(os.environ, {'FAST_GROW_SIMULATOR_FRAGMENTS': '500'})
+    def test_grow(self):
+        """Test the hits of every chunk are ingested"""
+        growing = cached_growing()
+        growing.status = Status.RUNNING
+        growing.save()
+        nof_hits = growing.hit_set.count()
+        FastGrowWrapper.grow(growing, chunk_size=100)
+        growing.refresh_from_db()
+        # a hit ratio of 0.01 yields a hit per chunk of 100 fragments
+        self.assertEqual(growing.hit_set.count(), nof_hits + 5)
+        self.assertEqual(growing.fragments_processed, 500)
+
+    @mock.patch('fast_grow.tool_wrappers.fast_grow_wrapper.FAST_GROW', FAST_GROW)
+    @mock.patch('fast_grow.tool_wrappers.fast_grow_wrapper.HIT_QUEUE_SIZE', 2)
+    @mock.patch.dict(os.environ, {'FAST_GROW_SIMULATOR_FRAGMENTS': '500'})
+    def test_grow_interrupted(self):
+        """Test queued and unread hits are added if the growing is cancelled or stopped early"""
+        def interrupt(outcome):
+            def ingest(_growing, reader, _started, _chunk_size):
+                # nothing was saved, the hits files are queued or not read yet
+                reader.process.wait()
+                return [], outcome
+            return ingest
+
+        growing = cached_growing()
+        for outcome in ['cancelled', 'stopped']:
+            growing.status = Status.RUNNING
+            growing.save()
+            nof_hits = growing.hit_set.count()
+            with mock.patch.object(FastGrowWrapper, 'ingest', side_effect=interrupt(outcome)):
+                result = FastGrowWrapper.grow(growing, chunk_size=100)
+            self.assertEqual(result is None, outcome == 'cancelled')
+            self.assertEqual(growing.hit_set.count(), nof_hits + 5)
+
+    @mock.patch('fast_grow.tool_wrappers.fast_grow_wrapper.FAST_GROW', FAST_GROW)
+    @mock.patch.dict(os.environ, {'FAST_GROW_SIMULATOR_FRAGMENTS': '500',
+                                  'FAST_GROW_SIMULATOR_RATE': '50'})
+    def test_grow_failed_shard(self):
+        """Test a shard of a growing failed by another shard stops without adding hits"""
+        growing = cached_growing()
+        growing.status = Status.FAILURE
+        growing.save()
+        nof_hits = growing.hit_set.count()
+        self.assertIsNone(FastGrowWrapper.grow(growing, chunk_size=100))
+        growing.refresh_from_db()
+        self.assertEqual(growing.status, Status.FAILURE)
+        # the simulator takes 10 seconds for all fragments
+        self.assertLess(growing.fragments_processed, 500)
+        self.assertLess(growing.hit_set.count(), nof_hits + 5)
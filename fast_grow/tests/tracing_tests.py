@@ -0,0 +1,174 @@
+"""Tracing tests"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest import mock
+from celery.signals import worker_process_shutdown
+from django.test import TestCase
+from fast_grow import instrumentation, tracing
+from fast_grow.models import Growing
+from fast_grow.tasks import dispatch_growings
+from fast_grow.tool_wrappers.runner import ToolProcess
+from .fixtures import cached_growing
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+TRACEPARENT = f'00-{TRACE_ID}-00f067aa0ba902b7-01'
+
+
+class TracingTests(TestCase):
+    """Tracing tests"""
+
+    def setUp(self):
+        """setUp exports spans to a temporary file"""
+        directory = TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'traces.jsonl')
+        for setting, value in [('TRACING_EXPORTER', 'file'), ('TRACING_FILE', self.path)]:
+            patcher = mock.patch(f'fast_grow.tracing.{setting}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def spans(self):
+        """Read the exported spans
+
+        :return: OTLP spans by name
+        :rtype: dict
+        """
+        tracing.export()
+        with open(self.path, encoding='utf8') as trace_file:
+            payloads = [json.loads(line) for line in trace_file]
+        return {span['name']: span for payload in payloads
+                for resource_spans in payload['resourceSpans']
+                for scope_spans in resource_spans['scopeSpans'] for span in scope_spans['spans']}
+
+    def test_parse(self):
+        """Test only valid traceparents are accepted"""
+        self.assertEqual(tracing.parse(TRACEPARENT), (TRACE_ID, '00f067aa0ba902b7'))
+        self.assertIsNone(tracing.parse(None))
+        self.assertIsNone(tracing.parse('00-abc-def-01'))
+        self.assertIsNone(tracing.parse(f'00-{"0" * 32}-00f067aa0ba902b7-01'))
+
+    def test_span(self):
+        """Test spans nest within the trace of their parent and record errors"""
+        with tracing.span('request', TRACEPARENT, 'server', route='growing') as outer:
+            with self.assertRaises(ValueError):
+                with instrumentation.timer('parse'):
+                    raise ValueError('invalid hits file')
+        self.assertIsNone(tracing.current())
+        spans = self.spans()
+        self.assertEqual(spans['request']['traceId'], TRACE_ID)
+        self.assertEqual(spans['request']['parentSpanId'], '00f067aa0ba902b7')
+        self.assertEqual(spans['request']['kind'], 2)
+        self.assertEqual(spans['request']['attributes'],
+                         [{'key': 'route', 'value': {'stringValue': 'growing'}}])
+        self.assertEqual(spans['parse']['traceId'], TRACE_ID)
+        self.assertEqual(spans['parse']['parentSpanId'], outer.span_id)
+        self.assertEqual(spans['parse']['status'],
+                         {'code': 2, 'message': 'ValueError: invalid hits file'})
+        self.assertEqual(spans['request']['status'], {'code': 1})
+
+    @mock.patch('fast_grow.tracing.TRACING_EXPORTER', None)
+    def test_disabled(self):
+        """Test nothing is traced without an exporter"""
+        with tracing.span('request') as span:
+            self.assertIsNone(span)
+            self.assertIsNone(tracing.traceparent())
+            self.assertIsNone(tracing.environment())
+        tracing.export()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_subprocess(self):
+        """Test tool binaries get the trace context of the active span"""
+        with tracing.span('binary') as span:
+            process = ToolProcess(
+                [sys.executable, '-c', 'import os; print(os.environ["TRACEPARENT"])'], 'test',
+                stdout=subprocess.PIPE, text=True)
+            process.wait()
+        self.assertEqual(process.process.stdout.read().strip(), span.traceparent)
+        process.process.stdout.close()
+
+    def test_job(self):
+        """Test jobs continue the trace of their publisher"""
+        headers = {}
+        with tracing.span('request') as request_span:
+            tracing.inject(headers=headers)
+        task = SimpleNamespace(name='fast_grow.tasks.grow',
+                               request=SimpleNamespace(traceparent=headers['traceparent']))
+        tracing.start_job(task_id='job', task=task, args=[42])
+        with tracing.span('ingest'):
+            pass
+        tracing.finish_job(task_id='job', state='FAILURE')
+        spans = self.spans()
+        self.assertEqual(spans['grow']['parentSpanId'], request_span.span_id)
+        self.assertEqual(spans['grow']['status']['code'], 2)
+        self.assertIn({'key': 'fast_grow.job_id', 'value': {'intValue': '42'}},
+                      spans['grow']['attributes'])
+        self.assertEqual(spans['ingest']['parentSpanId'], spans['grow']['spanId'])
+
+    @mock.patch('fast_grow.tasks.grow')
+    @mock.patch('fast_grow.tasks.scheduler')
+    def test_dispatch(self, scheduler, grow):
+        """Test growings are dispatched within the trace of the request that created them"""
+        growing = cached_growing()
+        Growing.objects.filter(id=growing.id).update(traceparent=TRACEPARENT)
+        scheduler.dispatched_before.return_value = []
+        scheduler.dispatched.return_value = []
+        scheduler.take.return_value = [growing.id]
+        grow.delay.side_effect = lambda growing_id: self.assertEqual(
+            tracing.parse(tracing.traceparent())[0], TRACE_ID)
+        dispatch_growings()
+        grow.delay.assert_called_once_with(growing.id)
+        self.assertEqual(self.spans()['dispatch']['parentSpanId'], '00f067aa0ba902b7')
+
+    def test_middleware(self):
+        """Test requests continue the trace of their traceparent and polls link to growings"""
+        growing = cached_growing()
+        Growing.objects.filter(id=growing.id).update(traceparent=TRACEPARENT)
+        response = self.client.get(f'/growing/{growing.id}', HTTP_TRACEPARENT=TRACEPARENT)
+        self.assertEqual(response.status_code, 200)
+        span = self.spans()['GET growing/<int:growing_id>']
+        self.assertEqual(response['traceparent'], f'00-{TRACE_ID}-{span["spanId"]}-01')
+        self.assertEqual(span['parentSpanId'], '00f067aa0ba902b7')
+        self.assertEqual(span['links'], [{'traceId': TRACE_ID, 'spanId': '00f067aa0ba902b7'}])
+        self.assertIn({'key': 'http.status_code', 'value': {'intValue': '200'}},
+                      span['attributes'])
+
+    def test_export_in_background(self):
+        """Test requests and jobs leave the export to the exporter or the shutdown of the worker"""
+        exporting_threads = []
+
+        def export():
+            exporting_threads.append(threading.current_thread().name)
+
+        growing = cached_growing()
+        task = SimpleNamespace(name='fast_grow.tasks.grow', request=SimpleNamespace())
+        with mock.patch('fast_grow.tracing.export', side_effect=export):
+            self.client.get(f'/growing/{growing.id}')
+            tracing.start_job(task_id='job', task=task, args=[growing.id])
+            tracing.finish_job(task_id='job', state='SUCCESS')
+        self.assertNotIn(threading.current_thread().name, exporting_threads)
+        worker_process_shutdown.send(sender=None)
+        with open(self.path, encoding='utf8') as trace_file:
+            self.assertIn('"name": "grow"', trace_file.read())
+
+    @mock.patch('fast_grow.tracing.TRACING_BATCH_SIZE', 2)
+    @mock.patch('fast_grow.tracing.TRACING_EXPORT_INTERVAL', 60)
+    def test_export_batch(self):
+        """Test the exporter is woken once a batch of spans is buffered"""
+        for name in ['first', 'second']:
+            with tracing.span(name):
+                pass
+        exported = ''
+        deadline = time.monotonic() + 5
+        while '"name": "second"' not in exported and time.monotonic() < deadline:
+            time.sleep(0.01)
+            if os.path.exists(self.path):
+                with open(self.path, encoding='utf8') as trace_file:
+                    exported = trace_file.read()
+        self.assertIn('"name": "first"', exported)
+        self.assertIn('"name": "second"', exported)
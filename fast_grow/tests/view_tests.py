@@ -1,12 +1,14 @@
 """Django view tests"""
 import json
 import os
+from unittest import mock
 from django.test import TestCase
 from fast_grow_server import celery_app
-from fast_grow.models import Core, Status
+from fast_grow.models import Core, Ensemble, Growing, SearchPointData, Status
+from fast_grow.tool_wrappers.interactions_wrapper import InteractionWrapper
 from .fixtures import TEST_FILES, processed_single_ensemble, test_ligand, test_core, \
     test_fragment_set, processed_growing, processed_search_points, \
-    processed_ensemble_search_point_growing, delete_test_fragment_set
+    processed_ensemble_search_point_growing, delete_test_fragment_set, cached_growing
 
 
 class ViewTests(TestCase):
@@ -91,6 +93,8 @@ class ViewTests(TestCase):
         self.assertEqual(response.status_code, 400)
         response_json = response.json()
         self.assertEqual(response_json['error'], 'invalid PDB code')
+        # rejected uploads leave no ensembles to preprocess behind
+        self.assertFalse(Ensemble.objects.exists())
 
         # pdb code that does not exist, or at least at time of writing
         response = self.client.post('/complex', {'pdb': '6666'})
@@ -115,6 +119,22 @@ class ViewTests(TestCase):
         response_json = response.json()
         self.assertEqual(response_json['error'], 'model not found')
 
+    def test_complex_abandon(self):
+        """Test abandoning an ensemble cancels its speculative interaction generations"""
+        ensemble = processed_single_ensemble()
+        SearchPointData(
+            complex=ensemble.complex_set.first(),
+            ligand=ensemble.ligand_set.first(),
+            speculative=True
+        ).save()
+        response = self.client.post(f'/complex/{ensemble.id}/abandon')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['cancelled'], 1)
+
+        response = self.client.post('/complex/404/abandon')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['error'], 'model not found')
+
     def test_core_create(self):
         """Test the core create route creates a core based on a ligand"""
         ligand = test_ligand()
@@ -130,6 +150,112 @@ class ViewTests(TestCase):
         self.assertEqual(Status.to_string(Status.PENDING), response_json['status'])
         self.assertEqual(core_name, response_json['name'])
 
+    def test_core_create_too_many_requests(self):
+        """Test the core create route rejects cores while too many clippings are queued"""
+        ligand = test_ligand()
+        limits = {'clip_ligand': {'max_queued': 0, 'runtime': 2}}
+        with mock.patch.dict('fast_grow.admission.ADMISSION_LIMITS', limits):
+            response = self.client.post(
+                '/core',
+                {'ligand_id': ligand.id, 'anchor': 18, 'linker': 2},
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertFalse(Core.objects.filter(ligand=ligand).exists())
+
+    def test_admission_metrics(self):
+        """Test the admission metrics route reports job counts per task"""
+        response = self.client.get('/metrics/admission')
+        self.assertEqual(response.status_code, 200)
+        response_json = response.json()
+        self.assertIn('grow', response_json)
+        self.assertEqual(response_json['grow']['queued'], 0)
+
+    def test_core_create_reuse(self):
+        """Test the core create route returns an existing core for identical inputs"""
+        ligand = test_ligand()
+        core = test_core(ligand)
+        response = self.client.post(
+            '/core',
+            {'ligand_id': ligand.id, 'anchor': core.anchor, 'linker': core.linker},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], core.id)
+
+        # a different ligand with identical contents gets a copy of the core
+        identical_ligand = test_ligand()
+        response = self.client.post(
+            '/core',
+            {'ligand_id': identical_ligand.id, 'anchor': core.anchor, 'linker': core.linker},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        response_json = response.json()
+        self.assertNotEqual(response_json['id'], core.id)
+        self.assertEqual(response_json['ligand_id'], identical_ligand.id)
+        self.assertEqual(response_json['status'], Status.to_string(Status.SUCCESS))
+        copy = Core.objects.get(id=response_json['id'])
+        self.assertEqual(copy.file_string, core.file_string)
+
+        # the copy survives the deletion of the ligand it was copied from
+        ligand.delete()
+        self.assertTrue(Core.objects.filter(id=copy.id).exists())
+
+    def test_core_batch_create(self):
+        """Test the core batch route creates missing cores and reuses existing ones"""
+        ligand = test_ligand()
+        core = test_core(ligand)
+        response = self.client.post(
+            '/core/batch',
+            {'ligand_id': ligand.id, 'positions': [[18, 2], [17, 3], [18, 2]]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        response_json = response.json()
+        self.assertEqual(len(response_json), 2)
+        self.assertEqual(response_json[0]['id'], core.id)
+        self.assertEqual(response_json[1]['name'], ligand.name + '_17_3')
+        self.assertEqual(Status.to_string(Status.PENDING), response_json[1]['status'])
+
+        # nothing is created if all cores exist
+        response = self.client.post(
+            '/core/batch',
+            {'ligand_id': ligand.id, 'positions': [[18, 2]]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([core['id'] for core in response.json()], [core.id])
+
+    def test_core_batch_create_fail(self):
+        """Test core batch create failures"""
+        ligand = test_ligand()
+
+        # must specify positions
+        response = self.client.post(
+            '/core/batch', {'ligand_id': ligand.id}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'no positions specified')
+
+        # positions must be pairs of integers
+        response = self.client.post(
+            '/core/batch',
+            {'ligand_id': ligand.id, 'positions': [[18, 2], ['C', 2]]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'invalid anchor or linker specified')
+
+        response = self.client.post(
+            '/core/batch',
+            {'ligand_id': ligand.id, 'positions': [18, 2]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'invalid anchor or linker specified')
+        self.assertEqual(Core.objects.count(), 0)
+
     def test_core_create_fail(self):
         """Test core create failures"""
         # must contain ligand_id
@@ -217,6 +343,47 @@ class ViewTests(TestCase):
         self.assertIn('id', response_json)
         self.assertEqual(Status.to_string(Status.PENDING), response_json['status'])
 
+    def test_interactions_create_reuse(self):
+        """Test interaction generation returns existing search point data for identical inputs"""
+        search_point_data = processed_search_points()
+        search_point_data.cache_key = InteractionWrapper.cache_key(
+            search_point_data.complex, search_point_data.ligand)
+        search_point_data.save()
+        response = self.client.post(
+            '/interactions',
+            data={
+                'ligand_id': search_point_data.ligand.id,
+                'complex_id': search_point_data.complex.id
+            },
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        response_json = response.json()
+        self.assertEqual(response_json['id'], search_point_data.id)
+        self.assertEqual(Status.to_string(Status.SUCCESS), response_json['status'])
+
+        # a complex and ligand of identical contents get a copy of the search point data
+        ensemble = processed_single_ensemble()
+        cmplx = ensemble.complex_set.first()
+        ligand = ensemble.ligand_set.first()
+        response = self.client.post(
+            '/interactions',
+            data={'ligand_id': ligand.id, 'complex_id': cmplx.id},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        response_json = response.json()
+        self.assertNotEqual(response_json['id'], search_point_data.id)
+        self.assertEqual(response_json['complex_id'], cmplx.id)
+        self.assertEqual(response_json['ligand_id'], ligand.id)
+        self.assertEqual(Status.to_string(Status.SUCCESS), response_json['status'])
+        copy = SearchPointData.objects.get(id=response_json['id'])
+        self.assertEqual(copy.data, search_point_data.data)
+
+        # the copy survives the deletion of the ensemble it was copied from
+        search_point_data.complex.ensemble.delete()
+        self.assertTrue(SearchPointData.objects.filter(id=copy.id).exists())
+
     def test_interactions_detail(self):
         """Test getting interactions"""
         search_point_data = processed_search_points()
@@ -248,6 +415,78 @@ class ViewTests(TestCase):
         self.assertIn('id', response_json)
         self.assertEqual(Status.to_string(Status.PENDING), response_json['status'])
 
+    def test_growing_create_cached(self):
+        """Test the growing create route shares the result of a growing with identical inputs"""
+        cached = cached_growing()
+        response = self.client.post(
+            '/growing',
+            {
+                'ensemble': cached.ensemble.id,
+                'core': cached.core.id,
+                'fragment_set': cached.fragment_set.id
+            },
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        response_json = response.json()
+        self.assertNotEqual(response_json['id'], cached.id)
+        self.assertEqual(Status.to_string(Status.SUCCESS), response_json['status'])
+        self.assertEqual(len(response_json['hits']), cached.hit_set.count())
+        # the hits are shared, not copied
+        self.assertEqual(Growing.objects.get(id=response_json['id']).hit_set.count(), 0)
+
+    @mock.patch('fast_grow.views.schedule_growing')
+    @mock.patch('fast_grow.views.admit', return_value=None)
+    def test_growing_create_pending_cores(self, _admit, _schedule_growing):
+        """Test growings of cores that are not clipped yet are not served from the cache"""
+        cached = cached_growing()
+        ligand = cached.core.ligand
+        for anchor, linker in [(17, 3), (16, 4)]:
+            core = Core(ligand=ligand, name=f'{ligand.name}_{anchor}_{linker}', anchor=anchor,
+                        linker=linker)
+            core.save()
+            response = self.client.post(
+                '/growing',
+                {'ensemble': cached.ensemble.id, 'core': core.id,
+                 'fragment_set': cached.fragment_set.id},
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 201)
+            # the growing of the first core is no cache entry for the growing of the second core
+            self.assertEqual(Status.to_string(Status.PENDING), response.json()['status'])
+            Growing.objects.filter(id=response.json()['id']).update(status=Status.SUCCESS)
+
+    def test_growing_create_with_stop_criteria(self):
+        """Test the growing create route validates and stores stop criteria"""
+        cached = cached_growing()
+        growing_json = {
+            'ensemble': cached.ensemble.id,
+            'core': cached.core.id,
+            'fragment_set': cached.fragment_set.id,
+            'stop_criteria': {'max_hits': 'many'}
+        }
+        response = self.client.post('/growing', growing_json, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'invalid stop criteria')
+
+        growing_json['stop_criteria'] = {'max_hits': 0}
+        response = self.client.post('/growing', growing_json, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'invalid stop criteria')
+
+        growing_json['stop_criteria'] = {'score_threshold_hits': 50}
+        response = self.client.post('/growing', growing_json, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'invalid stop criteria')
+
+        growing_json['stop_criteria'] = {'score_threshold': -20, 'score_threshold_hits': 50}
+        response = self.client.post('/growing', growing_json, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        response_json = response.json()
+        self.assertNotEqual(response_json['id'], cached.id)
+        self.assertEqual(
+            response_json['stop_criteria'], {'score_threshold': -20.0, 'score_threshold_hits': 50})
+
     def test_growing_create_with_search_points(self):
         """Test the growing create route creates and starts a growing with search points"""
         ensemble = processed_single_ensemble()
@@ -362,6 +601,36 @@ class ViewTests(TestCase):
         finally:
             delete_test_fragment_set(growing.fragment_set.name)
 
+    def test_growing_cancel(self):
+        """Test cancelling a growing"""
+        growing = cached_growing()
+        growing.status = Status.RUNNING
+        growing.save()
+        response = self.client.post(f'/growing/{growing.id}/cancel')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Status.to_string(Status.CANCELLED), response.json()['status'])
+        self.assertEqual(len(response.json()['hits']), growing.hit_set.count())
+
+        # cancelled growings cannot be cancelled again
+        response = self.client.post(f'/growing/{growing.id}/cancel')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'growing already finished')
+
+        response = self.client.post('/growing/404/cancel')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['error'], 'model not found')
+
+    def test_growing_detail_eta(self):
+        """Test the growing detail route includes the estimate of running growings"""
+        growing = cached_growing()
+        growing.status = Status.RUNNING
+        growing.save()
+        growing.fragment_set.size = 1000
+        growing.fragment_set.save()
+        response = self.client.get(f'/growing/{growing.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['eta'], {'progress': 0, 'seconds': None})
+
     def test_growing_download(self):
         """Test downloading the growing"""
         growing = processed_ensemble_search_point_growing()
@@ -0,0 +1,57 @@
+"""Workspace cache tests"""
+import os
+from tempfile import TemporaryDirectory
+from unittest import mock
+from django.test import TestCase
+from fast_grow.models import Complex
+from fast_grow.tool_wrappers import workspace
+from .fixtures import processed_ensemble, test_ligand
+
+
+class WorkspaceTests(TestCase):
+    """Workspace cache tests"""
+
+    def setUp(self):
+        """setUp points the workspace to a temporary directory"""
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(workspace, 'WORKSPACE_DIR', directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_model_file(self):
+        """Test a model file is materialized under its name"""
+        ligand = test_ligand()
+        with workspace.model_file(ligand) as ligand_path:
+            self.assertEqual(os.path.basename(ligand_path), 'P86_A_400.sdf')
+            with open(ligand_path, encoding='utf8') as ligand_file:
+                self.assertEqual(ligand_file.read(), ligand.file_string)
+
+    def test_materialize_once(self):
+        """Test cached files are not loaded again"""
+        load = mock.Mock(return_value='content')
+        with workspace.materialize([('a.txt', 'hash', load)]) as first_directory:
+            pass
+        with workspace.materialize([('a.txt', 'hash', load)]) as second_directory:
+            self.assertEqual(first_directory, second_directory)
+        load.assert_called_once()
+
+    def test_ensemble_directory(self):
+        """Test an ensemble directory contains all complexes of the ensemble"""
+        ensemble = processed_ensemble()
+        with workspace.ensemble_directory(ensemble) as ensemble_path:
+            self.assertCountEqual(
+                os.listdir(ensemble_path),
+                [cmplx.name + '.pdb' for cmplx in Complex.objects.filter(ensemble=ensemble)]
+            )
+
+    def test_evict(self):
+        """Test least recently used entries are evicted unless they are in use"""
+        with mock.patch.object(workspace, 'WORKSPACE_MAX_BYTES', 10):
+            with workspace.materialize([('a.txt', 'a', lambda: 'a' * 4)]) as in_use:
+                with workspace.materialize([('b.txt', 'b', lambda: 'b' * 4)]) as unused:
+                    pass
+                with workspace.materialize([('c.txt', 'c', lambda: 'c' * 4)]) as new:
+                    self.assertTrue(os.path.exists(in_use))
+                    self.assertFalse(os.path.exists(unused))
+                    self.assertTrue(os.path.exists(new))
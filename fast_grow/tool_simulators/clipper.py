@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Simulator of the clipper binary
+
+The ligand is clipped at the bond between the anchor and the link atom. The core keeps the side of
+the anchor and the link atom, which becomes a hydrogen. Clipping fails if the atoms are not bonded
+or the bond is part of a ring.
+"""
+import sys
+from common import EX_DATAERR, EX_SOFTWARE, ArgumentParser, Molecule, read_text, simulate_work
+
+
+def clip(molecule, anchor, link):
+    """Clip a molecule at the bond between anchor and link atom
+
+    :param molecule: molecule to clip
+    :type molecule: Molecule
+    :param anchor: anchor atom, counted from 1
+    :type anchor: int
+    :param link: link atom, counted from 1
+    :type link: int
+    :raises ValueError: if the atoms are not bonded or the bond is part of a ring
+    :return: core of the molecule
+    :rtype: Molecule
+    """
+    bond = {anchor, link}
+    if not any({first, second} == bond for first, second, _ in molecule.bonds):
+        raise ValueError(f'atoms {anchor} and {link} are not bonded')
+    neighbours = {}
+    for first, second, _ in molecule.bonds:
+        if {first, second} != bond:
+            neighbours.setdefault(first, set()).add(second)
+            neighbours.setdefault(second, set()).add(first)
+    core = {anchor}
+    frontier = [anchor]
+    while frontier:
+        for neighbour in neighbours.get(frontier.pop(), set()) - core:
+            core.add(neighbour)
+            frontier.append(neighbour)
+    if link in core:
+        raise ValueError(f'the bond of atoms {anchor} and {link} is part of a ring')
+    core.add(link)
+    numbers = {atom: number for number, atom in enumerate(sorted(core), 1)}
+    atoms = [('H', position) if atom == link else (element, position)
+             for atom, (element, position) in enumerate(molecule.atoms, 1) if atom in core]
+    core_bonds = [(numbers[first], numbers[second], order)
+                  for first, second, order in molecule.bonds if first in core and second in core]
+    return Molecule(molecule.name, atoms, core_bonds)
+
+
+def main():
+    """Clip a ligand into a core"""
+    parser = ArgumentParser(description='Clip a ligand into a core')
+    parser.add_argument('--ligand', required=True, help='SDF file of the ligand')
+    parser.add_argument('--clipped', required=True, help='SDF file to write the core to')
+    parser.add_argument('--anchorposition', required=True, type=int, help='anchor atom')
+    parser.add_argument('--linkposition', required=True, type=int, help='link atom')
+    args = parser.parse_args()
+    try:
+        molecule = Molecule.parse(read_text(args.ligand))
+    except ValueError as error:
+        print(f'invalid ligand {args.ligand}: {error}', file=sys.stderr)
+        sys.exit(EX_DATAERR)
+    simulate_work()
+    try:
+        core = clip(molecule, args.anchorposition, args.linkposition)
+    except ValueError as error:
+        print(f'cannot clip {molecule.name}: {error}', file=sys.stderr)
+        sys.exit(EX_SOFTWARE)
+    with open(args.clipped, 'w', encoding='utf8') as clipped_file:
+        clipped_file.write(core.mol_block() + '$$$$\n')
+
+
+if __name__ == '__main__':
+    main()
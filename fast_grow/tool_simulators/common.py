@@ -0,0 +1,146 @@
+"""Shared parts of the tool simulators
+
+The simulators run as scripts outside of django, so they only import from the standard library and
+from each other. They exit with the sysexits codes of the tool binaries: 64 for invalid arguments,
+65 for invalid input data, 66 for unreadable input and 70 if the tool fails on valid input.
+"""
+import argparse
+import os
+import sys
+import time
+
+EX_USAGE = 64
+EX_DATAERR = 65
+EX_NOINPUT = 66
+EX_SOFTWARE = 70
+# unset charge, stereo and valence fields of the atom lines of written mol blocks
+ATOM_FLAGS = ' 0  0  0  0  0  0  0  0  0  0  0  0'
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    """Argument parser exiting with EX_USAGE like the tool binaries"""
+
+    def error(self, message):
+        """Print the usage and exit with EX_USAGE
+
+        :param message: error message
+        :type message: str
+        """
+        self.print_usage(sys.stderr)
+        self.exit(EX_USAGE, f'{self.prog}: error: {message}\n')
+
+
+def setting(name, default, cast=float):
+    """Read a simulator setting from the environment
+
+    :param name: name of the setting without the FAST_GROW_SIMULATOR_ prefix
+    :type name: str
+    :param default: value if the setting is not set
+    :param cast: type of the setting
+    :type cast: type
+    :return: value of the setting
+    """
+    value = os.environ.get(f'FAST_GROW_SIMULATOR_{name}')
+    return default if value is None else cast(value)
+
+
+def simulate_work():
+    """Take as long as FAST_GROW_SIMULATOR_DELAY seconds, the run time of the simulated tool"""
+    time.sleep(setting('DELAY', 0))
+
+
+def read_text(path):
+    """Read an input file, exiting with EX_NOINPUT if it cannot be read
+
+    :param path: path of the input file
+    :type path: str
+    :return: contents of the file
+    :rtype: str
+    """
+    try:
+        with open(path, encoding='utf8') as input_file:
+            return input_file.read()
+    except OSError as error:
+        print(f'cannot read {path}: {error}', file=sys.stderr)
+        sys.exit(EX_NOINPUT)
+
+
+class Molecule:
+    """Molecule of a V2000 mol block"""
+
+    def __init__(self, name, atoms, bonds):
+        """Create a molecule
+
+        :param name: name of the molecule
+        :type name: str
+        :param atoms: element and (x, y, z) position of each atom
+        :type atoms: list
+        :param bonds: (first atom, second atom, bond order) of each bond, atoms counted from 1
+        :type bonds: list
+        """
+        self.name = name
+        self.atoms = atoms
+        self.bonds = bonds
+
+    @staticmethod
+    def parse(sdf_string):
+        """Parse the first molecule of an SDF string
+
+        :param sdf_string: contents of an SDF file
+        :type sdf_string: str
+        :raises ValueError: if the string does not start with a V2000 mol block
+        :return: the molecule
+        :rtype: Molecule
+        """
+        lines = sdf_string.split('\n')
+        if len(lines) < 4 or 'V2000' not in lines[3]:
+            raise ValueError('not a V2000 mol block')
+        nof_atoms, nof_bonds = int(lines[3][0:3]), int(lines[3][3:6])
+        atoms = []
+        for line in lines[4:4 + nof_atoms]:
+            position = (float(line[0:10]), float(line[10:20]), float(line[20:30]))
+            atoms.append((line[31:34].strip(), position))
+        bonds = []
+        for line in lines[4 + nof_atoms:4 + nof_atoms + nof_bonds]:
+            bonds.append((int(line[0:3]), int(line[3:6]), int(line[6:9])))
+        return Molecule(lines[0].strip(), atoms, bonds)
+
+    def mol_block(self, name=None):
+        """Write the molecule as a mol block
+
+        :param name: name of the written molecule, by default the name of the molecule
+        :type name: str
+        :return: V2000 mol block ending with M  END
+        :rtype: str
+        """
+        lines = [name or self.name, '  fast_grow simulator', '',
+                 f'{len(self.atoms):>3}{len(self.bonds):>3}  0  0  0  0            999 V2000']
+        for element, (x, y, z) in self.atoms:
+            lines.append(f'{x:>10.4f}{y:>10.4f}{z:>10.4f} {element:<3}{ATOM_FLAGS}')
+        for first, second, order in self.bonds:
+            lines.append(f'{first:>3}{second:>3}{order:>3}  0  0  0  0')
+        lines.append('M  END')
+        return '\n'.join(lines) + '\n'
+
+
+def pdb_atoms(pdb_string):
+    """Parse the atoms of a PDB file
+
+    :param pdb_string: contents of a PDB file
+    :type pdb_string: str
+    :return: dicts with the record, residue, element and position of every atom
+    :rtype: list
+    """
+    atoms = []
+    for line in pdb_string.split('\n'):
+        if not line.startswith(('ATOM', 'HETATM')):
+            continue
+        element = line[76:78].strip() or line[12:14].strip().lstrip('0123456789')
+        atoms.append({
+            'line': line,
+            'record': line[0:6].strip(),
+            'residue': '_'.join([line[17:20].strip(), line[21], line[22:26].strip()]),
+            'element': element.capitalize(),
+            'position': (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+        })
+    return atoms
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Simulator of the fast grow binary
+
+Fragments are processed in chunks at a configurable rate and every chunk is written as a hits file
+next to the results path, also if it has no hits. Hits are copies of the core with random scores,
+one per complex of the ensemble and the best of them as score. The fragment database is not read,
+its size is configured instead. Settings are read from the environment:
+
+- FAST_GROW_SIMULATOR_FRAGMENTS: fragments per fragment database, 1000 by default
+- FAST_GROW_SIMULATOR_RATE: fragments scored per second against a complex, 2000 by default
+- FAST_GROW_SIMULATOR_HIT_RATIO: hits per fragment, 0.01 by default
+- FAST_GROW_SIMULATOR_SCORE_MEAN and FAST_GROW_SIMULATOR_SCORE_SD: normal distribution of the
+  scores, -20 and 5 by default
+- FAST_GROW_SIMULATOR_SEED: seed of the scores, combined with the fragment database name
+"""
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from common import EX_DATAERR, ArgumentParser, Molecule, read_text, setting
+
+
+def hit(core, name, scores, rng):
+    """Write a hit as SDF entry
+
+    :param core: core the hit was grown from
+    :type core: Molecule
+    :param name: name of the hit
+    :type name: str
+    :param scores: complex names to draw scores for, empty without ensemble
+    :type scores: list
+    :param rng: random number generator of the scores
+    :type rng: random.Random
+    :return: SDF entry of the hit
+    :rtype: str
+    """
+    mean, deviation = setting('SCORE_MEAN', -20.0), setting('SCORE_SD', 5.0)
+    ensemble_scores = {complex_name: rng.gauss(mean, deviation) for complex_name in scores}
+    score = min(ensemble_scores.values()) if ensemble_scores else rng.gauss(mean, deviation)
+    properties = [('Score', score)] + [(complex_name.upper(), value)
+                                       for complex_name, value in ensemble_scores.items()]
+    return core.mol_block(name) + ''.join(
+        f'> <{prop}>\n{value:.4f}\n\n' for prop, value in properties) + '$$$$\n'
+
+
+def write_atomically(path, contents):
+    """Write a file that appears with its full contents
+
+    :param path: path of the file
+    :type path: pathlib.Path
+    :param contents: contents of the file
+    :type contents: str
+    """
+    temp_path = path.with_name(f'.{path.name}.tmp')
+    temp_path.write_text(contents, encoding='utf8')
+    os.replace(temp_path, path)
+
+
+def main():
+    """Grow a core"""
+    parser = ArgumentParser(description='Grow a core from a fragment database')
+    parser.add_argument('--ligand', required=True, help='SDF file of the core')
+    parser.add_argument('--results', required=True, help='SDF file to write the hits next to')
+    parser.add_argument('--database', required=True, help='fragment database')
+    parser.add_argument('--databasetype', type=int, default=0, help='0 postgres, 1 sqlite')
+    parser.add_argument('--chunksize', type=int, default=100, help='fragments per hits file')
+    parser.add_argument('--writemode', type=int, default=1, help='1 writes a file per chunk')
+    parser.add_argument('--ensemble', help='directory of the complexes of the ensemble')
+    parser.add_argument('--interactions', help='JSON file of the search points')
+    parser.add_argument('--username')
+    parser.add_argument('--port')
+    parser.add_argument('--host')
+    args = parser.parse_args()
+    if args.chunksize < 1:
+        parser.error('--chunksize must be positive')
+    try:
+        core = Molecule.parse(read_text(args.ligand))
+    except ValueError as error:
+        print(f'invalid core {args.ligand}: {error}', file=sys.stderr)
+        sys.exit(EX_DATAERR)
+    if args.interactions:
+        read_text(args.interactions)
+    complexes = sorted(path.stem for path in Path(args.ensemble).glob('*.pdb')) \
+        if args.ensemble else []
+    # ensemble scores are only reported for ensembles of several complexes
+    scores = complexes if len(complexes) > 1 else []
+    rng = random.Random(f'{setting("SEED", 0, int)}:{args.database}')
+    fragments = setting('FRAGMENTS', 1000, int)
+    seconds_per_fragment = max(len(complexes), 1) / setting('RATE', 2000.0)
+    hit_ratio = setting('HIT_RATIO', 0.01)
+
+    results = Path(args.results)
+    processed = 0
+    chunk = 0
+    while processed < fragments:
+        chunk_size = min(args.chunksize, fragments - processed)
+        time.sleep(chunk_size * seconds_per_fragment)
+        nof_hits = int((processed + chunk_size) * hit_ratio) - int(processed * hit_ratio)
+        processed += chunk_size
+        write_atomically(
+            results.with_name(f'{results.stem}_{chunk}{results.suffix}'),
+            ''.join(hit(core, f'{core.name}_{chunk}_{index}', scores, rng)
+                    for index in range(nof_hits)))
+        chunk += 1
+
+
+if __name__ == '__main__':
+    main()
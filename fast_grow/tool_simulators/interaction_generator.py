@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Simulator of the interaction generator binary
+
+Polar atoms of the pocket close to the ligand become the search points of the active site. Pairs of
+polar ligand and pocket atoms within hydrogen bond distance become ligand search points, pairs with
+waters of the pocket water search points. The search points are written to search_points.json.
+"""
+import json
+import math
+import os
+import sys
+from common import EX_DATAERR, ArgumentParser, Molecule, pdb_atoms, read_text, simulate_work
+
+ACTIVE_SITE_DISTANCE = 4.5
+HYDROGEN_BOND_DISTANCE = 3.5
+# hydrogen bonds up to this distance score 1, the score falls to 0 at HYDROGEN_BOND_DISTANCE
+OPTIMAL_DISTANCE = 2.8
+# polar atoms are treated as donors or acceptors by their element
+INTERACTION_TYPES = {'N': 'DONOR', 'O': 'ACCEPTOR'}
+COMPLEMENTS = {'DONOR': 'ACCEPTOR', 'ACCEPTOR': 'DONOR'}
+WATERS = {'HOH', 'WAT'}
+
+
+def interaction(position, interaction_type):
+    """Describe an interaction partner
+
+    :param position: position of the partner
+    :type position: tuple
+    :param interaction_type: DONOR or ACCEPTOR
+    :type interaction_type: str
+    :return: interaction of the search points format
+    :rtype: dict
+    """
+    return {'position': list(position), 'type': interaction_type}
+
+
+def search_points(pocket_atoms, ligand):
+    """Generate the search points of a ligand in a pocket
+
+    :param pocket_atoms: atoms of the pocket
+    :type pocket_atoms: list
+    :param ligand: ligand in the pocket
+    :type ligand: Molecule
+    :return: search points in the format of the interaction generator
+    :rtype: dict
+    """
+    polar_ligand_positions = [position for element, position in ligand.atoms
+                              if element in INTERACTION_TYPES]
+    mapping, site_points, ligand_points, water_points = [], [], [], []
+    for atom in pocket_atoms:
+        if atom['element'] not in INTERACTION_TYPES:
+            continue
+        distance = min((math.dist(atom['position'], position) for _, position in ligand.atoms),
+                       default=math.inf)
+        if distance > ACTIVE_SITE_DISTANCE:
+            continue
+        water = atom['residue'].split('_')[0] in WATERS
+        site_type = 'DONOR' if water else INTERACTION_TYPES[atom['element']]
+        if not water:
+            mapping.append([len(site_points), atom['residue']])
+            site_points.append(interaction(atom['position'], site_type))
+        for position in polar_ligand_positions:
+            distance = math.dist(atom['position'], position)
+            if distance > HYDROGEN_BOND_DISTANCE:
+                continue
+            (water_points if water else ligand_points).append({
+                'ligandInteraction': interaction(position, COMPLEMENTS[site_type]),
+                'siteInteraction': interaction(atom['position'], site_type),
+                'score': min(1.0, (HYDROGEN_BOND_DISTANCE - distance)
+                             / (HYDROGEN_BOND_DISTANCE - OPTIMAL_DISTANCE))
+            })
+    return {
+        'activeSiteSearchPoints': {'mapping': mapping, 'searchPoints': site_points},
+        'ligandSearchPoints': ligand_points,
+        'waterSearchPoints': water_points
+    }
+
+
+def main():
+    """Generate the search points of a ligand in a pocket"""
+    parser = ArgumentParser(description='Generate the search points of a ligand in a pocket')
+    parser.add_argument('--pocket', required=True, help='PDB file of the pocket')
+    parser.add_argument('--ligand', required=True, help='SDF file of the ligand')
+    parser.add_argument('--outdir', required=True, help='directory to write the results to')
+    args = parser.parse_args()
+    pocket_atoms = pdb_atoms(read_text(args.pocket))
+    try:
+        ligand = Molecule.parse(read_text(args.ligand))
+    except ValueError as error:
+        print(f'invalid ligand {args.ligand}: {error}', file=sys.stderr)
+        sys.exit(EX_DATAERR)
+    simulate_work()
+    with open(os.path.join(args.outdir, 'search_points.json'), 'w',
+              encoding='utf8') as search_points_file:
+        json.dump(search_points(pocket_atoms, ligand), search_points_file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Simulator of the preprocessor binary
+
+The pocket is written without ligands, waters and ions to the output directory. Unless a ligand is
+passed, the ligands of the pocket are extracted as well, named by their residue, e.g. P86_A_400.sdf.
+"""
+import math
+import os
+from common import ArgumentParser, Molecule, pdb_atoms, read_text, simulate_work
+
+SOLVENTS = {'HOH', 'WAT', 'DOD'}
+# longest distance of bonded atoms, longer for the large halogens and sulfur
+BOND_LENGTH = 1.9
+LONG_BOND_LENGTH = 2.2
+LONG_BOND_ELEMENTS = {'S', 'Cl', 'Br', 'I'}
+
+
+def bonds(atoms):
+    """Guess the bonds of ligand atoms by their distance
+
+    :param atoms: element and position of each atom
+    :type atoms: list
+    :return: (first atom, second atom, bond order) of each bond, atoms counted from 1
+    :rtype: list
+    """
+    guessed = []
+    for first, (first_element, first_position) in enumerate(atoms):
+        for second in range(first + 1, len(atoms)):
+            second_element, second_position = atoms[second]
+            length = LONG_BOND_LENGTH if {first_element, second_element} & LONG_BOND_ELEMENTS \
+                else BOND_LENGTH
+            if math.dist(first_position, second_position) <= length:
+                guessed.append((first + 1, second + 1, 1))
+    return guessed
+
+
+def output_path(directory, name, suffix):
+    """Find a path in the output directory that does not exist yet
+
+    :param directory: output directory
+    :type directory: str
+    :param name: name of the output
+    :type name: str
+    :param suffix: file suffix
+    :type suffix: str
+    :return: path named after the output, numbered if the name is taken
+    :rtype: str
+    """
+    path = os.path.join(directory, name + suffix)
+    number = 1
+    while os.path.exists(path):
+        number += 1
+        path = os.path.join(directory, f'{name}_{number}{suffix}')
+    return path
+
+
+def main():
+    """Preprocess a pocket"""
+    parser = ArgumentParser(description='Preprocess a pocket and extract its ligands')
+    parser.add_argument('--pocket', required=True, help='PDB file of the pocket')
+    parser.add_argument('--outdir', required=True, help='directory to write the results to')
+    parser.add_argument('--ligand', help='SDF file of the ligand, skips the ligand extraction')
+    args = parser.parse_args()
+    atoms = pdb_atoms(read_text(args.pocket))
+    if args.ligand:
+        read_text(args.ligand)
+    simulate_work()
+
+    hetero_residues = {}
+    for atom in atoms:
+        if atom['record'] == 'HETATM' and atom['residue'].split('_')[0] not in SOLVENTS:
+            hetero_residues.setdefault(atom['residue'], []).append(atom)
+    # single atom residues are ions
+    ligands = {residue: ligand_atoms for residue, ligand_atoms in hetero_residues.items()
+               if len(ligand_atoms) > 1}
+    pocket_lines = [atom['line'] for atom in atoms if atom['residue'] not in hetero_residues
+                    and atom['residue'].split('_')[0] not in SOLVENTS]
+    name = os.path.splitext(os.path.basename(args.pocket))[0]
+    with open(output_path(args.outdir, name, '.pdb'), 'w', encoding='utf8') as pocket_file:
+        pocket_file.write('\n'.join(pocket_lines + ['END']) + '\n')
+    if args.ligand:
+        return
+    for residue, ligand_atoms in ligands.items():
+        molecule_atoms = [(atom['element'], atom['position']) for atom in ligand_atoms]
+        molecule = Molecule(residue, molecule_atoms, bonds(molecule_atoms))
+        with open(output_path(args.outdir, residue, '.sdf'), 'w', encoding='utf8') as sdf_file:
+            sdf_file.write(molecule.mol_block() + '$$$$\n')
+
+
+if __name__ == '__main__':
+    main()
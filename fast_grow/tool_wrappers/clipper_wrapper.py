@@ -1,32 +1,65 @@
 """A django friendly wrapper around the clipper binary"""
-import logging
-import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
 from tempfile import NamedTemporaryFile
-from fast_grow.settings import CLIPPER
+from fast_grow.settings import CLIPPER, CLIPPER_POOL_SIZE
+from . import runner, workspace
 
 
 class ClipperWrapper:
     """A django friendly wrapper around the clipper binary"""
 
     @staticmethod
-    def clip(core):
+    def clip(core, ligand_path=None):
         """clip a core using the clipper binary
 
         :param core: core to clip
         :type core: fast_grow.models.Core
+        :param ligand_path: path to the already materialized ligand file of the core, materialized
+            if not passed
+        :type ligand_path: str
         """
         ligand = core.ligand
-        ligand_file = ligand.write_temp()
+        if ligand_path is None:
+            with workspace.model_file(ligand) as path:
+                ClipperWrapper.clip(core, path)
+            return
         with NamedTemporaryFile(mode='w+', suffix='.' + ligand.file_type) as temp_file:
             args = [
                 CLIPPER,
-                '--ligand', ligand_file.name,
+                '--ligand', ligand_path,
                 '--clipped', temp_file.name,
                 '--anchorposition', str(core.anchor),
                 '--linkposition', str(core.linker)
             ]
-            logging.debug(' '.join(args))
-            subprocess.check_call(args)
+            runner.run(args, 'clipper', core)
             temp_file.seek(0)
             core.file_string = temp_file.read()
             core.file_type = ligand.file_type
+
+    @staticmethod
+    def clip_many(cores):
+        """clip several cores running at most CLIPPER_POOL_SIZE clipper processes at once
+
+        Each ligand is only materialized once. The cores' ligands should already be loaded, the
+        clipper processes are managed from worker threads which do not touch the database.
+
+        :param cores: cores to clip
+        :type cores: list
+        :return: generator of (core, exception or None) tuples in order of completion
+        :rtype: generator
+        """
+        with ExitStack() as stack:
+            ligand_paths = {}
+            for core in cores:
+                if core.ligand_id not in ligand_paths:
+                    ligand_paths[core.ligand_id] = stack.enter_context(
+                        workspace.model_file(core.ligand))
+
+            with ThreadPoolExecutor(max_workers=CLIPPER_POOL_SIZE) as executor:
+                futures = {
+                    executor.submit(ClipperWrapper.clip, core, ligand_paths[core.ligand_id]): core
+                    for core in cores
+                }
+                for future in as_completed(futures):
+                    yield futures[future], future.exception()
@@ -1,122 +1,424 @@
 """A django model friendly wrapper around the fast grow binary"""
+import hashlib
 import json
 import logging
+import queue
 import subprocess
+import threading
 import time
+from collections import namedtuple
+from contextlib import ExitStack
+from itertools import islice
 from pathlib import Path
-from tempfile import NamedTemporaryFile, TemporaryDirectory
-from django.db import transaction
+from tempfile import TemporaryDirectory
+from django.db import models, transaction
 from fast_grow_server.settings import DATABASES
-from fast_grow.settings import FAST_GROW, CHUNK_SIZE
-from fast_grow.models import Hit
+from fast_grow.settings import FAST_GROW, HIT_BATCH_SIZE, HIT_QUEUE_SIZE
+from fast_grow.models import ChunkStatistics, Growing, Hit, Status, content_hash
+from fast_grow import instrumentation, tracing
+from . import runner, workspace
+from .versions import binary_version
+
+# hits parsed from a hits file and the time the file was last written
+HitsFile = namedtuple('HitsFile', ['path', 'written', 'hits'])
 
 
 class FastGrowWrapper:
     """A django model friendly wrapper around the fast grow binary"""
 
     @staticmethod
-    def grow(growing):
+    def fingerprint(growing):
+        """Compute a canonical fingerprint of all inputs of a growing and the fast grow version
+
+        The core is fingerprinted by its contents, so growings of cores that were not clipped
+        successfully yet have no fingerprint.
+
+        :param growing: growing to fingerprint
+        :type growing: fast_grow.models.Growing
+        :return: hex digest identifying the growing result or None without a clipped core
+        :rtype: str
+        """
+        if growing.core.status != Status.SUCCESS:
+            return None
+        complexes = sorted(
+            [cmplx.name, cmplx.file_hash or content_hash(cmplx.file_string)]
+            for cmplx in growing.ensemble.complex_set.all()
+        )
+        search_points = json.loads(growing.search_points) if growing.search_points else None
+        inputs = {
+            'complexes': complexes,
+            'core': [growing.core.file_type, content_hash(growing.core.file_string)],
+            'fragment_set': growing.fragment_set.name,
+            'search_points': search_points,
+            'version': binary_version(FAST_GROW)
+        }
+        if growing.fragment_set.version > 1:
+            # only set for rebuilt fragment sets so earlier fingerprints stay the same
+            inputs['fragment_set_version'] = growing.fragment_set.version
+        stop_criteria = growing.stop_criteria()
+        if stop_criteria:
+            # only set when used so fingerprints of growings without criteria stay the same
+            inputs['stop_criteria'] = stop_criteria
+        canonical_inputs = json.dumps(inputs, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical_inputs.encode('utf8')).hexdigest()
+
+    @staticmethod
+    def grow(growing, database_name=None, chunk_size=None):
         """Perform a growing according to the options in the growing model
 
+        A reader thread watches fast grow and parses its hits files into a bounded queue, while this
+        thread saves the hits in batches and checks for cancellation and the stop criteria.
+        Fragments are streamed in chunks of the size with the best recorded throughput for the
+        fragment set and ensemble size, the throughput of this growing is recorded as well. If the
+        growing is cancelled while running, fast grow is terminated, the hits written so far are
+        added and the growing status is set to cancelled. If a stop criterion of the growing is
+        met, fast grow is terminated the same way and the growing finishes with the hits so far.
+        Fast grow runs within the limits of TOOL_LIMITS and its resource usage is added to the
+        growing. If the growing failed in the meantime, e.g. in another shard, fast grow is
+        terminated without adding further hits.
+
         :param growing: growing model that defines the growing
         :type growing: fast_grow.models.Growing
+        :param database_name: fragment database to grow from, by default the whole fragment set
+        :type database_name: str
+        :param chunk_size: fixed chunk size instead of the adaptive one
+        :type chunk_size: int
+        :return: throughput measurements or None if cancelled or failed in the meantime
+        :rtype: dict
         """
-        core_file = growing.core.write_temp()
-        database_name = growing.fragment_set.name
-        with TemporaryDirectory() as directory:
+        if database_name is None:
+            database_name = growing.fragment_set.name
+        ensemble_size = growing.ensemble.complex_set.count()
+        if chunk_size is None:
+            chunk_size = ChunkStatistics.choose_chunk_size(growing.fragment_set, ensemble_size)
+        with ExitStack() as stack:
+            directory = stack.enter_context(TemporaryDirectory())
             hits_path = Path(directory) / 'hits.sdf'
+            core_path = stack.enter_context(workspace.model_file(growing.core))
             args = [
                 FAST_GROW,
-                '--ligand', core_file.name,
+                '--ligand', core_path,
                 '--results', str(hits_path),
+                '--chunksize', str(chunk_size),
+                '--writemode', '1'
+            ]
+            args.extend([
                 '--database', database_name,
-                '--chunksize', str(CHUNK_SIZE),
-                '--writemode', '1',
                 '--databasetype', '0',
                 '--username', DATABASES['default']['USER'],
                 '--port', DATABASES['default']['PORT'],
                 '--host', DATABASES['default']['HOST']
-            ]
-            ensemble_dir = growing.ensemble.write_temp()
-            args.extend(['--ensemble', ensemble_dir.name])
+            ])
+            ensemble_path = stack.enter_context(workspace.ensemble_directory(growing.ensemble))
+            args.extend(['--ensemble', ensemble_path])
             if growing.search_points:
-                search_points_file = FastGrowWrapper.write_temp_search_points(growing.search_points)
-                args.extend(['--interactions', search_points_file.name])
+                search_points_query = FastGrowWrapper.search_points_query(growing.search_points)
+                search_points_path = stack.enter_context(
+                    workspace.string_file('search_points.json', search_points_query))
+                args.extend(['--interactions', search_points_path])
+            complex_names = FastGrowWrapper.complex_names(growing)
             logging.info(' '.join(args))
-            process = subprocess.Popen(args)
-            seen = set()
+            # the span ends once fast grow was reaped and its outcome is known
+            stack.enter_context(tracing.span('binary', tool='fast_grow', chunk_size=chunk_size))
+            process = runner.ToolProcess(args, 'fast_grow')
+            started = process.started
+            reader = HitReader(process, directory, complex_names)
+            reader.start()
+            try:
+                with tracing.span('ingest'):
+                    ingested, outcome = FastGrowWrapper.ingest(
+                        growing, reader, started, chunk_size)
+            finally:
+                reader.stop()
+                if process.poll() is None:
+                    process.terminate()
+                reader.join()
+                instrumentation.observe('binary', time.monotonic() - started)
+                FastGrowWrapper.add_resource_usage(growing, process.usage)
+            if outcome in ('cancelled', 'stopped'):
+                ingested.extend(FastGrowWrapper.ingest_remaining(growing, reader, chunk_size))
+            if outcome == 'cancelled':
+                growing.status = Status.CANCELLED
+                return None
+            if outcome == 'abandoned':
+                return None
+            if outcome == 'timeout':
+                raise subprocess.TimeoutExpired(args, process.limits['timeout'])
+            # terminated processes exit with a negative code, as do processes killed by a limit
+            if outcome == 'finished' and process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, args)
+        if ingested:
+            lags = [lag for lag, _ in ingested]
+            logging.info('ingested %d hits files of growing %d, lag mean %.2fs max %.2fs',
+                         len(ingested), growing.id, sum(lags) / len(lags), max(lags))
+        return FastGrowWrapper.record_throughput(
+            growing, ensemble_size, chunk_size, time.monotonic() - started, ingested)
+
+    @staticmethod
+    def ingest(growing, reader, started, chunk_size):
+        """Save the hits parsed by a reader until fast grow exits, is cancelled or stopped early
+
+        All parsed hits files available at once are saved in batches of HIT_BATCH_SIZE hits in a
+        single transaction. The status and the stop criteria of the growing are checked and its
+        progress is updated about once a second. Growings that are no longer running, because they
+        were cancelled or another shard failed, are abandoned.
+
+        :param growing: growing to save hits to
+        :type growing: fast_grow.models.Growing
+        :param reader: started reader of the hits files
+        :type reader: HitReader
+        :param started: monotonic time fast grow was started at
+        :type started: float
+        :param chunk_size: chunk size of the growing
+        :type chunk_size: int
+        :raises Exception: re-raises exceptions of the reader
+        :return: (seconds between writing and saving, number of hits) of each saved hits file and
+            'finished', 'cancelled', 'abandoned', 'stopped' or 'timeout'
+        :rtype: tuple
+        """
+        ingested = []
+        checked = started
+        # fast grow writes a hits file per chunk
+        processed = 0
+        try:
             while True:
-                FastGrowWrapper.process_hits(growing, directory, seen)
-                time.sleep(1)
-                if process.poll() is not None:
-                    break
-            FastGrowWrapper.process_hits(growing, directory, seen)
+                files = reader.get(timeout=1)
+                FastGrowWrapper.save_hits(
+                    growing, [hit for hits_file in files for hit in hits_file.hits])
+                saved = time.time()
+                ingested.extend(
+                    (saved - hits_file.written, len(hits_file.hits)) for hits_file in files)
+                processed += len(files) * chunk_size
+                if reader.done:
+                    return ingested, 'finished'
+                if time.monotonic() - checked < 1:
+                    continue
+                checked = time.monotonic()
+                FastGrowWrapper.add_progress(growing, processed)
+                processed = 0
+                status = FastGrowWrapper.current_status(growing)
+                if status == Status.CANCELLED:
+                    return ingested, 'cancelled'
+                if status != Status.RUNNING:
+                    return ingested, 'abandoned'
+                if reader.process.timed_out():
+                    logging.error('fast grow exceeded its time limit, terminating growing %d',
+                                  growing.id)
+                    return ingested, 'timeout'
+                stop_reason = FastGrowWrapper.stop_reason(growing, checked - started)
+                if stop_reason:
+                    logging.info('stopping growing %d early: %s', growing.id, stop_reason)
+                    growing.stop_reason = stop_reason
+                    growing.save(update_fields=['stop_reason'])
+                    return ingested, 'stopped'
+        finally:
+            FastGrowWrapper.add_progress(growing, processed)
 
-            if process.returncode > 0:
-                stdout, stderr = process.communicate()
-                raise subprocess.CalledProcessError(
-                    process.returncode, args, output=stdout, stderr=stderr)
+    @staticmethod
+    def ingest_remaining(growing, reader, chunk_size):
+        """Save the hits left once fast grow was terminated and the reader was stopped
+
+        :param growing: growing to save hits to
+        :type growing: fast_grow.models.Growing
+        :param reader: stopped and joined reader of the hits files
+        :type reader: HitReader
+        :param chunk_size: chunk size of the growing
+        :type chunk_size: int
+        :return: (seconds between writing and saving, number of hits) of each saved hits file
+        :rtype: list
+        """
+        files = reader.drain()
+        FastGrowWrapper.save_hits(growing, [hit for hits_file in files for hit in hits_file.hits])
+        saved = time.time()
+        FastGrowWrapper.add_progress(growing, len(files) * chunk_size)
+        return [(saved - hits_file.written, len(hits_file.hits)) for hits_file in files]
 
     @staticmethod
-    def write_temp_search_points(search_points):
-        """Write a search points query file
+    def add_progress(growing, nof_fragments):
+        """Add processed fragments to the progress of a growing
 
-        :param search_points: search points to write
-        :type search_points: str
-        :return: temporary search point file
-        :rtype: File
+        Shards of a growing add their progress concurrently.
+
+        :param growing: growing to add progress to
+        :type growing: fast_grow.models.Growing
+        :param nof_fragments: number of fragments processed since the last update
+        :type nof_fragments: int
         """
-        temp_file = NamedTemporaryFile(mode='w+', suffix='search_points.json')
-        json.dump({'query': json.loads(search_points)}, temp_file)
-        temp_file.seek(0)
-        return temp_file
+        if nof_fragments:
+            Growing.objects.filter(id=growing.id).update(
+                fragments_processed=models.F('fragments_processed') + nof_fragments)
 
     @staticmethod
-    def process_hits(growing, directory_path, seen_files):
-        """Process unseen hit files
+    def record_throughput(growing, ensemble_size, chunk_size, seconds, ingested):
+        """Record the throughput of a growing in the chunk statistics
 
-        :param growing: growing to save hits to
+        Fast grow writes a hits file per chunk, the number of chunks is counted by the hits files.
+
+        :param growing: grown growing
+        :type growing: fast_grow.models.Growing
+        :param ensemble_size: number of complexes in the ensemble
+        :type ensemble_size: int
+        :param chunk_size: chunk size of the growing
+        :type chunk_size: int
+        :param seconds: runtime of fast grow
+        :type seconds: float
+        :param ingested: (lag, number of hits) of each ingested hits file
+        :type ingested: list
+        :return: throughput measurements
+        :rtype: dict
+        """
+        lags = [lag for lag, _ in ingested]
+        measurements = {
+            'chunk_size': chunk_size,
+            'seconds': seconds,
+            'nof_chunks': len(ingested),
+            'nof_hits': sum(nof_hits for _, nof_hits in ingested),
+            'lags': lags
+        }
+        ChunkStatistics.record(growing.fragment_set, ensemble_size, **measurements)
+        return measurements
+
+    @staticmethod
+    def current_status(growing):
+        """Get the status of a growing, which is changed by cancellation and failed shards
+
+        :param growing: growing to check
+        :type growing: fast_grow.models.Growing
+        :return: current status of the growing
+        :rtype: str
+        """
+        return Growing.objects.filter(id=growing.id).values_list('status', flat=True).first()
+
+    @staticmethod
+    def stop_reason(growing, elapsed):
+        """Check the stop criteria of a growing
+
+        Hits of all shards of the growing count towards the criteria.
+
+        :param growing: growing to check
         :type growing: fast_grow.models.Growing
-        :param directory_path: path to hits files
-        :type directory_path: str
-        :param seen_files: hits files already processed
-        :type seen_files: set
+        :param elapsed: seconds fast grow has been running
+        :type elapsed: float
+        :return: description of the met criterion or None
+        :rtype: str
         """
+        if growing.max_hits is not None and growing.hit_set.count() >= growing.max_hits:
+            return f'{growing.max_hits} hits found'
+        if growing.score_threshold is not None:
+            required_hits = growing.score_threshold_hits or 1
+            good_hits = growing.hit_set.filter(score__lte=growing.score_threshold).count()
+            if good_hits >= required_hits:
+                return f'{required_hits} hits scored {growing.score_threshold} or better'
+        if growing.time_budget is not None and elapsed >= growing.time_budget:
+            return f'time budget of {growing.time_budget}s exhausted'
+        return None
+
+    @staticmethod
+    def add_resource_usage(growing, usage):
+        """Add the resource usage of fast grow to a growing
+
+        Shards of a growing add their usage concurrently, the growing is locked to add it.
+
+        :param growing: grown growing
+        :type growing: fast_grow.models.Growing
+        :param usage: resource usage of fast grow or None if it was not reaped
+        :type usage: dict
+        """
+        if not usage:
+            return
         with transaction.atomic():
-            for hit_file in Path(directory_path).glob('*.sdf'):
-                if hit_file not in seen_files:
-                    FastGrowWrapper.add_hits(growing, hit_file)
-                    seen_files.add(hit_file)
+            locked = Growing.objects.select_for_update().only('resource_usage').get(id=growing.id)
+            growing.resource_usage = runner.add_usage(locked.resource_usage, usage)
+            locked.resource_usage = growing.resource_usage
+            locked.save(update_fields=['resource_usage'])
 
     @staticmethod
-    def add_hits(growing, hits_path):
-        """Add hits from a hits file to a growing
+    def search_points_query(search_points):
+        """Create a search points query
 
-        :param growing: growing to add hits to
+        :param search_points: search points of the query
+        :type search_points: str
+        :return: search points query file string
+        :rtype: str
+        """
+        return json.dumps({'query': json.loads(search_points)})
+
+    @staticmethod
+    def complex_names(growing):
+        """Get the names of the complexes hits are scored against individually
+
+        :param growing: growing of the hits
         :type growing: fast_grow.models.Growing
+        :return: complex names, empty for single complex ensembles
+        :rtype: list
+        """
+        names = list(growing.ensemble.complex_set.values_list('name', flat=True))
+        return names if len(names) > 1 else []
+
+    @staticmethod
+    def parse_hits(hits_path, complex_names):
+        """Parse the hits of a hits file
+
         :param hits_path: path to hits file
         :type hits_path: str
+        :param complex_names: names of the complexes to read ensemble scores of
+        :type complex_names: list
+        :return: unsaved hits without growing
+        :rtype: list
         """
         with open(hits_path, encoding='utf8') as hits_file:
             data = hits_file.read()
         mol_strings = [m + '$$$$\n' for m in data.split('$$$$\n') if m.strip()]
+        hits = []
         for mol_string in mol_strings:
             hit_name = FastGrowWrapper.get_mol_string_name(mol_string)[:254]
             hit_score = FastGrowWrapper.get_mol_string_prop('Score', mol_string, cast_to=float)
             ensemble_scores = {}
-            if growing.ensemble.complex_set.count() > 1:
-                for cmplx in growing.ensemble.complex_set.all():
-                    ensemble_scores[cmplx.name] = \
-                        FastGrowWrapper.get_mol_string_prop(cmplx.name.upper(), mol_string, cast_to=float)
-            hit = Hit(
-                growing=growing,
+            for name in complex_names:
+                ensemble_scores[name] = \
+                    FastGrowWrapper.get_mol_string_prop(name.upper(), mol_string, cast_to=float)
+            hits.append(Hit(
                 name=hit_name,
                 score=hit_score,
                 file_string=mol_string,
                 file_type='sdf',
                 ensemble_scores=ensemble_scores
-            )
-            hit.save()
+            ))
+        return hits
+
+    @staticmethod
+    def save_hits(growing, hits):
+        """Save hits of a growing in batches of HIT_BATCH_SIZE in a single transaction
+
+        :param growing: growing to add hits to
+        :type growing: fast_grow.models.Growing
+        :param hits: unsaved hits
+        :type hits: list
+        """
+        hits = iter(hits)
+        with instrumentation.timer('db_insert'), transaction.atomic():
+            while True:
+                batch = list(islice(hits, HIT_BATCH_SIZE))
+                if not batch:
+                    break
+                for hit in batch:
+                    hit.growing = growing
+                Hit.objects.bulk_create(batch)
+
+    @staticmethod
+    def add_hits(growing, hits_path):
+        """Add hits from a hits file to a growing
+
+        :param growing: growing to add hits to
+        :type growing: fast_grow.models.Growing
+        :param hits_path: path to hits file
+        :type hits_path: str
+        :return: number of added hits
+        :rtype: int
+        """
+        hits = FastGrowWrapper.parse_hits(hits_path, FastGrowWrapper.complex_names(growing))
+        FastGrowWrapper.save_hits(growing, hits)
+        return len(hits)
 
     @staticmethod
     def get_mol_string_name(mol_string):
@@ -148,3 +450,133 @@ class FastGrowWrapper:
                 property_pair[1] = cast_to(property_pair[1])
             return property_pair[1]
         return None
+
+
+class HitReader(threading.Thread):
+    """Thread parsing the hits files of a running fast grow process into a bounded queue
+
+    The reader blocks while HIT_QUEUE_SIZE parsed files wait to be saved, fast grow keeps writing
+    to disk meanwhile. After the process exited the remaining files are read and the reader is
+    done. A reader stopped before is drained of its queued and unread files. The reader does not
+    touch the database.
+    """
+
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, process, directory, complex_names):
+        """Create a reader of the hits files of a fast grow process
+
+        :param process: fast grow process
+        :type process: fast_grow.tool_wrappers.runner.ToolProcess
+        :param directory: directory fast grow writes hits files to
+        :type directory: str
+        :param complex_names: names of the complexes to read ensemble scores of
+        :type complex_names: list
+        """
+        super().__init__(daemon=True, name='hit reader')
+        self.process = process
+        self.directory = Path(directory)
+        self.complex_names = complex_names
+        self.queue = queue.Queue(maxsize=HIT_QUEUE_SIZE)
+        self.stopped = threading.Event()
+        self.done = False
+        # hits files put into the queue
+        self.seen = set()
+        # threads do not inherit the active span
+        self.traceparent = tracing.traceparent()
+
+    def run(self):
+        """Read the hits files within a span continuing the trace of the growing"""
+        with tracing.span('read_hits', self.traceparent):
+            self.read()
+
+    def read(self):
+        """Parse hits files until the process exited or the reader is stopped"""
+        try:
+            while not self.stopped.is_set():
+                exited = self.process.poll() is not None
+                for hits_file in self.parse_unseen():
+                    if not self.put(hits_file):
+                        return
+                    self.seen.add(hits_file.path)
+                if exited:
+                    self.put(None)
+                    return
+                self.stopped.wait(self.POLL_INTERVAL)
+        except Exception as error:  # pylint: disable=broad-except
+            self.put(error)
+
+    def parse_unseen(self):
+        """Parse the hits files not put into the queue yet in the order fast grow wrote them
+
+        :return: parsed hits files
+        :rtype: generator
+        """
+        for path in sorted(self.directory.glob('*.sdf')):
+            if path in self.seen:
+                continue
+            with instrumentation.timer('parse'):
+                hits = FastGrowWrapper.parse_hits(path, self.complex_names)
+            yield HitsFile(path, path.stat().st_mtime, hits)
+
+    def put(self, item):
+        """Put an item into the queue, blocking while it is full
+
+        :param item: parsed hits file, None once done or an exception
+        :return: False if the reader was stopped while waiting
+        :rtype: bool
+        """
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=self.POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, timeout):
+        """Get all parsed hits files available, waiting up to timeout seconds for the first one
+
+        :param timeout: seconds to wait for the first file
+        :type timeout: float
+        :raises Exception: re-raises exceptions of the reader
+        :return: parsed hits files
+        :rtype: list
+        """
+        files = []
+        try:
+            item = self.queue.get(timeout=timeout)
+            while True:
+                if item is None:
+                    self.done = True
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                files.append(item)
+                item = self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        return files
+
+    def stop(self):
+        """Stop reading, a reader blocked on a full queue gives up"""
+        self.stopped.set()
+
+    def drain(self):
+        """Get the hits files left in the queue and parse those the stopped reader did not read
+
+        :return: parsed hits files
+        :rtype: list
+        """
+        files = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, HitsFile):
+                files.append(item)
+        for hits_file in self.parse_unseen():
+            self.seen.add(hits_file.path)
+            files.append(hits_file)
+        return files
@@ -1,26 +1,65 @@
 """A django friendly wrapper around the interaction generator binary"""
+import hashlib
 import json
 import logging
 import os.path
-import subprocess
 
 from tempfile import TemporaryDirectory
+from fast_grow import instrumentation
+from fast_grow.models import SearchPointData, Status, content_hash
 from fast_grow.settings import INTERACTIONS
+from . import runner, workspace
+from .versions import binary_version
 
 
 class InteractionWrapper:
     """A django friendly wrapper around the interaction generator binary"""
 
+    @staticmethod
+    def cache_key(cmplx, ligand):
+        """Compute the cache key of interactions between a complex and a ligand
+
+        :param cmplx: complex of the interactions
+        :type cmplx: fast_grow.models.Complex
+        :param ligand: ligand of the interactions
+        :type ligand: fast_grow.models.Ligand
+        :return: hash of the complex and ligand contents and the generator version
+        :rtype: str
+        """
+        key = ':'.join([
+            cmplx.file_hash or content_hash(cmplx.file_string),
+            ligand.file_hash or content_hash(ligand.file_string),
+            binary_version(INTERACTIONS)
+        ])
+        return hashlib.sha256(key.encode('utf8')).hexdigest()
+
     @staticmethod
     def generate(search_point_data):
         """generate interaction data
 
+        If interactions were already generated from identical inputs the stored data is reused.
+
         :param search_point_data: input data to generate interactions from
         :type search_point_data: fast_grow.models.SearchPointData
         """
+        if not search_point_data.cache_key:
+            search_point_data.cache_key = InteractionWrapper.cache_key(
+                search_point_data.complex, search_point_data.ligand)
+        cached = SearchPointData.find_reusable(
+            search_point_data.cache_key,
+            search_point_data.complex,
+            search_point_data.ligand,
+            statuses=[Status.SUCCESS]
+        )
+        if cached and cached.id != search_point_data.id:
+            logging.debug('reusing search point data %d', cached.id)
+            search_point_data.data = cached.data
+            return
+
         with TemporaryDirectory() as output_directory:
             InteractionWrapper.execute_generation(search_point_data, output_directory)
-            data = InteractionWrapper.load_data(output_directory)
+            with instrumentation.timer('parse'):
+                data = InteractionWrapper.load_data(output_directory)
         search_point_data.data = json.dumps(data)
 
     @staticmethod
@@ -32,16 +71,15 @@ class InteractionWrapper:
         :param output_directory: output directory to generate data into
         :type output_directory: str
         """
-        ligand_file = search_point_data.ligand.write_temp()
-        complex_file = search_point_data.complex.write_temp()
-        args = [
-            INTERACTIONS,
-            '--pocket', complex_file.name,
-            '--ligand', ligand_file.name,
-            '--outdir', output_directory
-        ]
-        logging.debug(' '.join(args))
-        subprocess.check_call(args)
+        with workspace.model_file(search_point_data.ligand) as ligand_path, \
+                workspace.model_file(search_point_data.complex) as complex_path:
+            args = [
+                INTERACTIONS,
+                '--pocket', complex_path,
+                '--ligand', ligand_path,
+                '--outdir', output_directory
+            ]
+            runner.run(args, 'interactions', search_point_data)
 
     @staticmethod
     def load_data(output_directory):
@@ -1,10 +1,13 @@
 """A django model friendly wrapper around the preprocessor binary"""
-import logging
+from contextlib import ExitStack
+from itertools import islice
 from pathlib import Path
-import subprocess
 from tempfile import TemporaryDirectory
-from fast_grow.models import Ligand, Complex
-from fast_grow.settings import PREPROCESSOR
+from django.db import transaction
+from fast_grow import instrumentation
+from fast_grow.models import Ligand, Complex, content_hash
+from fast_grow.settings import PREPROCESSOR, PREPROCESSOR_BATCH_SIZE
+from . import runner, workspace
 
 
 class PreprocessorWrapper:
@@ -20,55 +23,65 @@ class PreprocessorWrapper:
         with TemporaryDirectory() as output_directory:
             PreprocessorWrapper.execute_preprocessing(ensemble, output_directory)
             result_path = Path(output_directory)
-            PreprocessorWrapper.load_results(result_path, ensemble)
+            # reading the result files is part of the insert, they are streamed into the batches
+            with instrumentation.timer('db_insert'):
+                PreprocessorWrapper.load_results(result_path, ensemble)
 
     @staticmethod
     def execute_preprocessing(ensemble, output_directory):
         """Execute the preprocessor binary on the ensemble in the model
 
-        If a ligand was explicitly specified it is considered in the commandline call.
+        If a ligand was explicitly specified it is considered in the commandline call. The original
+        complexes are left untouched, they are only replaced once all results are loaded.
 
         :param ensemble: django ensemble model to be preprocessed
         :type ensemble: fast_grow.models.Ensemble
         :param output_directory: directory to write output to
         :type output_directory: str
         """
-        ligand_file = None
-        if ensemble.ligand_set.count() == 1:
-            ligand_file = ensemble.ligand_set.first().write_temp()
-        elif ensemble.ligand_set.count() > 1:
-            error_string = f'ensemble({ensemble.id}) to be processed has more than one ligand'
-            raise RuntimeError(error_string)
-
-        for cmplx in ensemble.complex_set.all():
-            complex_file = cmplx.write_temp()
-            cmplx.delete()
-            # implicit zero case leaves ligand file at None
-            args = [
-                PREPROCESSOR,
-                '--pocket', complex_file.name,
-                '--outdir', output_directory,
-            ]
-            if ligand_file:
-                args.extend(['--ligand', ligand_file.name])
-            logging.debug(' '.join(args))
-            subprocess.check_call(args)
+        with ExitStack() as stack:
+            ligand_path = None
+            if ensemble.ligand_set.count() == 1:
+                ligand_path = stack.enter_context(
+                    workspace.model_file(ensemble.ligand_set.defer('file_string').first()))
+            elif ensemble.ligand_set.count() > 1:
+                error_string = f'ensemble({ensemble.id}) to be processed has more than one ligand'
+                raise RuntimeError(error_string)
+
+            for cmplx in ensemble.complex_set.defer('file_string'):
+                with workspace.model_file(cmplx) as complex_path:
+                    # implicit zero case leaves ligand path at None
+                    args = [
+                        PREPROCESSOR,
+                        '--pocket', complex_path,
+                        '--outdir', output_directory,
+                    ]
+                    if ligand_path:
+                        args.extend(['--ligand', ligand_path])
+                    runner.run(args, 'preprocessor', ensemble)
 
     @staticmethod
     def load_results(path, ensemble):
         """Load all results into the database
 
+        The original complexes are swapped for the processed ones in a single transaction, so
+        readers either see the unprocessed or the fully processed ensemble and a failure leaves the
+        ensemble as it was.
+
         :param path: path to the results
         :type path: pathlib.Path
         :param ensemble: ensemble to load results into
         :type ensemble: fast_grow.models.Ensemble
         """
-        PreprocessorWrapper.load_complexes(path, ensemble)
-        if ensemble.ligand_set.count() == 1:
-            # no need to load ligands
-            return
+        load_ligands = ensemble.ligand_set.count() != 1
+        with transaction.atomic():
+            ensemble.complex_set.all().delete()
+            PreprocessorWrapper.load_complexes(path, ensemble)
+            if not load_ligands:
+                # no need to load ligands
+                return
 
-        PreprocessorWrapper.load_ligands(path, ensemble)
+            PreprocessorWrapper.load_ligands(path, ensemble)
 
     @staticmethod
     def load_complexes(path, ensemble):
@@ -79,13 +92,7 @@ class PreprocessorWrapper:
         :param ensemble: ensemble to load results into
         :type ensemble: fast_grow.models.Ensemble
         """
-        pdb_files = list(path.glob('*.pdb'))
-        for pdb_file in pdb_files:
-            with pdb_file.open() as complex_file:
-                complex_string = complex_file.read()
-            cmplx = Complex(
-                ensemble=ensemble, name=pdb_file.stem, file_type='pdb', file_string=complex_string)
-            cmplx.save()
+        PreprocessorWrapper.bulk_create(Complex, PreprocessorWrapper.read_complexes(path, ensemble))
 
     @staticmethod
     def load_ligands(path, ensemble):
@@ -96,10 +103,66 @@ class PreprocessorWrapper:
         :param ensemble: ensemble to load results into
         :type ensemble: fast_grow.models.Ensemble
         """
-        sd_files = list(path.glob('*.sdf'))
-        for sd_file in sd_files:
-            with sd_file.open() as ligand_file:
+        PreprocessorWrapper.bulk_create(Ligand, PreprocessorWrapper.read_ligands(path, ensemble))
+
+    @staticmethod
+    def read_complexes(path, ensemble):
+        """Lazily read processed complexes one file at a time
+
+        :param path: path to the results
+        :type path: pathlib.Path
+        :param ensemble: ensemble the complexes belong to
+        :type ensemble: fast_grow.models.Ensemble
+        :return: generator of unsaved complexes
+        :rtype: generator
+        """
+        for pdb_file in sorted(path.glob('*.pdb')):
+            with pdb_file.open(encoding='utf8') as complex_file:
+                complex_string = complex_file.read()
+            # bulk inserts bypass save, so the content hash is set explicitly
+            yield Complex(
+                ensemble=ensemble,
+                name=pdb_file.stem,
+                file_type='pdb',
+                file_string=complex_string,
+                file_hash=content_hash(complex_string)
+            )
+
+    @staticmethod
+    def read_ligands(path, ensemble):
+        """Lazily read extracted ligands one file at a time
+
+        :param path: path to the results
+        :type path: pathlib.Path
+        :param ensemble: ensemble the ligands belong to
+        :type ensemble: fast_grow.models.Ensemble
+        :return: generator of unsaved ligands
+        :rtype: generator
+        """
+        for sd_file in sorted(path.glob('*.sdf')):
+            with sd_file.open(encoding='utf8') as ligand_file:
                 ligand_string = ligand_file.read()
-            ligand = Ligand(
-                ensemble=ensemble, name=sd_file.stem, file_type='sdf', file_string=ligand_string)
-            ligand.save()
+            # bulk inserts bypass save, so the content hash is set explicitly
+            yield Ligand(
+                ensemble=ensemble,
+                name=sd_file.stem,
+                file_type='sdf',
+                file_string=ligand_string,
+                file_hash=content_hash(ligand_string)
+            )
+
+    @staticmethod
+    def bulk_create(model, instances):
+        """Insert instances in batches without materializing all of them at once
+
+        :param model: model class of the instances
+        :type model: type
+        :param instances: iterable of unsaved model instances
+        :type instances: iterable
+        """
+        instances = iter(instances)
+        while True:
+            batch = list(islice(instances, PREPROCESSOR_BATCH_SIZE))
+            if not batch:
+                break
+            model.objects.bulk_create(batch)
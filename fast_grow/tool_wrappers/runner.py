@@ -0,0 +1,182 @@
+"""Shared runner of the tool binaries
+
+Tools run in a session of their own with the resource limits of TOOL_LIMITS, so a runaway tool fails
+on its own instead of exhausting the worker host. Memory and CPU time are limited by rlimits, which
+the kernel also applies to the children of a tool, the wall-clock time by terminating the session.
+Every tool process is reaped with wait4, which reports the resource usage of exactly this process.
+Tools get the trace context of the active span in the TRACEPARENT environment variable.
+"""
+import logging
+import os
+import resource
+import signal
+import subprocess
+import threading
+import time
+from fast_grow import instrumentation, tracing
+from fast_grow.settings import TOOL_LIMITS, TERMINATION_TIMEOUT
+
+RLIMITS = {'memory': resource.RLIMIT_AS, 'cpu': resource.RLIMIT_CPU}
+
+
+class ToolProcess:
+    """Tool binary running in a session of its own with resource limits"""
+
+    def __init__(self, args, tool, **kwargs):
+        """Start a tool binary
+
+        :param args: command line of the tool
+        :type args: list
+        :param tool: name of the tool in TOOL_LIMITS
+        :type tool: str
+        :param kwargs: further arguments of subprocess.Popen
+        """
+        self.args = args
+        self.limits = TOOL_LIMITS.get(tool, {})
+        self.usage = None
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        # limits are set from the parent, a preexec_fn is not safe in threaded workers
+        kwargs['env'] = tracing.environment(kwargs.get('env'))
+        self.process = subprocess.Popen(args, start_new_session=True, **kwargs)
+        try:
+            for limit, rlimit in RLIMITS.items():
+                if self.limits.get(limit):
+                    resource.prlimit(self.process.pid, rlimit, (self.limits[limit],) * 2)
+        except ProcessLookupError:
+            # the process already exited
+            pass
+
+    @property
+    def pid(self):
+        """Process id of the tool, which is also the id of its session"""
+        return self.process.pid
+
+    @property
+    def returncode(self):
+        """Exit code of the tool, negative if it was killed by a signal, None while it runs"""
+        return self.process.returncode
+
+    def poll(self):
+        """Reap the tool if it exited
+
+        :return: exit code or None if the tool is still running
+        :rtype: int
+        """
+        with self.lock:
+            if self.process.returncode is None:
+                pid, status, rusage = os.wait4(self.process.pid, os.WNOHANG)
+                if pid:
+                    self.reaped(status, rusage)
+        return self.process.returncode
+
+    def reaped(self, status, rusage):
+        """Record the exit code and resource usage of the reaped tool
+
+        :param status: wait status
+        :type status: int
+        :param rusage: resource usage reported by wait4
+        :type rusage: resource.struct_rusage
+        """
+        wall_seconds = time.monotonic() - self.started
+        self.process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) \
+            else os.WEXITSTATUS(status)
+        self.usage = {
+            'processes': 1,
+            'wall_seconds': wall_seconds,
+            'user_seconds': rusage.ru_utime,
+            'system_seconds': rusage.ru_stime,
+            # kilobytes on linux, the kernel counts the worker memory the tool was forked with
+            'max_rss_bytes': rusage.ru_maxrss * 1024,
+            'read_blocks': rusage.ru_inblock,
+            'write_blocks': rusage.ru_oublock
+        }
+
+    def wait(self, timeout=None):
+        """Wait for the tool to exit
+
+        :param timeout: seconds to wait at most
+        :type timeout: float
+        :raises subprocess.TimeoutExpired: if the tool is still running after the timeout
+        :return: exit code
+        :rtype: int
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = 0.001
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            time.sleep(interval)
+            interval = min(interval * 2, 0.1)
+        return self.returncode
+
+    def timed_out(self):
+        """Check whether the tool exceeded its wall-clock limit
+
+        :return: whether the tool runs longer than its timeout
+        :rtype: bool
+        """
+        timeout = self.limits.get('timeout')
+        return bool(timeout) and time.monotonic() - self.started > timeout
+
+    def terminate(self):
+        """Terminate the tool and all processes of its session
+
+        Processes that do not exit within TERMINATION_TIMEOUT seconds are killed.
+        """
+        try:
+            os.killpg(self.pid, signal.SIGTERM)
+            self.wait(timeout=TERMINATION_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.pid, signal.SIGKILL)
+            self.wait()
+        except ProcessLookupError:
+            # the process exited in the meantime
+            self.wait()
+
+
+def run(args, tool, job):
+    """Run a tool binary to completion within its limits
+
+    The resource usage of the tool is added to the resource usage of the job, also if it failed.
+
+    :param args: command line of the tool
+    :type args: list
+    :param tool: name of the tool in TOOL_LIMITS
+    :type tool: str
+    :param job: model instance of the job with a resource_usage field
+    :type job: django.db.models.Model
+    :raises subprocess.TimeoutExpired: if the tool exceeded its wall-clock limit
+    :raises subprocess.CalledProcessError: if the tool failed or was killed
+    """
+    logging.debug(' '.join(args))
+    with instrumentation.timer('binary'):
+        process = ToolProcess(args, tool)
+        try:
+            process.wait(timeout=process.limits.get('timeout'))
+        except subprocess.TimeoutExpired:
+            logging.error('%s exceeded its limit of %ss, terminating it', tool,
+                          process.limits['timeout'])
+            process.terminate()
+            raise
+        finally:
+            if process.usage:
+                job.resource_usage = add_usage(job.resource_usage, process.usage)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args)
+
+
+def add_usage(total, usage):
+    """Add the resource usage of a tool process to the usage of a job
+
+    :param total: resource usage of the job so far or None
+    :type total: dict
+    :param usage: resource usage of a tool process
+    :type usage: dict
+    :return: summed resource usage, the peak memory is the maximum of the processes
+    :rtype: dict
+    """
+    if not total:
+        return dict(usage)
+    return {key: max(total.get(key, 0), value) if key == 'max_rss_bytes'
+            else total.get(key, 0) + value for key, value in usage.items()}
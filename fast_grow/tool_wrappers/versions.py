@@ -0,0 +1,42 @@
+"""Identification of tool binary versions"""
+import hashlib
+import os
+
+_HASHES = {}
+
+
+def binary_version(path):
+    """Get a version identifier of a binary
+
+    The identifier is the content hash of the binary. A binary that does not exist is identified as
+    'unavailable'.
+
+    :param path: path to the binary
+    :type path: str
+    :return: version identifier
+    :rtype: str
+    """
+    try:
+        return file_hash(path)
+    except OSError:
+        return 'unavailable'
+
+
+def file_hash(path):
+    """Get the content hash of a file, cached per process until the file is replaced
+
+    :param path: path to the file
+    :type path: str
+    :raises OSError: if the file cannot be read
+    :return: hex digest of the file contents
+    :rtype: str
+    """
+    stat = os.stat(path)
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _HASHES:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        _HASHES[key] = digest.hexdigest()
+    return _HASHES[key]
@@ -0,0 +1,197 @@
+"""Worker-local content-addressed cache of tool input files
+
+Input files are materialized once per worker host into a directory named by the hash of their names
+and contents and handed to the tool binaries by path. Every user of an entry holds a shared flock on
+the entry's lock file, so the kernel counts the references across worker processes and entries are
+only evicted while no process uses them.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from fast_grow import instrumentation, tracing
+from fast_grow.models import content_hash
+from fast_grow.settings import WORKSPACE_DIR, WORKSPACE_MAX_BYTES
+
+
+@contextmanager
+def materialize(files):
+    """Materialize files in a workspace directory for the duration of the context
+
+    :param files: (filename, content hash, function returning the file string) tuples, the file
+        string is only loaded if the entry is not cached yet
+    :type files: list
+    :return: path to the directory containing the files
+    :rtype: str
+    """
+    root = Path(WORKSPACE_DIR)
+    root.mkdir(parents=True, exist_ok=True)
+    key = hashlib.sha256(json.dumps(
+        sorted([filename, file_hash] for filename, file_hash, _ in files)).encode('utf8')
+    ).hexdigest()
+    entry = root / key
+    started = time.perf_counter()
+    lock_file = acquire(root / f'{key}.lock', fcntl.LOCK_SH)
+    try:
+        with tracing.span('materialize') as materialize_span:
+            result = 'hit'
+            if not entry.exists():
+                with root_lock(root):
+                    if not entry.exists():
+                        result = 'miss'
+                        contents = [(filename, load().encode('utf8'))
+                                    for filename, _, load in files]
+                        evict(root, sum(len(content) for _, content in contents))
+                        staging = Path(tempfile.mkdtemp(prefix='.staging-', dir=root))
+                        for filename, content in contents:
+                            (staging / filename).write_bytes(content)
+                        os.rename(staging, entry)
+            # the modification time orders the entries for eviction
+            os.utime(entry)
+            if materialize_span:
+                materialize_span.attributes['result'] = result
+        instrumentation.observe('materialize', time.perf_counter() - started)
+        instrumentation.increment('fast_grow_workspace_total', {'result': result})
+        yield str(entry)
+    finally:
+        lock_file.close()
+
+
+@contextmanager
+def model_file(instance):
+    """Materialize the file of a complex, ligand or core
+
+    A deferred file string of instances with a stored content hash is only loaded on a cache miss.
+
+    :param instance: model instance with name, file_type and file_string
+    :type instance: django.db.models.Model
+    :return: path to the file
+    :rtype: str
+    """
+    filename = instance.name + '.' + instance.file_type
+    with materialize([model_entry(instance)]) as directory:
+        yield os.path.join(directory, filename)
+
+
+@contextmanager
+def ensemble_directory(ensemble):
+    """Materialize a directory containing the complexes of an ensemble
+
+    :param ensemble: ensemble to materialize
+    :type ensemble: fast_grow.models.Ensemble
+    :return: path to the directory
+    :rtype: str
+    """
+    complexes = ensemble.complex_set.defer('file_string')
+    with materialize([model_entry(cmplx) for cmplx in complexes]) as directory:
+        yield directory
+
+
+@contextmanager
+def string_file(filename, file_string):
+    """Materialize a file from a string
+
+    :param filename: name of the file
+    :type filename: str
+    :param file_string: content of the file
+    :type file_string: str
+    :return: path to the file
+    :rtype: str
+    """
+    with materialize([(filename, content_hash(file_string), lambda: file_string)]) as directory:
+        yield os.path.join(directory, filename)
+
+
+def model_entry(instance):
+    """Describe the file of a model instance for materialization
+
+    :param instance: model instance with name, file_type and file_string
+    :type instance: django.db.models.Model
+    :return: filename, content hash and file string loader
+    :rtype: tuple
+    """
+    file_hash = getattr(instance, 'file_hash', None) or content_hash(instance.file_string)
+    return instance.name + '.' + instance.file_type, file_hash, lambda: instance.file_string
+
+
+def acquire(lock_path, operation):
+    """Open and flock a lock file
+
+    An evicting process unlinks the lock file of an entry, a lock acquired on an unlinked file is
+    retried on the current one.
+
+    :param lock_path: path to the lock file
+    :type lock_path: pathlib.Path
+    :param operation: flock operation
+    :type operation: int
+    :return: open lock file, closing it releases the lock
+    :rtype: File
+    """
+    while True:
+        # pylint: disable=consider-using-with
+        lock_file = open(lock_path, 'a', encoding='utf8')
+        try:
+            fcntl.flock(lock_file, operation)
+        except OSError:
+            lock_file.close()
+            raise
+        try:
+            if os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+
+@contextmanager
+def root_lock(root):
+    """Hold the exclusive lock of a workspace to create or evict entries
+
+    :param root: workspace directory
+    :type root: pathlib.Path
+    """
+    with open(root / '.lock', 'a', encoding='utf8') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def evict(root, required_bytes):
+    """Evict least recently used entries until the required bytes fit into WORKSPACE_MAX_BYTES
+
+    Entries in use are never evicted. Has to be called holding the root lock.
+
+    :param root: workspace directory
+    :type root: pathlib.Path
+    :param required_bytes: size of the entry to be created
+    :type required_bytes: int
+    """
+    entries = []
+    for path in root.iterdir():
+        if path.name.startswith('.staging-'):
+            # left behind by a crashed process, staging only happens under the root lock
+            shutil.rmtree(path, ignore_errors=True)
+        elif path.is_dir():
+            size = sum(file.stat().st_size for file in path.iterdir())
+            entries.append((path.stat().st_mtime, path, size))
+    total_bytes = sum(size for _, _, size in entries)
+    for _, path, size in sorted(entries):
+        if total_bytes + required_bytes <= WORKSPACE_MAX_BYTES:
+            return
+        lock_path = root / f'{path.name}.lock'
+        try:
+            lock_file = acquire(lock_path, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            continue
+        with lock_file:
+            shutil.rmtree(path)
+            lock_path.unlink()
+        total_bytes -= size
+    if total_bytes + required_bytes > WORKSPACE_MAX_BYTES:
+        logging.warning('workspace %s exceeds %d bytes, entries in use cannot be evicted',
+                        root, WORKSPACE_MAX_BYTES)
@@ -0,0 +1,387 @@
+"""Tracing of requests and jobs across the web server, celery and the tool binaries
+
+Spans carry the W3C trace context: requests continue the trace of their traceparent header, jobs
+continue the trace of the request or job that published them and tool binaries get the context of
+their span in the TRACEPARENT environment variable. Growings keep the context of the request that
+created them, so their jobs continue its trace after waiting in the fair-share scheduler and polls
+of the growing link to it.
+
+Spans are buffered in process and exported in the OTLP JSON encoding by a background thread once
+TRACING_BATCH_SIZE spans are buffered, every TRACING_EXPORT_INTERVAL seconds and when the process
+or worker shuts down, so requests and jobs never wait for the export. Spans are either appended as a
+line to TRACING_FILE or posted to the OTLP/HTTP collector at TRACING_OTLP_ENDPOINT. Tracing is
+disabled unless a TRACING_EXPORTER is set.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.request
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from celery.signals import before_task_publish, task_prerun, task_postrun, \
+    worker_process_shutdown, worker_shutdown
+from django.core.exceptions import MiddlewareNotUsed
+from .settings import TRACING_BATCH_SIZE, TRACING_EXPORTER, TRACING_EXPORT_INTERVAL, TRACING_FILE, \
+    TRACING_OTLP_ENDPOINT
+
+SERVICE = 'fast_grow'
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+# OTLP span kinds and status codes
+KINDS = {'internal': 1, 'server': 2, 'client': 3, 'producer': 4, 'consumer': 5}
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_CURRENT = ContextVar('span', default=None)
+_LOCK = threading.Lock()
+_PENDING = []
+# serializes exports so spans are written in the order they were taken from the buffer
+_EXPORT_LOCK = threading.Lock()
+# exporter threads by process id, forked worker processes start their own
+_EXPORTERS = {}
+# spans of the running jobs by task id
+_JOBS = {}
+
+
+class Span:
+    """Timed operation within a trace"""
+
+    def __init__(self, name, trace_id, parent_id=None, kind='internal', attributes=None):
+        """Start a span
+
+        :param name: name of the operation
+        :type name: str
+        :param trace_id: hex id of the trace
+        :type trace_id: str
+        :param parent_id: hex id of the parent span, None for root spans
+        :type parent_id: str
+        :param kind: kind of the span, one of KINDS
+        :type kind: str
+        :param attributes: attributes of the span
+        :type attributes: dict
+        """
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.links = []
+        self.error = None
+        self.start = time.time_ns()
+        self.end = None
+
+    @property
+    def traceparent(self):
+        """W3C traceparent of the span"""
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def link(self, traceparent):
+        """Link the span to another trace, e.g. the trace that created a polled growing
+
+        :param traceparent: W3C traceparent of the linked span, ignored if invalid
+        :type traceparent: str
+        """
+        context = parse(traceparent)
+        if context:
+            self.links.append(context)
+
+    def otlp(self):
+        """Encode the span in the OTLP JSON encoding
+
+        :return: OTLP span
+        :rtype: dict
+        """
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': KINDS[self.kind],
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': [{'key': key, 'value': otlp_value(value)}
+                           for key, value in self.attributes.items()],
+            'status': {'code': STATUS_ERROR, 'message': self.error} if self.error is not None
+                      else {'code': STATUS_OK}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.links:
+            span['links'] = [{'traceId': trace_id, 'spanId': span_id}
+                             for trace_id, span_id in self.links]
+        return span
+
+
+def otlp_value(value):
+    """Encode an attribute value in the OTLP JSON encoding
+
+    :param value: attribute value
+    :return: OTLP any value
+    :rtype: dict
+    """
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def parse(traceparent):
+    """Parse a W3C traceparent
+
+    :param traceparent: traceparent header value
+    :type traceparent: str
+    :return: trace id and span id or None if the traceparent is missing or invalid
+    :rtype: tuple
+    """
+    match = TRACEPARENT.match(traceparent.strip().lower()) if traceparent else None
+    if not match or set(match.group(1)) == {'0'} or set(match.group(2)) == {'0'}:
+        return None
+    return match.group(1), match.group(2)
+
+
+def enabled():
+    """Check whether tracing is enabled
+
+    :return: whether spans are recorded
+    :rtype: bool
+    """
+    return TRACING_EXPORTER is not None
+
+
+def current():
+    """Get the active span of this thread
+
+    :return: active span or None
+    :rtype: Span
+    """
+    return _CURRENT.get()
+
+
+def traceparent():
+    """Get the W3C traceparent of the active span of this thread
+
+    :return: traceparent or None outside of spans
+    :rtype: str
+    """
+    active = _CURRENT.get()
+    return active.traceparent if active else None
+
+
+@contextmanager
+def span(name, parent=None, kind='internal', **attributes):
+    """Record the context as a span, the span is active within the context
+
+    :param name: name of the operation
+    :type name: str
+    :param parent: W3C traceparent of a remote parent, by default the active span is the parent
+    :type parent: str
+    :param kind: kind of the span, one of KINDS
+    :type kind: str
+    :param attributes: attributes of the span
+    :return: the span or None if tracing is disabled
+    :rtype: Span
+    """
+    if not enabled():
+        yield None
+        return
+    context = parse(parent)
+    active = _CURRENT.get()
+    if context:
+        trace_id, parent_id = context
+    elif active:
+        trace_id, parent_id = active.trace_id, active.span_id
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+    new_span = Span(name, trace_id, parent_id, kind, attributes)
+    token = _CURRENT.set(new_span)
+    try:
+        yield new_span
+    except BaseException as error:
+        new_span.error = f'{type(error).__name__}: {error}'
+        raise
+    finally:
+        _CURRENT.reset(token)
+        new_span.end = time.time_ns()
+        record(new_span)
+
+
+def environment(env=None):
+    """Get the environment of a tool binary carrying the context of the active span
+
+    :param env: environment of the tool, by default the environment of this process
+    :type env: dict
+    :return: environment with TRACEPARENT or env unchanged outside of spans
+    :rtype: dict
+    """
+    context = traceparent()
+    if not context:
+        return env
+    return {**(os.environ if env is None else env), 'TRACEPARENT': context}
+
+
+class Exporter(threading.Thread):
+    """Thread exporting the buffered spans every TRACING_EXPORT_INTERVAL seconds or once woken"""
+
+    def __init__(self):
+        """Create an exporter"""
+        super().__init__(daemon=True, name='span exporter')
+        self.full = threading.Event()
+
+    def run(self):
+        """Export until the process exits"""
+        while True:
+            self.full.wait(TRACING_EXPORT_INTERVAL)
+            self.full.clear()
+            try:
+                export()
+            except Exception:  # pylint: disable=broad-except
+                logging.exception('cannot export spans')
+
+
+def exporter():
+    """Get the exporter of this process, it is started on first use
+
+    :return: running exporter
+    :rtype: Exporter
+    """
+    with _LOCK:
+        pid = os.getpid()
+        if pid not in _EXPORTERS:
+            _EXPORTERS[pid] = Exporter()
+            _EXPORTERS[pid].start()
+        return _EXPORTERS[pid]
+
+
+def record(finished_span):
+    """Buffer a finished span, the exporter is woken once the buffer holds TRACING_BATCH_SIZE spans
+
+    :param finished_span: finished span
+    :type finished_span: Span
+    """
+    with _LOCK:
+        _PENDING.append(finished_span)
+        full = len(_PENDING) >= TRACING_BATCH_SIZE
+    running_exporter = exporter()
+    if full:
+        running_exporter.full.set()
+
+
+def export():
+    """Export the buffered spans
+
+    Tracing must never fail a request or job, spans that cannot be exported are dropped.
+    """
+    with _EXPORT_LOCK:
+        with _LOCK:
+            spans = list(_PENDING)
+            _PENDING.clear()
+        if spans and enabled():
+            write(spans)
+
+
+@atexit.register
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush(**_):
+    """Export the buffered spans before the process or worker shuts down"""
+    export()
+
+
+def write(spans):
+    """Write spans to the TRACING_EXPORTER
+
+    :param spans: finished spans
+    :type spans: list
+    """
+    payload = json.dumps({'resourceSpans': [{
+        'resource': {'attributes': [
+            {'key': 'service.name', 'value': otlp_value(SERVICE)},
+            {'key': 'process.pid', 'value': otlp_value(os.getpid())}
+        ]},
+        'scopeSpans': [{'scope': {'name': __name__}, 'spans': [s.otlp() for s in spans]}]
+    }]})
+    try:
+        if TRACING_EXPORTER == 'file':
+            with open(TRACING_FILE, 'a', encoding='utf8') as trace_file:
+                trace_file.write(payload + '\n')
+        else:
+            request = urllib.request.Request(
+                TRACING_OTLP_ENDPOINT, data=payload.encode('utf8'),
+                headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=5):
+                pass
+    except OSError as error:
+        logging.warning('dropping %d spans: %s', len(spans), error)
+
+
+class TracingMiddleware:
+    """Middleware recording every request as a span continuing the trace of its traceparent"""
+
+    def __init__(self, get_response):
+        """Create the middleware, it is not used unless tracing is enabled
+
+        :param get_response: next handler of the middleware chain
+        :type get_response: callable
+        :raises MiddlewareNotUsed: if tracing is disabled
+        """
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Record a request and return its trace context in the response
+
+        :param request: the request
+        :type request: django.http.HttpRequest
+        :return: the response
+        :rtype: django.http.HttpResponse
+        """
+        with span(request.method, request.META.get('HTTP_TRACEPARENT'), 'server',
+                  **{'http.method': request.method, 'http.target': request.path}) as server_span:
+            response = self.get_response(request)
+            if request.resolver_match:
+                server_span.name = f'{request.method} {request.resolver_match.route}'
+            server_span.attributes['http.status_code'] = response.status_code
+            if response.status_code >= 500:
+                server_span.error = response.reason_phrase
+            response['traceparent'] = server_span.traceparent
+        return response
+
+
+@before_task_publish.connect
+def inject(headers=None, **_):
+    """Pass the trace context to published jobs"""
+    context = traceparent()
+    if headers is not None and context:
+        headers['traceparent'] = context
+
+
+@task_prerun.connect
+def start_job(task_id=None, task=None, args=None, **_):
+    """Record a job as a span continuing the trace of its publisher"""
+    if not enabled():
+        return
+    attributes = {'celery.task_id': task_id}
+    if args:
+        attributes['fast_grow.job_id'] = args[0]
+    stack = ExitStack()
+    _JOBS[task_id] = (stack, stack.enter_context(span(
+        task.name.rsplit('.', 1)[-1], getattr(task.request, 'traceparent', None), 'consumer',
+        **attributes)))
+
+
+@task_postrun.connect
+def finish_job(task_id=None, state=None, **_):
+    """Finish the span of a job"""
+    if task_id not in _JOBS:
+        return
+    stack, job_span = _JOBS.pop(task_id)
+    if state != 'SUCCESS':
+        job_span.error = state or 'UNKNOWN'
+    stack.close()
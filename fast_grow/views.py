@@ -4,11 +4,34 @@ import json
 import re
 import urllib.request
 import urllib.error
+from datetime import timedelta
+from django.db import transaction
 from django.http import JsonResponse, HttpResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from fast_grow_server import settings
-from .models import Complex, Core, FragmentSet, Growing, Ligand, Ensemble, SearchPointData
-from .tasks import preprocess_ensemble, clip_ligand, grow, generate_interactions
+from .admission import admit, metrics
+from .settings import SPECULATIVE_INTERACTIONS
+from .models import Complex, Core, FragmentSet, Growing, Ligand, Ensemble, SearchPointData, \
+    Status
+from .tool_wrappers.fast_grow_wrapper import FastGrowWrapper
+from .tool_wrappers.interactions_wrapper import InteractionWrapper
+from .tasks import preprocess_ensemble, clip_ligand, clip_ligands, generate_interactions, \
+    cancel_speculation, schedule_growing, release_growing
+from . import eta, instrumentation, latency, scheduler, tracing
+
+
+def too_many_requests(retry_after):
+    """Reject a request because too many jobs are queued
+
+    :param retry_after: seconds after which the request may be retried
+    :type retry_after: int
+    :return: too many requests response
+    :rtype: JsonResponse
+    """
+    response = JsonResponse({'error': 'too many requests'}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
 
 
 @csrf_exempt
@@ -16,7 +39,8 @@ def complex_create(request):
     """Create a complex using file uploads or a pdb code
 
     If a ligand is uploaded as well, this ligand is associated with the complex. Schedules a celery
-    job to preprocess the complex.
+    job to preprocess the complex. If "speculative" is set, interactions of all complex ligand
+    pairs are generated at low priority once the ensemble is preprocessed.
 
     :param request: ensemble upload
     :return: ensemble model
@@ -26,8 +50,15 @@ def complex_create(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'bad request'}, status=400)
 
-    ensemble = Ensemble()
-    ensemble.save()
+    retry_after = admit('preprocess_ensemble')
+    if retry_after:
+        return too_many_requests(retry_after)
+
+    speculative = SPECULATIVE_INTERACTIONS
+    if 'speculative' in request.POST:
+        speculative = request.POST['speculative'].lower() in ('1', 'true', 'yes')
+    # the upload is validated before anything is saved, so rejected uploads leave no jobs behind
+    complexes = []
     if 'ensemble[]' in request.FILES:
         for complex_file in request.FILES.pop('ensemble[]'):
             complex_filename, complex_extension = os.path.splitext(complex_file.name)
@@ -36,13 +67,11 @@ def complex_create(request):
 
             complex_name = os.path.basename(complex_filename)[:255]  # name has max size of 255
             complex_string = complex_file.read().decode('utf8')
-            cmplx = Complex(
+            complexes.append(Complex(
                 name=complex_name,
                 file_type=complex_extension[1:],  # remove period at the beginning of the extension
-                file_string=complex_string,
-                ensemble=ensemble
-            )
-            cmplx.save()
+                file_string=complex_string
+            ))
     elif 'pdb' in request.POST:
         pdb_code = request.POST['pdb'].lower()
         if not re.match(r'[a-z0-9]{4}', pdb_code):
@@ -57,17 +86,11 @@ def complex_create(request):
                 return JsonResponse({'error': 'invalid PDB code'}, status=404)
             return JsonResponse({'error': 'bad request'}, status=400)
 
-        cmplx = Complex(
-            name=pdb_code,
-            file_type='pdb',
-            file_string=complex_string,
-            ensemble=ensemble
-        )
-        cmplx.save()
-        ensemble.complex_set.add(cmplx)
+        complexes.append(Complex(name=pdb_code, file_type='pdb', file_string=complex_string))
     else:
         return JsonResponse({'error': 'no complex specified'}, status=400)
 
+    ligand = None
     if 'ligand' in request.FILES:
         ligand_filename, ligand_extension = os.path.splitext(request.FILES['ligand'].name)
         if ligand_extension != '.sdf':
@@ -78,10 +101,18 @@ def complex_create(request):
         ligand = Ligand(
             name=ligand_name,
             file_type=ligand_extension[1:],  # remove period
-            file_string=ligand_string,
-            ensemble=ensemble
+            file_string=ligand_string
         )
-        ligand.save()
+
+    with transaction.atomic():
+        ensemble = Ensemble(speculative=speculative)
+        ensemble.save()
+        for cmplx in complexes:
+            cmplx.ensemble = ensemble
+            cmplx.save()
+        if ligand:
+            ligand.ensemble = ensemble
+            ligand.save()
     preprocess_ensemble.delay(ensemble.id)
     return JsonResponse(ensemble.dict(), status=201, safe=False)
 
@@ -103,10 +134,33 @@ def complex_detail(request, ensemble_id):
     return JsonResponse(ensemble.dict(detail=True), status=200, safe=False)
 
 
+@csrf_exempt
+def complex_abandon(request, ensemble_id):
+    """Abandon an ensemble cancelling its speculative interaction generations
+
+    :param request: ensemble abandon request
+    :param ensemble_id: id of an ensemble
+    :type ensemble_id: int
+    :return: number of cancelled generations or not found
+    :rtype: JsonResponse
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'bad request'}, status=400)
+    try:
+        ensemble = Ensemble.objects.get(id=ensemble_id)
+    except Ensemble.DoesNotExist:
+        return JsonResponse({'error': 'model not found'}, status=404)
+    return JsonResponse({'cancelled': cancel_speculation(ensemble)}, status=200)
+
+
 @csrf_exempt
 def core_create(request):
     """Create a core using a ligand
 
+    If a core of the ligand was already clipped or is being clipped with the same anchor and linker,
+    that core is returned instead of scheduling another clipping. A core clipped from an identical
+    ligand is copied into a new core of the ligand.
+
     :param request: ligand clipping request
     :return: core model
     :rtype: JsonResponse
@@ -136,17 +190,101 @@ def core_create(request):
     except ValueError:
         return JsonResponse({'error': 'invalid anchor or linker specified'}, status=400)
 
-    core = Core(
-        ligand=ligand,
-        name=ligand.name + '_' + str(anchor) + '_' + str(linker),
-        anchor=anchor,
-        linker=linker
-    )
-    core.save()
+    with transaction.atomic():
+        # serialize core creation per ligand so concurrent identical requests share one core
+        ligand = Ligand.objects.select_for_update().get(id=ligand.id)
+        core = Core.find_reusable(ligand, anchor, linker)
+        if core and core.id:
+            return JsonResponse(core.dict(), status=200, safe=False)
+        if core:
+            # copy of a core clipped from an identical ligand, nothing to clip
+            core.save()
+            return JsonResponse(core.dict(), status=201, safe=False)
+
+        retry_after = admit('clip_ligand')
+        if retry_after:
+            return too_many_requests(retry_after)
+        core = Core(
+            ligand=ligand,
+            name=ligand.name + '_' + str(anchor) + '_' + str(linker),
+            anchor=anchor,
+            linker=linker
+        )
+        core.save()
     clip_ligand.delay(core.id)
     return JsonResponse(core.dict(), status=201, safe=False)
 
 
+@csrf_exempt
+def core_batch_create(request):
+    """Create several cores of a ligand using a list of anchor and linker pairs
+
+    Existing cores of the ligand are reused, cores clipped from an identical ligand are copied and
+    all other cores are clipped by a single job.
+
+    :param request: batch ligand clipping request
+    :return: list of core models in the order of the requested positions, created unless all cores
+        already existed
+    :rtype: JsonResponse
+    """
+    # this could be a decorator but I prefer the control
+    if request.method != 'POST' or request.content_type != 'application/json':
+        return JsonResponse({'error': 'bad request'}, status=400)
+    try:
+        request_json = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'bad request'}, status=400)
+
+    if 'ligand_id' not in request_json:
+        return JsonResponse({'error': 'no ligand specified'}, status=400)
+
+    try:
+        ligand = Ligand.objects.get(id=request_json['ligand_id'])
+    except Ligand.DoesNotExist:
+        return JsonResponse({'error': 'ligand does not exist'}, status=400)
+
+    if not request_json.get('positions') or not isinstance(request_json['positions'], list):
+        return JsonResponse({'error': 'no positions specified'}, status=400)
+
+    positions = []
+    try:
+        for anchor, linker in request_json['positions']:
+            position = (int(anchor), int(linker))
+            if position not in positions:
+                positions.append(position)
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'invalid anchor or linker specified'}, status=400)
+
+    cores = []
+    new_cores = []
+    copies = []
+    with transaction.atomic():
+        # serialize core creation per ligand so concurrent identical requests share cores
+        ligand = Ligand.objects.select_for_update().get(id=ligand.id)
+        for anchor, linker in positions:
+            core = Core.find_reusable(ligand, anchor, linker)
+            if not core:
+                core = Core(
+                    ligand=ligand,
+                    name=ligand.name + '_' + str(anchor) + '_' + str(linker),
+                    anchor=anchor,
+                    linker=linker
+                )
+                new_cores.append(core)
+            elif core.id is None:
+                copies.append(core)
+            cores.append(core)
+        retry_after = admit('clip_ligand', len(new_cores)) if new_cores else None
+        if retry_after:
+            return too_many_requests(retry_after)
+        Core.objects.bulk_create(new_cores + copies)
+    if new_cores:
+        clip_ligands.delay([core.id for core in new_cores])
+    # like a single core, reusing existing cores only is not a creation
+    status = 201 if new_cores or copies else 200
+    return JsonResponse([core.dict() for core in cores], status=status, safe=False)
+
+
 @csrf_exempt
 def core_detail(request, core_id):
     """Get detailed information of a core
@@ -168,6 +306,10 @@ def core_detail(request, core_id):
 def interactions_create(request):
     """Generate interactions for specified ligand and complex
 
+    If interactions of the complex and ligand were already generated or are being generated, that
+    search point data is returned instead of scheduling another generation. Interactions generated
+    from another complex and ligand of identical contents are copied.
+
     :param request: interactions generation request
     :return: search point data model
     :rtype: JsonResponse
@@ -196,8 +338,27 @@ def interactions_create(request):
     except Complex.DoesNotExist:
         return JsonResponse({'error': 'complex does not exist'}, status=400)
 
-    search_point_data = SearchPointData(ligand=ligand, complex=cmplx)
-    search_point_data.save()
+    cache_key = InteractionWrapper.cache_key(cmplx, ligand)
+    with transaction.atomic():
+        # serialize generation requests per ligand so concurrent identical requests share data
+        ligand = Ligand.objects.select_for_update().get(id=ligand.id)
+        search_point_data = SearchPointData.find_reusable(cache_key, cmplx, ligand)
+        if search_point_data and search_point_data.id:
+            if search_point_data.speculative:
+                # requested data must survive the ensemble being abandoned
+                search_point_data.speculative = False
+                search_point_data.save(update_fields=['speculative'])
+            return JsonResponse(search_point_data.dict(), status=200, safe=False)
+        if search_point_data:
+            # copy of identical search point data of another complex and ligand
+            search_point_data.save()
+            return JsonResponse(search_point_data.dict(), status=201, safe=False)
+
+        retry_after = admit('generate_interactions')
+        if retry_after:
+            return too_many_requests(retry_after)
+        search_point_data = SearchPointData(ligand=ligand, complex=cmplx, cache_key=cache_key)
+        search_point_data.save()
     generate_interactions.delay(search_point_data.id)
     return JsonResponse(search_point_data.dict(), status=201, safe=False)
 
@@ -223,6 +384,12 @@ def interactions_detail(request, search_point_data_id):
 def growing_create(request):
     """Create a growing
 
+    Growings are queued per client and dispatched to the growing workers taking turns between
+    clients. If a growing with identical inputs succeeded before, its hits are shared instead of
+    growing.
+    Optional "stop_criteria" ("max_hits", "score_threshold" reached by "score_threshold_hits" hits
+    and a "time_budget" in seconds) end the growing early with the hits found so far.
+
     :param request: growing request
     :return: growing model
     :rtype: JsonResponse
@@ -261,14 +428,49 @@ def growing_create(request):
     if 'search_points' in request_json:
         search_points = request_json['search_points']
 
+    stop_criteria = request_json.get('stop_criteria') or {}
+    try:
+        for criterion in ['max_hits', 'score_threshold_hits', 'time_budget']:
+            if stop_criteria.get(criterion) is not None:
+                stop_criteria[criterion] = int(stop_criteria[criterion])
+                if stop_criteria[criterion] < 1:
+                    raise ValueError(f'{criterion} must be positive')
+        if stop_criteria.get('score_threshold') is not None:
+            stop_criteria['score_threshold'] = float(stop_criteria['score_threshold'])
+        elif stop_criteria.get('score_threshold_hits') is not None:
+            raise ValueError('score_threshold_hits requires a score_threshold')
+    except (AttributeError, TypeError, ValueError):
+        return JsonResponse({'error': 'invalid stop criteria'}, status=400)
+
     growing = Growing(
         ensemble=ensemble,
         core=core,
         fragment_set=fragment_set,
-        search_points=json.dumps(search_points) if search_points else None
+        search_points=json.dumps(search_points) if search_points else None,
+        max_hits=stop_criteria.get('max_hits'),
+        score_threshold=stop_criteria.get('score_threshold'),
+        score_threshold_hits=stop_criteria.get('score_threshold_hits'),
+        time_budget=stop_criteria.get('time_budget')
     )
+    growing.fingerprint = FastGrowWrapper.fingerprint(growing)
+    growing.cache_accessed = timezone.now()
+    growing.traceparent = tracing.traceparent()
+    # growings of cores still being clipped are fingerprinted once they start
+    cached_growing = Growing.find_cached(growing.fingerprint) if growing.fingerprint else None
+    if cached_growing:
+        # the growing shares the hits of the cached growing
+        growing.cached_from = cached_growing
+        growing.status = Status.SUCCESS
+        growing.save()
+        Growing.objects.filter(id=cached_growing.id).update(
+            cache_accessed=growing.cache_accessed)
+        return JsonResponse(growing.dict(), status=201, safe=False)
+
+    retry_after = admit('grow')
+    if retry_after:
+        return too_many_requests(retry_after)
     growing.save()
-    grow.delay(growing.id)
+    schedule_growing(growing.id, scheduler.client_key(request))
     return JsonResponse(growing.dict(), status=201, safe=False)
 
 
@@ -276,6 +478,10 @@ def growing_create(request):
 def growing_detail(request, growing_id):
     """Get detailed information of a growing
 
+    Pending growings include their position in the fair-share queue, if they are still queued.
+    Pending and running growings include their estimated progress and remaining run time.
+    Traced requests link to the trace of the request that created the growing.
+
     :param request: growing request
     :param growing_id: id of a growing
     :type growing_id: int
@@ -290,7 +496,42 @@ def growing_detail(request, growing_id):
         return JsonResponse({'error': 'invalid value for nof_hits'}, status=400)
     except Growing.DoesNotExist:
         return JsonResponse({'error': 'model not found'}, status=404)
-    return JsonResponse(growing.dict(detail=detail, nof_hits=nof_hits), status=200, safe=False)
+    request_span = tracing.current()
+    if request_span:
+        request_span.link(growing.traceparent)
+    growing_dict = growing.dict(detail=detail, nof_hits=nof_hits)
+    if growing.status == Status.PENDING:
+        growing_dict['queue_position'] = scheduler.queue_position(growing.id)
+    if growing.status in [Status.PENDING, Status.RUNNING]:
+        growing_dict['eta'] = eta.estimate(growing)
+    return JsonResponse(growing_dict, status=200, safe=False)
+
+
+@csrf_exempt
+def growing_cancel(request, growing_id):
+    """Cancel a pending or running growing
+
+    Hits found until the running growing notices the cancellation are kept.
+
+    :param request: growing cancel request
+    :param growing_id: id of a growing
+    :type growing_id: int
+    :return: growing model, not found or bad request if the growing already finished
+    :rtype: JsonResponse
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'bad request'}, status=400)
+    try:
+        growing = Growing.objects.get(id=growing_id)
+    except Growing.DoesNotExist:
+        return JsonResponse({'error': 'model not found'}, status=404)
+    if not Growing.objects.filter(
+            id=growing_id, status__in=[Status.PENDING, Status.RUNNING]
+    ).update(status=Status.CANCELLED, finished=timezone.now()):
+        return JsonResponse({'error': 'growing already finished'}, status=400)
+    release_growing(growing.id)
+    growing.status = Status.CANCELLED
+    return JsonResponse(growing.dict(), status=200, safe=False)
 
 
 @csrf_exempt
@@ -326,3 +567,43 @@ def fragment_set_index(request):
         status=200,
         safe=False
     )
+
+
+def admission_metrics(request):
+    """Get admission limits and the current number of queued and running jobs per task
+
+    :param request: admission metrics request
+    :return: admission metrics per task
+    :rtype: JsonResponse
+    """
+    return JsonResponse(metrics(), status=200)
+
+
+def prometheus_metrics(request):
+    """Get the stage timings and job counters of all processes in the prometheus text format
+
+    :param request: metrics request
+    :return: metrics exposition
+    :rtype: HttpResponse
+    """
+    return HttpResponse(instrumentation.render(), status=200,
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def job_latency(request):
+    """Get queue and run latency percentiles per task, fragment set and ensemble size
+
+    Only available to staff users.
+
+    :param request: latency request, optionally limited to jobs created within the last days
+    :return: latency percentiles, bad request or forbidden
+    :rtype: JsonResponse
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    try:
+        days = float(request.GET['days']) if 'days' in request.GET else None
+    except ValueError:
+        return JsonResponse({'error': 'invalid value for days'}, status=400)
+    since = timezone.now() - timedelta(days=days) if days else None
+    return JsonResponse(latency.report(since), status=200, safe=False)
@@ -41,6 +41,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # only active with fast_grow TRACING_EXPORTER
+    'fast_grow.tracing.TracingMiddleware',
+    # before the other middleware to include their queries, only active with QUERY_PROFILING
+    'fast_grow.query_profiling.QueryProfilingMiddleware',
+    # only active with fast_grow PROFILE_TOKEN
+    'fast_grow.profiler.SamplingProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -126,5 +132,32 @@ STATIC_URL = '/static/'
 
 CELERY_BROKER_URL = 'redis://localhost:6379'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379'
+# honor message priorities, e.g. to run speculative jobs after everything users are waiting on,
+# queue_order_strategy does not order messages but the queues of a worker
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    # one redis list per priority, 0 is consumed first and 9 last
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    # workers consuming several queues drain them in the order passed to -Q
+    'queue_order_strategy': 'priority',
+}
+# short jobs users are waiting on run in the interactive queue, long growings in the bulk queue so
+# they can never occupy the workers of short jobs
+CELERY_TASK_DEFAULT_QUEUE = 'interactive'
+CELERY_TASK_ROUTES = {
+    'fast_grow.tasks.grow': {'queue': 'bulk'},
+    'fast_grow.tasks.grow_shard': {'queue': 'bulk'},
+    # batches yield to single clippings
+    'fast_grow.tasks.clip_ligands': {'queue': 'interactive', 'priority': 3},
+}
+# messages without a priority are consumed before all prioritized ones
+CELERY_TASK_DEFAULT_PRIORITY = 0
+# reserve one message per process so queued jobs are not stuck behind a long running job
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# worker processes per queue used by "manage.py worker <queue>"
+CELERY_WORKER_QUEUE_CONCURRENCY = {
+    'interactive': 4,
+    'bulk': 2,
+}
 
 PDB_FILE_URL = 'https://files.rcsb.org/download/{}.pdb'